@@ -0,0 +1,352 @@
+#!/usr/bin/env python3
+"""
+Analytics Benchmark for AI Diligence Pro
+Reference implementation of the price-history analytics (realized volatility,
+max drawdown, beta, moving averages, RSI) checked against a port of the
+functions' one-pass kernel and timed across many symbols
+
+reference_analytics is written with NumPy array operations straight from the
+definitions; fused_analytics is a line-by-line port of computeAnalytics in
+functions/src/utils/analytics.ts (Welford moments, running peaks, Wilder RSI,
+backward date alignment for beta). Both run over the same series and must
+agree. With --functions-url the deployed kernel is checked too: the emulator's
+mcpExecuteResource('analytics') results for a few symbols are compared with
+the reference computed from the same fake upstream payloads.
+
+Series come from the fake upstream's generator (the benchmark symbol is SPY);
+a pool of --distinct series is reused across symbols, and each symbol drops a
+few dates at random so beta has to align calendars.
+"""
+
+import argparse
+import json
+import math
+import random
+import sys
+import time
+from datetime import datetime
+from typing import Dict, Any, List, Optional, Tuple
+
+import numpy as np
+
+from fake_upstream import FakeUpstream
+from history_benchmark import PRICE_HISTORY_MAX_BARS, parse_columns
+from latency_histogram import LatencyHistogram
+
+TRADING_DAYS = 252
+MOVING_AVERAGES = (20, 50, 200)
+RSI_PERIOD = 14
+RECENT_RETURNS = 10
+BENCHMARK = 'SPY'
+# Fields compared between implementations, with the absolute tolerance for each
+COMPARED = {
+    'volatility': 1e-6, 'volatilityFull': 1e-6, 'maxDrawdown': 1e-9, 'maxDrawdown1y': 1e-9,
+    'currentDrawdown': 1e-9, 'beta': 1e-9, 'correlation': 1e-9, 'sma20': 1e-9, 'sma50': 1e-9, 'sma200': 1e-9,
+    'rsi14': 1e-6,
+}
+
+Series = Tuple[List[str], np.ndarray]  # dates oldest first, closes
+
+
+def reference_analytics(dates: List[str], close: np.ndarray, bench: Optional[Series] = None) -> Dict[str, Any]:
+    """The indicators from their definitions, as whole-array operations"""
+    n = len(close)
+    returns = np.diff(np.log(close))
+    year = returns[-TRADING_DAYS:]
+
+    peaks = np.maximum.accumulate(close)
+    drawdowns = 1 - close / peaks
+    trough = int(np.argmax(drawdowns))
+    year_close = close[-(TRADING_DAYS + 1):]
+    year_drawdowns = 1 - year_close / np.maximum.accumulate(year_close)
+
+    # Wilder's RSI: seed with the mean of the first RSI_PERIOD changes, then an
+    # exponential average with alpha = 1 / RSI_PERIOD, written as one weighted sum
+    rsi = None
+    changes = np.diff(close)
+    if len(changes) >= RSI_PERIOD:
+        alpha = 1 / RSI_PERIOD
+        rest = len(changes) - RSI_PERIOD
+        weights = alpha * (1 - alpha) ** np.arange(rest - 1, -1, -1)
+        gains, losses = np.clip(changes, 0, None), np.clip(-changes, 0, None)
+        avg_gain = gains[:RSI_PERIOD].mean() * (1 - alpha) ** rest + weights @ gains[RSI_PERIOD:]
+        avg_loss = losses[:RSI_PERIOD].mean() * (1 - alpha) ** rest + weights @ losses[RSI_PERIOD:]
+        rsi = 100.0 if avg_loss == 0 else 100 - 100 / (1 + avg_gain / avg_loss)
+
+    beta = correlation = None
+    if bench is not None:
+        bench_dates, bench_close = bench
+        common, ia, ib = np.intersect1d(dates, bench_dates, assume_unique=True, return_indices=True)
+        ia, ib = ia[-(TRADING_DAYS + 1):], ib[-(TRADING_DAYS + 1):]
+        ra, rb = np.diff(np.log(close[ia])), np.diff(np.log(bench_close[ib]))
+        if len(ra) >= 2 and rb.var() > 0:
+            cov = np.cov(ra, rb)
+            beta = cov[0, 1] / cov[1, 1]
+            correlation = cov[0, 1] / math.sqrt(cov[0, 0] * cov[1, 1]) if cov[0, 0] > 0 else None
+
+    return {
+        'asOf': dates[-1],
+        'bars': n,
+        'volatility': float(year.std(ddof=1) * math.sqrt(TRADING_DAYS) * 100) if len(year) > 1 else None,
+        'volatilityFull': float(returns.std(ddof=1) * math.sqrt(TRADING_DAYS) * 100) if len(returns) > 1 else None,
+        'maxDrawdown': float(drawdowns.max() * 100),
+        'maxDrawdown1y': float(year_drawdowns.max() * 100),
+        'drawdownPeak': dates[int(np.argmax(close[:trough + 1]))] if drawdowns[trough] > 0 else None,
+        'drawdownTrough': dates[trough] if drawdowns[trough] > 0 else None,
+        'currentDrawdown': float(drawdowns[-1] * 100),
+        'beta': None if beta is None else float(beta),
+        'correlation': None if correlation is None else float(correlation),
+        **{f'sma{w}': float(close[-w:].mean()) if n >= w else None for w in MOVING_AVERAGES},
+        'rsi14': None if rsi is None else float(rsi),
+        'recentReturns': (close[-RECENT_RETURNS:] / close[-RECENT_RETURNS - 1:-1] - 1).tolist(),
+    }
+
+
+def fused_analytics(dates: List[str], close: List[float], bench: Optional[Series] = None) -> Dict[str, Any]:
+    """Port of computeAnalytics: one pass over the closes, nothing kept per bar"""
+    n = len(close)
+    year_start = max(0, n - 1 - TRADING_DAYS)
+    moments = {'full': [0, 0.0, 0.0], 'year': [0, 0.0, 0.0]}  # count, mean, m2
+
+    def add(name: str, value: float):
+        m = moments[name]
+        m[0] += 1
+        delta = value - m[1]
+        m[1] += delta / m[0]
+        m[2] += delta * (value - m[1])
+
+    peak, peak_index, year_peak = -math.inf, 0, -math.inf
+    max_drawdown = max_drawdown_1y = 0.0
+    drawdown_peak = drawdown_trough = -1
+    sums = [0.0] * len(MOVING_AVERAGES)
+    avg_gain = avg_loss = 0.0
+    for i in range(n):
+        price = close[i]
+        if price > peak:
+            peak, peak_index = price, i
+        drawdown = 1 - price / peak
+        if drawdown > max_drawdown:
+            max_drawdown, drawdown_peak, drawdown_trough = drawdown, peak_index, i
+        if i >= year_start:
+            year_peak = max(year_peak, price)
+            max_drawdown_1y = max(max_drawdown_1y, 1 - price / year_peak)
+        for w, window in enumerate(MOVING_AVERAGES):
+            if i >= n - window:
+                sums[w] += price
+        if i == 0:
+            continue
+        r = math.log(price / close[i - 1])
+        add('full', r)
+        if i > year_start:
+            add('year', r)
+        change = price - close[i - 1]
+        gain, loss = max(change, 0.0), max(-change, 0.0)
+        if i <= RSI_PERIOD:
+            avg_gain += gain / RSI_PERIOD
+            avg_loss += loss / RSI_PERIOD
+        else:
+            avg_gain = (avg_gain * (RSI_PERIOD - 1) + gain) / RSI_PERIOD
+            avg_loss = (avg_loss * (RSI_PERIOD - 1) + loss) / RSI_PERIOD
+
+    def annualized(name: str) -> Optional[float]:
+        count, _, m2 = moments[name]
+        return math.sqrt(m2 / (count - 1) * TRADING_DAYS) * 100 if count > 1 else None
+
+    beta = correlation = None
+    if bench is not None:
+        beta, correlation = fused_beta(dates, close, *bench)
+    return {
+        'asOf': dates[-1],
+        'bars': n,
+        'volatility': annualized('year'),
+        'volatilityFull': annualized('full'),
+        'maxDrawdown': max_drawdown * 100,
+        'maxDrawdown1y': max_drawdown_1y * 100,
+        'drawdownPeak': dates[drawdown_peak] if drawdown_peak >= 0 else None,
+        'drawdownTrough': dates[drawdown_trough] if drawdown_trough >= 0 else None,
+        'currentDrawdown': (1 - close[-1] / peak) * 100,
+        'beta': beta,
+        'correlation': correlation,
+        **{f'sma{w}': sums[i] / w if n >= w else None for i, w in enumerate(MOVING_AVERAGES)},
+        'rsi14': (100.0 if avg_loss == 0 else 100 - 100 / (1 + avg_gain / avg_loss)) if n > RSI_PERIOD else None,
+        'recentReturns': [close[i] / close[i - 1] - 1 for i in range(max(1, n - RECENT_RETURNS), n)],
+    }
+
+
+def fused_beta(dates: List[str], close, bench_dates: List[str], bench_close) -> Tuple[Optional[float], Optional[float]]:
+    """Port of betaAgainst: walk both calendars backwards over common dates"""
+    i, j = len(dates) - 1, len(bench_dates) - 1
+    prev_a = prev_b = None
+    pairs = 0
+    mean_a = mean_b = cov = var_a = var_b = 0.0
+    while i >= 0 and j >= 0 and pairs < TRADING_DAYS:
+        if dates[i] > bench_dates[j]:
+            i -= 1
+            continue
+        if bench_dates[j] > dates[i]:
+            j -= 1
+            continue
+        a, b = close[i], bench_close[j]
+        i, j = i - 1, j - 1
+        if prev_a is not None:
+            ra, rb = math.log(prev_a / a), math.log(prev_b / b)
+            pairs += 1
+            da, db = ra - mean_a, rb - mean_b
+            mean_a += da / pairs
+            mean_b += db / pairs
+            cov += da * (rb - mean_b)
+            var_a += da * (ra - mean_a)
+            var_b += db * (rb - mean_b)
+        prev_a, prev_b = a, b
+    if pairs < 2 or var_b == 0:
+        return None, None
+    return cov / var_b, (cov / math.sqrt(var_a * var_b) if var_a else None)
+
+
+def compare(expected: Dict[str, Any], actual: Dict[str, Any]) -> List[str]:
+    """Fields that differ beyond their tolerance (relative for large values)"""
+    problems = []
+    for field, tolerance in COMPARED.items():
+        a, b = expected.get(field), actual.get(field)
+        if a is None or b is None:
+            if a is not b:
+                problems.append(f"{field}: {a} vs {b}")
+        elif abs(a - b) > tolerance * max(1.0, abs(a)):
+            problems.append(f"{field}: {a:.10g} vs {b:.10g}")
+    for field in ('asOf', 'bars', 'drawdownPeak', 'drawdownTrough'):
+        if expected.get(field) != actual.get(field):
+            problems.append(f"{field}: {expected.get(field)} vs {actual.get(field)}")
+    if not np.allclose(expected['recentReturns'], actual['recentReturns'], rtol=0, atol=1e-12):
+        problems.append("recentReturns")
+    return problems
+
+
+def payload_series(upstream: FakeUpstream, symbol: str) -> Series:
+    """A full TIME_SERIES_DAILY payload parsed the way the functions parse it"""
+    history = parse_columns(upstream._time_series_daily(symbol, 'full')['Time Series (Daily)'])
+    return history.dates, np.frombuffer(history.close, dtype=np.float64)
+
+
+def retained(series: Series) -> Series:
+    """The bars the functions' price history keeps of a series (PRICE_HISTORY_MAX_BARS)"""
+    dates, close = series
+    return dates[-PRICE_HISTORY_MAX_BARS:], close[-PRICE_HISTORY_MAX_BARS:]
+
+
+class AnalyticsBenchmark:
+    def __init__(self, symbols: int = 1000, history_days: int = 5000, distinct: int = 50, seed: int = 0):
+        self.symbols = symbols
+        self.history_days = history_days
+        self.upstream = FakeUpstream(full_history_days=history_days, seed=seed)
+        self.rng = random.Random(seed)
+        self.pool = [payload_series(self.upstream, f"A{i:04d}") for i in range(min(distinct, symbols))]
+        self.bench = payload_series(self.upstream, BENCHMARK)
+        self.upstream._history_cache.clear()
+
+    def series(self, index: int) -> Series:
+        """Pool series `index`, minus a few random dates so calendars differ from the benchmark's"""
+        dates, close = self.pool[index % len(self.pool)]
+        keep = np.ones(len(dates), dtype=bool)
+        keep[self.rng.sample(range(len(dates) - 1), k=len(dates) // 200)] = False
+        return [d for d, k in zip(dates, keep) if k], close[keep]
+
+    def run(self) -> Dict[str, Any]:
+        print(f"📐 Analytics over {self.symbols} symbols x {self.history_days} daily bars (benchmark {BENCHMARK})")
+        timings = {'reference': LatencyHistogram(), 'fused': LatencyHistogram()}
+        mismatches: Dict[str, List[str]] = {}
+        start = time.perf_counter()
+        for index in range(self.symbols):
+            dates, close = self.series(index)
+            closes = close.tolist()
+
+            t0 = time.perf_counter()
+            expected = reference_analytics(dates, close, self.bench)
+            t1 = time.perf_counter()
+            actual = fused_analytics(dates, closes, (self.bench[0], self.bench[1].tolist()))
+            t2 = time.perf_counter()
+            timings['reference'].record(t1 - t0)
+            timings['fused'].record(t2 - t1)
+
+            problems = compare(expected, actual)
+            if problems:
+                mismatches[f"symbol {index}"] = problems
+        elapsed = time.perf_counter() - start
+
+        print(f"{'Implementation':16} {'p50 ms':>9} {'p99 ms':>9} {'total s':>9}")
+        for name, histogram in timings.items():
+            stats = histogram.to_dict()
+            print(f"{name:16} {stats['p50_ms']:9.2f} {stats['p99_ms']:9.2f} {stats['mean_ms'] * stats['count'] / 1000:9.2f}")
+        print(f"✔️  {self.symbols - len(mismatches)}/{self.symbols} symbols agree within tolerance")
+        for symbol, problems in list(mismatches.items())[:5]:
+            print(f"    {symbol}: {', '.join(problems)}")
+        return {
+            'timestamp': datetime.now().isoformat(),
+            'symbols': self.symbols,
+            'history_days': self.history_days,
+            'elapsed': elapsed,
+            'timings': {name: histogram.to_dict() for name, histogram in timings.items()},
+            'mismatches': mismatches,
+        }
+
+    def verify_functions(self, functions_url: str, auth_url: str, upstream_url: str, count: int) -> Dict[str, Any]:
+        """Compare the emulator's analytics resource with the reference for `count` symbols
+
+        The emulator must call a fake upstream started with the same
+        --history-days, so both sides see identical payloads.
+        """
+        from performance_test import AIDiligencePerformanceTester
+
+        tester = AIDiligencePerformanceTester(functions_url, auth_url, upstream_url)
+        tester.upstream_config(full_history_days=self.history_days, latency_ms=0, jitter_ms=0, error_rate=0)
+        bench = payload_series(self.upstream, BENCHMARK)
+        results = {'checked': 0, 'mismatches': {}, 'cold': LatencyHistogram(), 'warm': LatencyHistogram()}
+        for _ in range(count):
+            symbol = tester.fresh_symbol()
+            for phase in ('cold', 'warm'):
+                t0 = time.perf_counter()
+                served = tester.call('mcpExecuteResource', {'symbol': symbol, 'resource': 'analytics'})['analytics']
+                results[phase].record(time.perf_counter() - t0)
+            problems = compare(reference_analytics(*retained(payload_series(self.upstream, symbol)),
+                                                   retained(bench)), served)
+            results['checked'] += 1
+            if problems:
+                results['mismatches'][symbol] = problems
+        print(f"🛰️  Functions analytics: {results['checked'] - len(results['mismatches'])}/{results['checked']} "
+              f"match the reference; cold p50 {results['cold'].percentile(50):.0f} ms, "
+              f"warm p50 {results['warm'].percentile(50):.0f} ms")
+        for symbol, problems in results['mismatches'].items():
+            print(f"    {symbol}: {', '.join(problems)}")
+        results['cold'], results['warm'] = results['cold'].to_dict(), results['warm'].to_dict()
+        return results
+
+
+def main():
+    """Run the analytics correctness and speed benchmark"""
+    parser = argparse.ArgumentParser(description="AI Diligence Pro price-history analytics benchmark")
+    parser.add_argument("--symbols", type=int, default=1000, help="Symbols to analyze")
+    parser.add_argument("--history-days", type=int, default=5000, help="Bars per symbol")
+    parser.add_argument("--distinct", type=int, default=50, help="Distinct generated series reused across symbols")
+    parser.add_argument("--functions-url", help="Also check the functions emulator's analytics resource")
+    parser.add_argument("--auth-url", default="http://127.0.0.1:9099", help="Auth emulator base URL")
+    parser.add_argument("--upstream-url", default="http://127.0.0.1:8765",
+                        help="Fake upstream the emulator calls (with --functions-url)")
+    parser.add_argument("--verify", type=int, default=5, help="Symbols to check against the functions")
+    parser.add_argument("--json", help="Write the results to this JSON file")
+    args = parser.parse_args()
+
+    benchmark = AnalyticsBenchmark(args.symbols, args.history_days, args.distinct)
+    results = benchmark.run()
+    if args.functions_url:
+        results['functions'] = benchmark.verify_functions(args.functions_url, args.auth_url, args.upstream_url,
+                                                          args.verify)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    success = not results['mismatches'] and not results.get('functions', {}).get('mismatches')
+    print("✅ Analytics agree with the reference" if success else "❌ Analytics disagree with the reference")
+    sys.exit(0 if success else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -4,16 +4,40 @@ Comprehensive Backend Testing for AI Diligence Pro
 Tests Firebase Functions and API integrations
 """
 
+import argparse
+import asyncio
 import requests
 import json
 import sys
+import threading
 import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from typing import Dict, Any, Optional, Tuple
+from typing import Dict, Any, List, Optional, Tuple
+
+from fake_upstream import FakeUpstream
+from latency_histogram import LatencyHistogram, LatencyRecorder, attach_latency_recorder, aiohttp_trace_config
+from parallel_runner import Once, ParallelTestRunner
+
+LOAD_TEST_TICKERS = [
+    ("Apple Inc.", "AAPL"),
+    ("Microsoft Corporation", "MSFT"),
+    ("Alphabet Inc.", "GOOGL"),
+    ("Amazon.com Inc.", "AMZN"),
+    ("NVIDIA Corporation", "NVDA"),
+]
+
+# Per-user budget enforced by the functions: RATE_LIMIT_MAX in functions/src/utils/rateLimiter.ts,
+# a token bucket of 30 calls per 15 minutes split over 3 Firestore shards
+RATE_LIMIT_MAX = 30
 
 class AIDigilenceBackendTester:
-    def __init__(self, base_url: str = "http://localhost:3000"):
+    def __init__(self, base_url: str = "http://localhost:3000", functions_urls: Optional[List[str]] = None,
+                 auth_url: str = "http://127.0.0.1:9099", workers: int = 8):
         self.base_url = base_url
+        self.functions_urls = [url.rstrip('/') for url in functions_urls or []]
+        self.auth_url = auth_url.rstrip('/')
         self.session = requests.Session()
         self.session.headers.update({
             'Content-Type': 'application/json',
@@ -22,34 +46,41 @@ class AIDigilenceBackendTester:
         self.tests_run = 0
         self.tests_passed = 0
         self.test_results = []
+        self.latency = LatencyRecorder()
+        attach_latency_recorder(self.session, self.latency)
+        self.workers = workers
+        self._log_lock = threading.Lock()
+        # The index page is fetched once per run and shared by every test that reads it
+        self.index_page = Once(lambda: self.session.get(f"{self.base_url}/"))
         
     def log_test(self, name: str, success: bool, details: str = "", response_data: Any = None):
         """Log test results"""
-        self.tests_run += 1
-        if success:
-            self.tests_passed += 1
-            
-        result = {
-            'name': name,
-            'success': success,
-            'details': details,
-            'timestamp': datetime.now().isoformat(),
-            'response_data': response_data
-        }
-        self.test_results.append(result)
-        
-        status = "✅ PASS" if success else "❌ FAIL"
-        print(f"{status} - {name}")
-        if details:
-            print(f"    Details: {details}")
-        if not success and response_data:
-            print(f"    Response: {response_data}")
-        print()
+        with self._log_lock:
+            self.tests_run += 1
+            if success:
+                self.tests_passed += 1
+
+            result = {
+                'name': name,
+                'success': success,
+                'details': details,
+                'timestamp': datetime.now().isoformat(),
+                'response_data': response_data
+            }
+            self.test_results.append(result)
+
+            status = "✅ PASS" if success else "❌ FAIL"
+            print(f"{status} - {name}")
+            if details:
+                print(f"    Details: {details}")
+            if not success and response_data:
+                print(f"    Response: {response_data}")
+            print()
 
     def test_health_check(self) -> bool:
         """Test if the application is accessible"""
         try:
-            response = self.session.get(f"{self.base_url}/")
+            response = self.index_page()
             success = response.status_code == 200
             details = f"Status: {response.status_code}"
             if success:
@@ -215,40 +246,86 @@ class AIDigilenceBackendTester:
             self.log_test("Request Validation", False, f"Error: {str(e)}")
             return False
 
-    def test_rate_limiting(self) -> bool:
-        """Test rate limiting behavior"""
+    def _sign_in(self) -> str:
+        """Create an anonymous user in the Auth emulator and return its ID token"""
+        response = self.session.post(
+            f"{self.auth_url}/identitytoolkit.googleapis.com/v1/accounts:signUp?key=fake-api-key",
+            json={'returnSecureToken': True},
+            timeout=10
+        )
+        response.raise_for_status()
+        return response.json()['idToken']
+
+    def _call_status(self, functions_url: str, name: str, token: str) -> int:
+        """HTTP status of one callable invocation (resource-exhausted maps to 429)"""
+        response = requests.post(f"{functions_url}/{name}", json={'data': {}},
+                                 headers={'Authorization': f"Bearer {token}"}, timeout=30)
+        return response.status_code
+
+    def test_rate_limiting(self, burst: int = 45, latency_samples: int = 10) -> bool:
+        """Test the rate limit under a concurrent burst
+
+        With --functions-url, one user fires `burst` concurrent mcpRealTime calls
+        spread round-robin over every given emulator URL. The 1st-gen emulator
+        also runs each concurrent request in its own worker, so the burst spans
+        several instances and at most RATE_LIMIT_MAX calls may succeed. The
+        limiter's added latency is mcpRealTime (rate limited) minus
+        mcpCacheStats (not limited), both otherwise trivial authenticated calls.
+        Without emulator URLs the burst goes to /api/generateDueDiligence and
+        only needs consistent responses.
+        """
+        name = "Rate Limiting"
         try:
-            # Make multiple rapid requests
-            responses = []
-            for i in range(5):
-                response = self.session.post(
-                    f"{self.base_url}/api/generateDueDiligence",
-                    json={"companyName": f"Test Company {i}"},
-                    timeout=5
-                )
-                responses.append(response.status_code)
-                time.sleep(0.1)  # Small delay between requests
-            
-            # Check if any rate limiting occurred
-            has_rate_limit = any(status == 429 for status in responses)
-            has_auth_error = any(status in [401, 403] for status in responses)
-            
-            # Success if we get consistent responses (even if auth errors)
-            success = len(set(responses)) <= 2  # Allow for some variation
-            
-            details = f"Response codes: {responses}"
-            if has_rate_limit:
-                details += " (Rate limiting active)"
-            elif has_auth_error:
-                details += " (Auth required - expected)"
-            else:
-                details += " (No rate limiting detected in test)"
-                
-            self.log_test("Rate Limiting", success, details)
+            if not self.functions_urls:
+                def post(i):
+                    return requests.post(f"{self.base_url}/api/generateDueDiligence",
+                                         json={"companyName": f"Test Company {i}"}, timeout=10).status_code
+
+                with ThreadPoolExecutor(max_workers=10) as pool:
+                    responses = list(pool.map(post, range(10)))
+                counts = Counter(responses)
+                success = len(counts) <= 2  # Allow for some variation
+                details = f"Response codes: {dict(counts)}"
+                if 429 in counts:
+                    details += " (Rate limiting active)"
+                elif counts.keys() & {401, 403}:
+                    details += " (Auth required - expected)"
+                else:
+                    details += " (No rate limiting detected in test)"
+                self.log_test(name, success, details)
+                return success
+
+            # Limiter overhead, measured with its own user so the burst starts from a full bucket
+            token = self._sign_in()
+            url = self.functions_urls[0]
+            limited, unlimited = LatencyHistogram(), LatencyHistogram()
+            for _ in range(latency_samples):
+                for histogram, function in ((limited, 'mcpRealTime'), (unlimited, 'mcpCacheStats')):
+                    start = time.perf_counter()
+                    self._call_status(url, function, token)
+                    histogram.record(time.perf_counter() - start)
+            overhead_ms = limited.percentile(50) - unlimited.percentile(50)
+
+            token = self._sign_in()
+            urls = [self.functions_urls[i % len(self.functions_urls)] for i in range(burst)]
+            start = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=burst) as pool:
+                statuses = Counter(pool.map(lambda u: self._call_status(u, 'mcpRealTime', token), urls))
+            burst_seconds = time.perf_counter() - start
+
+            accepted = statuses.get(200, 0)
+            # One token of slack for refill while the burst is in flight
+            success = 0 < accepted <= RATE_LIMIT_MAX + 1 and accepted + statuses.get(429, 0) == burst
+            details = (f"{burst} concurrent calls over {len(self.functions_urls)} URL(s) in {burst_seconds:.1f}s: "
+                       f"{accepted} accepted, {statuses.get(429, 0)} limited (limit {RATE_LIMIT_MAX}), "
+                       f"statuses {dict(statuses)}; limiter overhead p50 {overhead_ms:.1f} ms "
+                       f"({limited.percentile(50):.1f} vs {unlimited.percentile(50):.1f} ms)")
+            self.log_test(name, success, details, {'statuses': dict(statuses), 'limiter_overhead_ms': overhead_ms,
+                                                   'limited': limited.to_dict(), 'unlimited': unlimited.to_dict()})
             return success
-            
+
         except Exception as e:
-            self.log_test("Rate Limiting", False, f"Error: {str(e)}")
+            self.log_test(name, False, f"Error: {str(e)}")
             return False
 
     def test_firebase_functions_structure(self) -> bool:
@@ -276,6 +353,135 @@ class AIDigilenceBackendTester:
             self.log_test("Firebase Functions Structure", False, f"Error: {str(e)}")
             return False
 
+    def _load_requests(self, endpoints: List[str]):
+        """Yield (endpoint, payload) pairs for the load generator, round-robin"""
+        i = 0
+        while True:
+            endpoint = endpoints[i % len(endpoints)]
+            if endpoint == "/api/generateDueDiligence":
+                company, ticker = LOAD_TEST_TICKERS[(i // len(endpoints)) % len(LOAD_TEST_TICKERS)]
+                payload = {"companyName": company, "ticker": ticker, "allowCached": True}
+            else:
+                payload = {
+                    "model": "gpt-4",
+                    "messages": [{"role": "user", "content": "Hello, this is a load test"}],
+                    "max_tokens": 50
+                }
+            yield endpoint, payload
+            i += 1
+
+    async def _run_load(self, concurrency: int, rps: float, duration: float,
+                        endpoints: List[str], timeout: float) -> Dict[str, Any]:
+        """Drive the endpoints with `concurrency` workers, paced at `rps` (0 = unpaced)"""
+        import aiohttp
+
+        queue: asyncio.Queue = asyncio.Queue(maxsize=concurrency * 2)
+        stats = {endpoint: {'sent': 0, 'statuses': Counter(), 'exceptions': Counter()} for endpoint in endpoints}
+        deadline = time.monotonic() + duration
+
+        async def producer():
+            requests_iter = self._load_requests(endpoints)
+            interval = 1.0 / rps if rps > 0 else 0.0
+            next_at = time.monotonic()
+            while time.monotonic() < deadline:
+                if interval:
+                    delay = next_at - time.monotonic()
+                    if delay > 0:
+                        await asyncio.sleep(delay)
+                    next_at += interval
+                await queue.put(next(requests_iter))
+            for _ in range(concurrency):
+                await queue.put(None)
+
+        async def worker(session):
+            while True:
+                item = await queue.get()
+                if item is None:
+                    return
+                endpoint, payload = item
+                entry = stats[endpoint]
+                entry['sent'] += 1
+                timing = {}
+                try:
+                    async with session.post(f"{self.base_url}{endpoint}", json=payload,
+                                            trace_request_ctx=timing) as response:
+                        await response.read()
+                        entry['statuses'][response.status] += 1
+                    self.latency.record(f"POST {endpoint}", time.perf_counter() - timing['start'],
+                                        ttfb=timing.get('ttfb'), connect=timing.get('connect'))
+                except Exception as e:
+                    entry['exceptions'][type(e).__name__] += 1
+
+        connector = aiohttp.TCPConnector(limit=concurrency)
+        client_timeout = aiohttp.ClientTimeout(total=timeout)
+        headers = {'User-Agent': 'AI-Diligence-Load-Client/1.0'}
+        start = time.monotonic()
+        async with aiohttp.ClientSession(connector=connector, timeout=client_timeout, headers=headers,
+                                         trace_configs=[aiohttp_trace_config()]) as session:
+            await asyncio.gather(producer(), *(worker(session) for _ in range(concurrency)))
+        elapsed = time.monotonic() - start
+
+        return {'elapsed': elapsed, 'endpoints': stats}
+
+    def run_load_test(self, concurrency: int = 20, rps: float = 10.0, duration: float = 30.0,
+                      endpoints: Optional[List[str]] = None, timeout: float = 60.0,
+                      max_error_rate: float = 0.05) -> Dict[str, Any]:
+        """Run a concurrent load test against the Firebase Functions endpoints"""
+        endpoints = endpoints or ["/api/generateDueDiligence", "/api/proxy"]
+        pacing = f"{rps:.1f} req/s target" if rps > 0 else "unpaced"
+        print("🚀 Starting AI Diligence Pro Load Test")
+        print(f"Concurrency: {concurrency}, {pacing}, Duration: {duration:.0f}s")
+        print("=" * 50)
+
+        raw = asyncio.run(self._run_load(concurrency, rps, duration, endpoints, timeout))
+        elapsed = raw['elapsed']
+
+        report = {'concurrency': concurrency, 'target_rps': rps, 'duration': elapsed, 'endpoints': {}}
+        total_sent = total_errors = total_limited = 0
+        for endpoint, entry in raw['endpoints'].items():
+            statuses = entry['statuses']
+            exceptions = sum(entry['exceptions'].values())
+            errors = exceptions + sum(count for status, count in statuses.items() if status >= 500)
+            limited = statuses.get(429, 0)
+            sent = entry['sent']
+            total_sent += sent
+            total_errors += errors
+            total_limited += limited
+            report['endpoints'][endpoint] = {
+                'requests': sent,
+                'throughput': sent / elapsed if elapsed > 0 else 0,
+                'error_rate': errors / sent if sent else 0,
+                'rate_limited_rate': limited / sent if sent else 0,
+                'status_codes': dict(statuses),
+                'exceptions': dict(entry['exceptions'])
+            }
+
+        report['requests'] = total_sent
+        report['throughput'] = total_sent / elapsed if elapsed > 0 else 0
+        report['error_rate'] = total_errors / total_sent if total_sent else 0
+        report['rate_limited_rate'] = total_limited / total_sent if total_sent else 0
+
+        for endpoint, summary in report['endpoints'].items():
+            details = (f"{summary['requests']} requests, {summary['throughput']:.1f} req/s, "
+                       f"errors {summary['error_rate'] * 100:.1f}%, "
+                       f"429s {summary['rate_limited_rate'] * 100:.1f}%, "
+                       f"codes {summary['status_codes']}")
+            if summary['exceptions']:
+                details += f", exceptions {summary['exceptions']}"
+            self.log_test(f"Load {endpoint}", summary['error_rate'] <= max_error_rate, details)
+
+        print("=" * 50)
+        print("📊 Load Test Summary")
+        print(f"Requests: {total_sent} in {elapsed:.2f} seconds")
+        print(f"Achieved Throughput: {report['throughput']:.1f} req/s")
+        print(f"Error Rate: {report['error_rate'] * 100:.1f}%")
+        print(f"Rate Limited (429): {report['rate_limited_rate'] * 100:.1f}%")
+        self.latency.print_summary()
+
+        report['latency'] = self.latency.summary()
+        report['success'] = total_sent > 0 and report['error_rate'] <= max_error_rate
+        return report
+
     def run_all_tests(self) -> Dict[str, Any]:
         """Run all backend tests"""
         print("🚀 Starting AI Diligence Pro Backend Tests")
@@ -283,23 +489,22 @@ class AIDigilenceBackendTester:
         
         start_time = time.time()
         
-        # Run tests in order
-        test_methods = [
+        # Independent tests run concurrently; the rate limit burst goes last so
+        # the limited responses it provokes cannot leak into the other tests
+        runner = ParallelTestRunner(self.workers)
+        independent = [
             self.test_health_check,
             self.test_firebase_functions_structure,
             self.test_api_proxy_endpoint,
             self.test_due_diligence_endpoint,
             self.test_invalid_endpoints,
             self.test_cors_headers,
-            self.test_request_validation,
-            self.test_rate_limiting
+            self.test_request_validation
         ]
-        
-        for test_method in test_methods:
-            try:
-                test_method()
-            except Exception as e:
-                self.log_test(test_method.__name__, False, f"Unexpected error: {str(e)}")
+        for test_method in independent:
+            runner.add(test_method)
+        runner.add(self.test_rate_limiting, after=independent)
+        runner.run(lambda name, e: self.log_test(name, False, f"Unexpected error: {str(e)}"))
         
         end_time = time.time()
         duration = end_time - start_time
@@ -319,6 +524,9 @@ class AIDigilenceBackendTester:
             print("\n❌ Failed Tests:")
             for test in failed_tests:
                 print(f"  - {test['name']}: {test['details']}")
+
+        runner.print_timing()
+        self.latency.print_summary()
         
         return {
             'total_tests': self.tests_run,
@@ -326,22 +534,56 @@ class AIDigilenceBackendTester:
             'failed_tests': self.tests_run - self.tests_passed,
             'success_rate': self.tests_passed / self.tests_run if self.tests_run > 0 else 0,
             'duration': duration,
+            'latency': self.latency.summary(),
             'results': self.test_results
         }
 
 def main():
     """Main test execution"""
-    # Check if custom URL provided
-    base_url = sys.argv[1] if len(sys.argv) > 1 else "http://localhost:3000"
+    parser = argparse.ArgumentParser(description="AI Diligence Pro backend tests")
+    parser.add_argument("base_url", nargs="?", default="http://localhost:3000")
+    parser.add_argument("--load", action="store_true", help="Run the concurrent load test instead of the smoke tests")
+    parser.add_argument("--concurrency", type=int, default=20, help="Number of in-flight requests")
+    parser.add_argument("--rps", type=float, default=10.0, help="Target requests per second (0 = as fast as possible)")
+    parser.add_argument("--duration", type=float, default=30.0, help="Load test duration in seconds")
+    parser.add_argument("--max-error-rate", type=float, default=0.05, help="Highest tolerated 5xx/exception rate")
+    parser.add_argument("--latency-json", help="Write per-endpoint latency percentiles to this JSON file")
+    parser.add_argument("--fake-upstream", type=int, metavar="PORT",
+                        help="Serve fake Alpha Vantage/OpenAI upstreams on PORT for the duration of the run")
+    parser.add_argument("--upstream-latency-ms", type=float, default=0.0, help="Latency injected by the fake upstream")
+    parser.add_argument("--functions-url", action="append", dest="functions_urls", metavar="URL",
+                        help="Functions emulator base URL (project/region) for the rate limit burst; "
+                             "repeat for several emulator instances sharing one Firestore emulator")
+    parser.add_argument("--auth-url", default="http://127.0.0.1:9099", help="Auth emulator base URL")
+    parser.add_argument("--workers", type=int, default=8, help="Smoke tests run in parallel (1 = sequential)")
+    args = parser.parse_args()
+    base_url = args.base_url
     
     print(f"Testing AI Diligence Pro Backend at: {base_url}")
+
+    upstream = None
+    if args.fake_upstream:
+        upstream = FakeUpstream(port=args.fake_upstream, latency_ms=args.upstream_latency_ms).start_in_thread()
+        print(f"Fake upstream serving at: {upstream.base_url}")
     
-    tester = AIDigilenceBackendTester(base_url)
-    results = tester.run_all_tests()
+    tester = AIDigilenceBackendTester(base_url, args.functions_urls, args.auth_url, args.workers)
+    try:
+        if args.load:
+            results = tester.run_load_test(args.concurrency, args.rps, args.duration,
+                                           max_error_rate=args.max_error_rate)
+            success = results['success']
+        else:
+            results = tester.run_all_tests()
+            success = results['success_rate'] > 0.7  # 70% pass rate required
+        if args.latency_json:
+            tester.latency.export_json(args.latency_json, {'mode': 'load' if args.load else 'smoke', 'base_url': base_url})
+    finally:
+        if upstream:
+            print(f"\n📡 Upstream hits: {dict(upstream.hits)}")
+            upstream.stop()
     
     # Exit with appropriate code
-    exit_code = 0 if results['success_rate'] > 0.7 else 1  # 70% pass rate required
-    sys.exit(exit_code)
+    sys.exit(0 if success else 1)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+"""
+Benchmark Regression Suite for AI Diligence Pro
+Runs fixed scenarios against the functions emulator and the local fake upstream,
+compares them with the JSON baseline kept in benchmarks/, and fails on regressions.
+When no baseline exists yet the run is written there instead, ungated.
+
+Scenarios fit inside one minute of the functions' Alpha Vantage quota
+(ALPHA_VANTAGE_CALLS_PER_MINUTE, 75 by default): 5 cold symbols and a batch of
+5 more use 70 calls, and the warm and PDF scenarios are served from cache.
+Wait a minute between runs so the quota throttle does not inflate the numbers.
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from datetime import datetime
+from typing import Dict, Any, List, Callable
+
+from fake_upstream import FakeUpstream
+from latency_histogram import LatencyHistogram
+from performance_test import AIDiligencePerformanceTester
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmarks", "baseline.json")
+
+# Fixed inputs; a baseline is only comparable with runs using the same settings
+SCENARIO_SETTINGS = {
+    'upstream_latency_ms': 100.0,
+    'cold_samples': 5,
+    'warm_samples': 20,
+    'batch_symbols': 5,
+    'batch_concurrency': 5,
+}
+
+LATENCY_METRICS = ('p50_ms', 'p99_ms')
+THROUGHPUT_METRIC = 'throughput_per_min'
+
+
+class BenchmarkRegressionSuite:
+    def __init__(self, tester: AIDiligencePerformanceTester, settings: Dict[str, Any] = None):
+        self.tester = tester
+        self.settings = dict(settings or SCENARIO_SETTINGS)
+        self.warm_symbol = None
+
+    def _measure(self, calls: List[Callable[[], Any]]) -> Dict[str, float]:
+        """Run `calls` one after another; latency percentiles and calls per minute"""
+        histogram = LatencyHistogram()
+        start = time.perf_counter()
+        for call in calls:
+            call_start = time.perf_counter()
+            call()
+            histogram.record(time.perf_counter() - call_start)
+        elapsed = time.perf_counter() - start
+        return {
+            'count': histogram.count,
+            'p50_ms': histogram.percentile(50),
+            'p99_ms': histogram.percentile(99),
+            THROUGHPUT_METRIC: histogram.count / elapsed * 60 if elapsed else 0.0,
+        }
+
+    def scenario_cold_report(self) -> Dict[str, float]:
+        """getMCPData for symbols no cache tier has seen"""
+        symbols = [self.tester.fresh_symbol() for _ in range(self.settings['cold_samples'])]
+        self.warm_symbol = symbols[0]
+        return self._measure([lambda s=s: self.tester.call('getMCPData', {'symbol': s}) for s in symbols])
+
+    def scenario_warm_report(self) -> Dict[str, float]:
+        """getMCPData for a symbol whose market data and AI results are cached"""
+        payload = {'symbol': self.warm_symbol}
+        return self._measure([lambda: self.tester.call('getMCPData', payload)] * self.settings['warm_samples'])
+
+    def scenario_pdf_tool(self) -> Dict[str, float]:
+        """mcpCallTool('generate_report') on the warm symbol, dominated by PDF rendering"""
+        payload = {'tool': 'generate_report', 'symbol': self.warm_symbol}
+        return self._measure([lambda: self.tester.call('mcpCallTool', payload)] * self.settings['warm_samples'])
+
+    def scenario_batch(self) -> Dict[str, float]:
+        """getMCPDataBatch over fresh symbols; throughput is symbols per minute"""
+        symbols = [self.tester.fresh_symbol() for _ in range(self.settings['batch_symbols'])]
+        histogram = LatencyHistogram()
+        done: Dict[str, Any] = {}
+        for elapsed, section, data in self.tester.analyze_batch(symbols, self.settings['batch_concurrency']):
+            if section == 'result':
+                histogram.record(elapsed)
+            elif section == 'error':
+                raise RuntimeError(f"batch failed for {data['symbol']}: {data.get('message')}")
+            elif section == 'done':
+                done = data
+        return {
+            'count': histogram.count,
+            'p50_ms': histogram.percentile(50),
+            'p99_ms': histogram.percentile(99),
+            THROUGHPUT_METRIC: done.get('symbolsPerMinute', 0.0),
+        }
+
+    def run(self) -> Dict[str, Dict[str, float]]:
+        """Run every scenario in order (warm and PDF reuse the first cold symbol)"""
+        self.tester.upstream_config(latency_ms=self.settings['upstream_latency_ms'], jitter_ms=0, error_rate=0,
+                                    av_calls_per_minute=0, openai_calls_per_minute=0)
+        results = {}
+        for name, scenario in (('cold_report', self.scenario_cold_report),
+                               ('warm_report', self.scenario_warm_report),
+                               ('pdf_tool', self.scenario_pdf_tool),
+                               ('batch', self.scenario_batch)):
+            print(f"▶️ {name}: {scenario.__doc__}")
+            results[name] = scenario()
+            metrics = results[name]
+            print(f"    p50 {metrics['p50_ms']:.1f} ms, p99 {metrics['p99_ms']:.1f} ms, "
+                  f"{metrics[THROUGHPUT_METRIC]:.1f}/min")
+        return results
+
+
+def compare(current: Dict[str, Dict[str, float]], baseline: Dict[str, Dict[str, float]],
+            tolerance: float, min_delta_ms: float) -> List[str]:
+    """Describe every metric that regressed past `tolerance` (a fraction of the baseline)
+
+    Latencies must also grow by at least `min_delta_ms`, so a few milliseconds
+    of noise on a fast scenario never fails the build.
+    """
+    regressions = []
+    for scenario, metrics in sorted(current.items()):
+        reference = baseline.get(scenario)
+        if not reference:
+            print(f"⚠️ {scenario}: no baseline, skipped")
+            continue
+        for metric in LATENCY_METRICS:
+            limit = max(reference[metric] * (1 + tolerance), reference[metric] + min_delta_ms)
+            if metrics[metric] > limit:
+                regressions.append(f"{scenario} {metric}: {metrics[metric]:.1f} ms vs baseline "
+                                   f"{reference[metric]:.1f} ms (limit {limit:.1f} ms)")
+        limit = reference[THROUGHPUT_METRIC] * (1 - tolerance)
+        if metrics[THROUGHPUT_METRIC] < limit:
+            regressions.append(f"{scenario} {THROUGHPUT_METRIC}: {metrics[THROUGHPUT_METRIC]:.1f} vs baseline "
+                               f"{reference[THROUGHPUT_METRIC]:.1f} (limit {limit:.1f})")
+    return regressions
+
+
+def main():
+    """Run the scenarios and gate them against the stored baseline"""
+    parser = argparse.ArgumentParser(description="AI Diligence Pro benchmark regression suite")
+    parser.add_argument("--functions-url", default="http://127.0.0.1:5001/ai-diligence/us-central1",
+                        help="Functions emulator base URL including project and region")
+    parser.add_argument("--auth-url", default="http://127.0.0.1:9099", help="Auth emulator base URL")
+    parser.add_argument("--firestore-url", default="http://127.0.0.1:8080", help="Firestore emulator base URL")
+    parser.add_argument("--upstream-port", type=int, default=8765,
+                        help="Port for the in-process fake upstream the emulator is configured to call")
+    parser.add_argument("--external-upstream", help="Use an already running fake upstream at this URL")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="Baseline JSON to compare against")
+    parser.add_argument("--update-baseline", action="store_true",
+                        help="Record this run as the new baseline instead of comparing")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="Allowed regression as a fraction of the baseline (0.25 = 25%%)")
+    parser.add_argument("--min-delta-ms", type=float, default=10.0,
+                        help="Latency increases smaller than this never count as regressions")
+    parser.add_argument("--json", help="Write this run's results to this JSON file")
+    args = parser.parse_args()
+
+    baseline = None
+    record = args.update_baseline
+    if not record and not os.path.exists(args.baseline):
+        # Nothing to gate against yet: record this run as the candidate baseline to commit
+        print(f"⚠️ No baseline at {args.baseline}; recording this run without gating")
+        record = True
+    if not record:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline.get('settings') != SCENARIO_SETTINGS:
+            print(f"❌ Baseline settings {baseline.get('settings')} differ from {SCENARIO_SETTINGS}; re-record it")
+            sys.exit(2)
+
+    upstream = None
+    upstream_url = args.external_upstream
+    if not upstream_url:
+        upstream = FakeUpstream(port=args.upstream_port, seed=0).start_in_thread()
+        upstream_url = upstream.base_url
+
+    print(f"Benchmarking AI Diligence Pro Functions at: {args.functions_url}")
+    tester = AIDiligencePerformanceTester(args.functions_url, args.auth_url, upstream_url,
+                                          firestore_url=args.firestore_url)
+    try:
+        results = BenchmarkRegressionSuite(tester).run()
+    finally:
+        if upstream:
+            upstream.stop()
+
+    document = {'recorded_at': datetime.now().isoformat(), 'settings': SCENARIO_SETTINGS, 'scenarios': results}
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(document, f, indent=2)
+
+    if record:
+        os.makedirs(os.path.dirname(os.path.abspath(args.baseline)), exist_ok=True)
+        with open(args.baseline, 'w') as f:
+            json.dump(document, f, indent=2)
+            f.write('\n')
+        print(f"📌 Baseline written to {args.baseline}")
+        sys.exit(0)
+
+    regressions = compare(results, baseline['scenarios'], args.tolerance, args.min_delta_ms)
+    print("=" * 50)
+    if regressions:
+        print(f"❌ {len(regressions)} regression(s) beyond {args.tolerance:.0%} of the baseline:")
+        for regression in regressions:
+            print(f"  - {regression}")
+        sys.exit(1)
+    print(f"✅ All scenarios within {args.tolerance:.0%} of the baseline recorded {baseline['recorded_at']}")
+    sys.exit(0)
+
+
+if __name__ == "__main__":
+    main()
@@ -4,14 +4,19 @@ Comprehensive Testing Report for AI Diligence Pro
 Tests both backend and frontend functionality
 """
 
+import argparse
 import requests
 import json
 import sys
+import threading
 import time
 from datetime import datetime
 
+from latency_histogram import LatencyRecorder, attach_latency_recorder
+from parallel_runner import Once, ParallelTestRunner
+
 class AIDigilenceComprehensiveTester:
-    def __init__(self, base_url="http://localhost:3001"):
+    def __init__(self, base_url="http://localhost:3001", workers=8):
         self.base_url = base_url
         self.session = requests.Session()
         self.session.headers.update({
@@ -19,6 +24,12 @@ class AIDigilenceComprehensiveTester:
             'User-Agent': 'AI-Diligence-Test-Client/1.0'
         })
         self.test_results = []
+        self.latency = LatencyRecorder()
+        attach_latency_recorder(self.session, self.latency)
+        self.workers = workers
+        self._log_lock = threading.Lock()
+        # The index page is fetched once per run and shared by every test that parses it
+        self.index_page = Once(lambda: self.session.get(f"{self.base_url}/"))
         
     def log_test(self, category, name, success, details="", response_data=None):
         """Log test results"""
@@ -30,18 +41,19 @@ class AIDigilenceComprehensiveTester:
             'timestamp': datetime.now().isoformat(),
             'response_data': response_data
         }
-        self.test_results.append(result)
-        
-        status = "✅ PASS" if success else "❌ FAIL"
-        print(f"{status} - [{category}] {name}")
-        if details:
-            print(f"    Details: {details}")
-        print()
+        with self._log_lock:
+            self.test_results.append(result)
+
+            status = "✅ PASS" if success else "❌ FAIL"
+            print(f"{status} - [{category}] {name}")
+            if details:
+                print(f"    Details: {details}")
+            print()
 
     def test_frontend_accessibility(self):
         """Test if the frontend is accessible"""
         try:
-            response = self.session.get(f"{self.base_url}/")
+            response = self.index_page()
             success = response.status_code == 200
             
             if success:
@@ -76,7 +88,7 @@ class AIDigilenceComprehensiveTester:
         """Test if static assets are loading"""
         try:
             # Get the main page to find asset references
-            response = self.session.get(f"{self.base_url}/")
+            response = self.index_page()
             if response.status_code != 200:
                 self.log_test("Frontend", "Static Assets", False, "Main page not accessible")
                 return False
@@ -152,7 +164,7 @@ class AIDigilenceComprehensiveTester:
         """Test MCP integration readiness"""
         try:
             # Check if the application has the necessary MCP components
-            response = self.session.get(f"{self.base_url}/")
+            response = self.index_page()
             if response.status_code != 200:
                 self.log_test("MCP", "Integration Readiness", False, "Application not accessible")
                 return False
@@ -227,7 +239,7 @@ class AIDigilenceComprehensiveTester:
     def test_production_readiness(self):
         """Test production readiness indicators"""
         try:
-            response = self.session.get(f"{self.base_url}/")
+            response = self.index_page()
             if response.status_code != 200:
                 self.log_test("Production", "Readiness Check", False, "Application not accessible")
                 return False
@@ -268,21 +280,18 @@ class AIDigilenceComprehensiveTester:
         print("🚀 Starting AI Diligence Pro Comprehensive Testing")
         print("=" * 60)
         
-        # Run all tests
-        tests = [
+        # Run all tests; none depends on another, so they all run concurrently
+        runner = ParallelTestRunner(self.workers)
+        for test in [
             self.test_frontend_accessibility,
             self.test_static_assets,
             self.test_firebase_functions_endpoints,
             self.test_mcp_integration_readiness,
             self.test_api_keys_configuration,
             self.test_production_readiness
-        ]
-        
-        for test in tests:
-            try:
-                test()
-            except Exception as e:
-                print(f"❌ Test execution error: {str(e)}")
+        ]:
+            runner.add(test)
+        runner.run(lambda name, e: print(f"❌ Test execution error in {name}: {str(e)}"))
         
         # Generate summary
         print("=" * 60)
@@ -341,19 +350,29 @@ class AIDigilenceComprehensiveTester:
             print("• Application is mostly ready but needs minor fixes")
         else:
             print("• Application appears ready for production deployment")
+
+        runner.print_timing()
+        self.latency.print_summary()
         
         return overall_rate >= 70
 
 def main():
     """Main test execution"""
-    base_url = sys.argv[1] if len(sys.argv) > 1 else "http://localhost:3001"
+    parser = argparse.ArgumentParser(description="AI Diligence Pro comprehensive tests")
+    parser.add_argument("base_url", nargs="?", default="http://localhost:3001")
+    parser.add_argument("--latency-json", help="Write per-endpoint latency percentiles to this JSON file")
+    parser.add_argument("--workers", type=int, default=8, help="Tests run in parallel (1 = sequential)")
+    args = parser.parse_args()
+    base_url = args.base_url
     
     print(f"Testing AI Diligence Pro at: {base_url}")
     print(f"Test started at: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
     print()
     
-    tester = AIDigilenceComprehensiveTester(base_url)
+    tester = AIDigilenceComprehensiveTester(base_url, args.workers)
     success = tester.generate_comprehensive_report()
+    if args.latency_json:
+        tester.latency.export_json(args.latency_json, {'base_url': base_url, 'passed': success})
     
     exit_code = 0 if success else 1
     sys.exit(exit_code)
@@ -58,6 +58,12 @@ npm run build:prod
 echo "🚀 Deploying to Firebase..."
 firebase deploy
 
+# Rendered report PDFs are cached in Storage by content hash; expire them
+# after 30 days (functions/src/utils/pdfCache.ts re-renders on demand)
+echo "🗑️  Applying Storage lifecycle rules..."
+STORAGE_BUCKET=${STORAGE_BUCKET:-$(grep -h '^VITE_FIREBASE_STORAGE_BUCKET=' .env | cut -d= -f2)}
+gcloud storage buckets update "gs://$STORAGE_BUCKET" --lifecycle-file=storage.lifecycle.json
+
 echo "✅ Deployment completed successfully!"
 echo "🌐 Your app is now live at: https://aidiligence.pro"
 
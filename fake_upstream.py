@@ -0,0 +1,664 @@
+#!/usr/bin/env python3
+"""
+Fake Upstream Server for AI Diligence Pro
+Serves Alpha Vantage, SEC EDGAR and OpenAI response shapes locally with injected latency,
+jitter, errors and throttling so the harnesses can run without network access
+
+Point the functions emulator at it through functions/.env.local:
+    ALPHA_VANTAGE_BASE_URL=http://127.0.0.1:8765
+    ALPHA_VANTAGE_API_KEY=fake
+    OPENAI_BASE_URL=http://127.0.0.1:8765/v1
+    OPENAI_API_KEY=fake
+    SEC_BASE_URL=http://127.0.0.1:8765
+    PDF_CACHE_L2=off
+
+PDF_CACHE_L2=off keeps rendered PDFs in instance memory, since the harnesses
+do not start the Storage emulator.
+
+quote_tick_seconds (via /__config) moves GLOBAL_QUOTE prices every tick, so
+the realtime quote stream has deltas to push; by default quotes only change
+once a day.
+
+ALPHA_VANTAGE_CALLS_PER_MINUTE (default 75) sets the functions' own quota
+throttle; the batch benchmark configures the same limit here.
+
+--tls serves HTTPS with a throwaway self-signed certificate (printed at
+startup) so connection reuse can be measured with real handshakes; trust it
+in the emulator with NODE_EXTRA_CA_CERTS=<cert> and use https:// base URLs.
+"""
+
+import argparse
+import asyncio
+import hashlib
+import json
+import math
+import os
+import random
+import ssl
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter, deque
+from datetime import date, datetime, timedelta
+from typing import Dict, Any, Optional, Tuple
+from urllib.parse import urlsplit, parse_qs
+
+COMPANY_NAMES = {
+    "AAPL": ("Apple Inc.", "TECHNOLOGY", "ELECTRONIC COMPUTERS"),
+    "MSFT": ("Microsoft Corporation", "TECHNOLOGY", "SERVICES-PREPACKAGED SOFTWARE"),
+    "GOOGL": ("Alphabet Inc.", "COMMUNICATION SERVICES", "SERVICES-COMPUTER PROGRAMMING"),
+    "AMZN": ("Amazon.com Inc.", "CONSUMER CYCLICAL", "RETAIL-CATALOG & MAIL-ORDER HOUSES"),
+    "NVDA": ("NVIDIA Corporation", "TECHNOLOGY", "SEMICONDUCTORS & RELATED DEVICES"),
+    "TSLA": ("Tesla Inc.", "CONSUMER CYCLICAL", "MOTOR VEHICLES & PASSENGER CAR BODIES"),
+    "JPM": ("JPMorgan Chase & Co.", "FINANCIAL SERVICES", "NATIONAL COMMERCIAL BANKS"),
+}
+
+# Real EDGAR CIKs, so the fake ticker file and submissions line up with production
+COMPANY_CIKS = {"AAPL": 320193, "MSFT": 789019, "GOOGL": 1652044, "AMZN": 1018724, "NVDA": 1045810,
+                "TSLA": 1318605, "JPM": 19617}
+SEC_FORMS = ("10-Q", "8-K", "4", "4", "8-K", "10-Q", "4", "SC 13G", "8-K", "10-K", "4", "DEF 14A")
+
+ALPHA_VANTAGE_NOTE = (
+    "Thank you for using Alpha Vantage! Our standard API call frequency is "
+    "5 calls per minute and 500 calls per day."
+)
+
+HTTP_REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 429: "Too Many Requests",
+                500: "Internal Server Error", 503: "Service Unavailable"}
+
+
+def _symbol_rng(symbol: str, salt: str = "") -> random.Random:
+    """Deterministic RNG per symbol so repeated calls return identical data"""
+    digest = hashlib.sha256(f"{symbol}:{salt}".encode()).digest()
+    return random.Random(int.from_bytes(digest[:8], "big"))
+
+
+def _company(symbol: str) -> Tuple[str, str, str]:
+    return COMPANY_NAMES.get(symbol, (f"{symbol.title()} Holdings Inc.", "INDUSTRIALS", "GENERAL INDUSTRIAL"))
+
+
+def _trading_days(count: int):
+    """Most recent `count` weekdays, newest first"""
+    day = date.today()
+    days = []
+    while len(days) < count:
+        if day.weekday() < 5:
+            days.append(day.isoformat())
+        day -= timedelta(days=1)
+    return days
+
+
+def generate_self_signed_cert(directory: Optional[str] = None) -> Tuple[str, str]:
+    """Create a localhost/127.0.0.1 certificate with the openssl CLI; returns (certfile, keyfile)"""
+    directory = directory or tempfile.mkdtemp(prefix="fake-upstream-tls-")
+    certfile = os.path.join(directory, "cert.pem")
+    keyfile = os.path.join(directory, "key.pem")
+    subprocess.run(
+        ["openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-days", "2",
+         "-subj", "/CN=127.0.0.1", "-addext", "subjectAltName=IP:127.0.0.1,DNS:localhost",
+         "-keyout", keyfile, "-out", certfile],
+        check=True, capture_output=True
+    )
+    return certfile, keyfile
+
+
+class FakeUpstream:
+    """Single-process asyncio HTTP server standing in for the market-data and LLM APIs"""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 8765, latency_ms: float = 0.0,
+                 jitter_ms: float = 0.0, error_rate: float = 0.0, av_calls_per_minute: int = 0,
+                 openai_calls_per_minute: int = 0, full_history_days: int = 5000, sec_recent_filings: int = 1000,
+                 quote_tick_seconds: float = 0.0, openai_tokens_per_second: float = 0.0, seed: Optional[int] = None,
+                 certfile: Optional[str] = None, keyfile: Optional[str] = None):
+        self.host = host
+        self.port = port
+        self.certfile = certfile
+        self.ssl_context: Optional[ssl.SSLContext] = None
+        if certfile:
+            self.ssl_context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+            self.ssl_context.load_cert_chain(certfile, keyfile)
+        self.config = {
+            'latency_ms': latency_ms,
+            'jitter_ms': jitter_ms,
+            'error_rate': error_rate,
+            'av_calls_per_minute': av_calls_per_minute,
+            'openai_calls_per_minute': openai_calls_per_minute,
+            'full_history_days': full_history_days,
+            'sec_recent_filings': sec_recent_filings,
+            'quote_tick_seconds': quote_tick_seconds,
+            'openai_tokens_per_second': openai_tokens_per_second,
+            # Answer every chat completion with a 429 and no Retry-After (an overloaded model)
+            'openai_reject_all': False,
+        }
+        self.random = random.Random(seed)
+        self.hits: Counter = Counter()
+        self.throttled: Counter = Counter()
+        self.errors: Counter = Counter()
+        self.tokens: Counter = Counter()
+        self.connections = 0
+        self._windows: Dict[str, deque] = {'alphavantage': deque(), 'openai': deque()}
+        self._history_cache: Dict[str, Dict[str, Any]] = {}
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        return f"{'https' if self.ssl_context else 'http'}://{self.host}:{self.port}"
+
+    # ---- throttling and fault injection -------------------------------------------------
+
+    def _over_limit(self, upstream: str) -> bool:
+        limit = self.config[f"{'av' if upstream == 'alphavantage' else 'openai'}_calls_per_minute"]
+        if not limit:
+            return False
+        now = time.monotonic()
+        window = self._windows[upstream]
+        while window and now - window[0] > 60:
+            window.popleft()
+        if len(window) >= limit:
+            return True
+        window.append(now)
+        return False
+
+    def _retry_after(self, upstream: str) -> int:
+        """Whole seconds until the oldest call in `upstream`'s window leaves it"""
+        window = self._windows[upstream]
+        return max(1, math.ceil(60 - (time.monotonic() - window[0]))) if window else 1
+
+    async def _inject_latency(self):
+        latency = self.config['latency_ms'] + self.random.uniform(-1, 1) * self.config['jitter_ms']
+        if latency > 0:
+            await asyncio.sleep(latency / 1000)
+
+    # ---- Alpha Vantage shapes -----------------------------------------------------------
+
+    def load_series(self, symbol: str, dates, closes, splits: Optional[Dict[str, float]] = None):
+        """Serve fixed daily closes (oldest first) for `symbol` instead of a generated history
+
+        `closes` are split-adjusted; `splits` maps an ex-date to its ratio
+        (2.0 for 2-for-1), and raw prices before it are that much higher.
+        """
+        splits = splits or {}
+        bars, adjusted, factor = [], [], 1.0
+        for day, close in zip(reversed(dates), reversed(closes)):
+            raw = close * factor
+            bars.append((raw, raw, raw, raw, 1_000_000))
+            adjusted.append(close)
+            factor *= splits.get(day, 1.0)
+        self._history_cache[symbol] = {'days': len(bars), 'dates': list(reversed(dates)), 'bars': bars,
+                                       'adjusted': adjusted, 'splits': dict(splits), 'fixed': True}
+
+    def _price_history(self, symbol: str, days: int) -> Dict[str, Any]:
+        cached = self._history_cache.get(symbol)
+        if cached and (cached['days'] >= days or cached.get('fixed')):
+            return cached
+        # Walk backwards from today's close so every history length shares the
+        # same most-recent bars (compact is a prefix of full, like the real API)
+        rng = _symbol_rng(symbol, "history")
+        close = rng.uniform(20, 500)
+        bars = []
+        for _ in range(days):
+            open_ = max(1.0, close / (1 + rng.gauss(0, 0.018)))
+            high = max(open_, close) * (1 + abs(rng.gauss(0, 0.006)))
+            low = min(open_, close) * (1 - abs(rng.gauss(0, 0.006)))
+            bars.append((open_, high, low, close, int(rng.uniform(5e5, 8e7))))
+            close = open_
+        cached = {'days': days, 'dates': _trading_days(days), 'bars': bars}
+        self._history_cache[symbol] = cached
+        return cached
+
+    def _time_series_daily(self, symbol: str, outputsize: str, adjusted: bool = False) -> Dict[str, Any]:
+        """TIME_SERIES_DAILY, or with `adjusted` TIME_SERIES_DAILY_ADJUSTED (generated histories never split)"""
+        days = self.config['full_history_days'] if outputsize == 'full' else 100
+        history = self._price_history(symbol, days)
+        series = {}
+        for i, (day, (open_, high, low, close, volume)) in enumerate(zip(history['dates'][:days],
+                                                                         history['bars'][:days])):
+            entry = {
+                "1. open": f"{open_:.4f}",
+                "2. high": f"{high:.4f}",
+                "3. low": f"{low:.4f}",
+                "4. close": f"{close:.4f}",
+            }
+            if adjusted:
+                entry["5. adjusted close"] = f"{history['adjusted'][i] if 'adjusted' in history else close:.4f}"
+                entry["6. volume"] = str(volume)
+                entry["7. dividend amount"] = "0.0000"
+                entry["8. split coefficient"] = f"{history.get('splits', {}).get(day, 1.0):.1f}"
+            else:
+                entry["5. volume"] = str(volume)
+            series[day] = entry
+        return {
+            "Meta Data": {
+                "1. Information": ("Daily Time Series with Splits and Dividend Events" if adjusted
+                                   else "Daily Prices (open, high, low, close) and Volumes"),
+                "2. Symbol": symbol,
+                "3. Last Refreshed": history['dates'][0],
+                "4. Output Size": "Full size" if outputsize == 'full' else "Compact",
+                "5. Time Zone": "US/Eastern",
+            },
+            "Time Series (Daily)": series,
+        }
+
+    def _global_quote(self, symbol: str) -> Dict[str, Any]:
+        open_, high, low, close, volume = self._price_history(symbol, 100)['bars'][0]
+        previous_close = self._price_history(symbol, 100)['bars'][1][3]
+        tick_seconds = self.config['quote_tick_seconds']
+        if tick_seconds:
+            # Intraday movement: a new price every tick, the same for every caller within it
+            tick = int(time.time() // tick_seconds)
+            close *= 1 + _symbol_rng(symbol, f"tick{tick}").uniform(-0.01, 0.01)
+            high, low = max(high, close), min(low, close)
+            volume += tick % 100000 * 100
+        change = close - previous_close
+        return {
+            "Global Quote": {
+                "01. symbol": symbol,
+                "02. open": f"{open_:.4f}",
+                "03. high": f"{high:.4f}",
+                "04. low": f"{low:.4f}",
+                "05. price": f"{close:.4f}",
+                "06. volume": str(volume),
+                "07. latest trading day": _trading_days(1)[0],
+                "08. previous close": f"{previous_close:.4f}",
+                "09. change": f"{change:.4f}",
+                "10. change percent": f"{change / previous_close * 100:.4f}%",
+            }
+        }
+
+    def _overview(self, symbol: str) -> Dict[str, Any]:
+        rng = _symbol_rng(symbol, "overview")
+        name, sector, industry = _company(symbol)
+        closes = [bar[3] for bar in self._price_history(symbol, 100)['bars']]
+        return {
+            "Symbol": symbol,
+            "AssetType": "Common Stock",
+            "Name": name,
+            "Description": f"{name} is a synthetic company served by the AI Diligence Pro fake upstream.",
+            "Exchange": "NASDAQ",
+            "Currency": "USD",
+            "Sector": sector,
+            "Industry": industry,
+            "MarketCapitalization": str(int(rng.uniform(5e9, 3e12))),
+            "PERatio": f"{rng.uniform(8, 45):.2f}",
+            "DividendYield": f"{rng.uniform(0, 0.04):.4f}",
+            "EPS": f"{rng.uniform(0.5, 12):.2f}",
+            "Beta": f"{rng.uniform(0.6, 1.9):.3f}",
+            "52WeekHigh": f"{max(closes) * 1.05:.2f}",
+            "52WeekLow": f"{min(closes) * 0.95:.2f}",
+        }
+
+    def _statement(self, symbol: str, function: str) -> Dict[str, Any]:
+        rng = _symbol_rng(symbol, function)
+        reports = []
+        revenue = rng.uniform(5e9, 4e11)
+        for years_back in range(5):
+            fiscal = f"{date.today().year - 1 - years_back}-12-31"
+            assets = revenue * rng.uniform(0.8, 2.5)
+            liabilities = assets * rng.uniform(0.3, 0.8)
+            if function == 'INCOME_STATEMENT':
+                report = {
+                    "fiscalDateEnding": fiscal,
+                    "reportedCurrency": "USD",
+                    "totalRevenue": str(int(revenue)),
+                    "grossProfit": str(int(revenue * rng.uniform(0.3, 0.7))),
+                    "operatingIncome": str(int(revenue * rng.uniform(0.1, 0.35))),
+                    "netIncome": str(int(revenue * rng.uniform(0.02, 0.3))),
+                }
+            elif function == 'BALANCE_SHEET':
+                report = {
+                    "fiscalDateEnding": fiscal,
+                    "reportedCurrency": "USD",
+                    "totalAssets": str(int(assets)),
+                    "totalCurrentAssets": str(int(assets * rng.uniform(0.2, 0.5))),
+                    "totalLiabilities": str(int(liabilities)),
+                    "totalCurrentLiabilities": str(int(liabilities * rng.uniform(0.3, 0.6))),
+                    "totalShareholderEquity": str(int(assets - liabilities)),
+                }
+            else:
+                report = {
+                    "fiscalDateEnding": fiscal,
+                    "reportedCurrency": "USD",
+                    "operatingCashflow": str(int(revenue * rng.uniform(0.05, 0.35))),
+                    "capitalExpenditures": str(int(revenue * rng.uniform(0.02, 0.1))),
+                }
+            reports.append(report)
+            revenue /= rng.uniform(1.0, 1.15)
+        return {"symbol": symbol, "annualReports": reports, "quarterlyReports": []}
+
+    def _symbol_search(self, keywords: str) -> Dict[str, Any]:
+        query = keywords.lower()
+        matches = [
+            (symbol, name) for symbol, (name, _, _) in COMPANY_NAMES.items()
+            if query in symbol.lower() or query in name.lower()
+        ]
+        if not matches:
+            symbol = "".join(ch for ch in keywords.upper() if ch.isalpha())[:4] or "TEST"
+            matches = [(symbol, _company(symbol)[0])]
+        return {
+            "bestMatches": [
+                {
+                    "1. symbol": symbol,
+                    "2. name": name,
+                    "3. type": "Equity",
+                    "4. region": "United States",
+                    "5. marketOpen": "09:30",
+                    "6. marketClose": "16:00",
+                    "7. timezone": "UTC-04",
+                    "8. currency": "USD",
+                    "9. matchScore": "1.0000",
+                }
+                for symbol, name in matches
+            ]
+        }
+
+    def _news_sentiment(self, tickers: str, limit: int) -> Dict[str, Any]:
+        symbol = tickers.split(",")[0]
+        rng = _symbol_rng(symbol, "news")
+        name = _company(symbol)[0]
+        now = datetime.now()
+        headlines = ["reports quarterly earnings", "expands into new markets", "faces supply chain questions",
+                     "announces share buyback", "draws analyst upgrade", "under regulatory review"]
+        feed = []
+        for i in range(min(limit, 50)):
+            score = rng.uniform(-0.6, 0.6)
+            label = "Bullish" if score > 0.15 else "Bearish" if score < -0.15 else "Neutral"
+            feed.append({
+                "title": f"{name} {headlines[i % len(headlines)]}",
+                "url": f"https://news.example.com/{symbol.lower()}/{i}",
+                "time_published": (now - timedelta(hours=6 * i)).strftime("%Y%m%dT%H%M%S"),
+                "summary": f"{name} ({symbol}) {headlines[i % len(headlines)]} according to a synthetic wire report.",
+                "source": ["Reuters", "Bloomberg", "CNBC", "Financial Times"][i % 4],
+                "overall_sentiment_score": round(score, 4),
+                "overall_sentiment_label": label,
+                "ticker_sentiment": [{"ticker": symbol, "relevance_score": "0.9", "ticker_sentiment_score": f"{score:.4f}"}],
+            })
+        return {"items": str(len(feed)), "sentiment_score_definition": "x <= -0.35: Bearish; ...", "feed": feed}
+
+    def alpha_vantage(self, params: Dict[str, str]) -> Tuple[int, Dict[str, Any]]:
+        function = params.get('function', '')
+        symbol = params.get('symbol', '').upper()
+        self.hits[function] += 1
+        if self._over_limit('alphavantage'):
+            self.throttled[function] += 1
+            return 200, {"Note": ALPHA_VANTAGE_NOTE}
+        if function == 'GLOBAL_QUOTE':
+            return 200, self._global_quote(symbol)
+        if function == 'OVERVIEW':
+            return 200, self._overview(symbol)
+        if function in ('INCOME_STATEMENT', 'BALANCE_SHEET', 'CASH_FLOW'):
+            return 200, self._statement(symbol, function)
+        if function in ('TIME_SERIES_DAILY', 'TIME_SERIES_DAILY_ADJUSTED'):
+            return 200, self._time_series_daily(symbol, params.get('outputsize', 'compact'),
+                                                adjusted=function == 'TIME_SERIES_DAILY_ADJUSTED')
+        if function == 'SYMBOL_SEARCH':
+            return 200, self._symbol_search(params.get('keywords', ''))
+        if function == 'NEWS_SENTIMENT':
+            return 200, self._news_sentiment(params.get('tickers', ''), int(params.get('limit', 50)))
+        return 200, {"Error Message": f"Invalid API call. Unknown function: {function}"}
+
+    # ---- SEC EDGAR shapes ---------------------------------------------------------------
+
+    def _company_tickers(self) -> Dict[str, Any]:
+        return {str(i): {"cik_str": cik, "ticker": ticker, "title": _company(ticker)[0]}
+                for i, (ticker, cik) in enumerate(COMPANY_CIKS.items())}
+
+    def _submissions(self, cik: int) -> Optional[Dict[str, Any]]:
+        ticker = next((t for t, c in COMPANY_CIKS.items() if c == cik), None)
+        if not ticker:
+            return None
+        # One filing every third calendar day, newest first; accession numbers
+        # are derived from the date so a later day only adds filings at the front
+        today = date.today()
+        recent = {"accessionNumber": [], "filingDate": [], "reportDate": [], "form": [], "primaryDocument": []}
+        for i in range(self.config['sec_recent_filings']):
+            day = today - timedelta(days=3 * i + today.toordinal() % 3)
+            form = SEC_FORMS[day.toordinal() // 3 % len(SEC_FORMS)]
+            recent["accessionNumber"].append(f"{cik:010d}-{day:%y}-{day.toordinal() % 1000000:06d}")
+            recent["filingDate"].append(day.isoformat())
+            recent["reportDate"].append(day.isoformat())
+            recent["form"].append(form)
+            recent["primaryDocument"].append(f"{ticker.lower()}-{day:%Y%m%d}.htm")
+        return {"cik": str(cik), "name": _company(ticker)[0], "tickers": [ticker], "filings": {"recent": recent}}
+
+    def sec(self, path: str) -> Tuple[int, Any]:
+        if path == '/files/company_tickers.json':
+            return 200, self._company_tickers()
+        cik = path[len('/submissions/CIK'):-len('.json')]
+        submissions = self._submissions(int(cik)) if cik.isdigit() else None
+        if submissions is None:
+            return 404, {"error": "Not found"}
+        return 200, submissions
+
+    # ---- OpenAI shapes ------------------------------------------------------------------
+
+    def chat_completion(self, body: Dict[str, Any]) -> Tuple[int, Dict[str, Any]]:
+        self.hits['chat.completions'] += 1
+        if self.config['openai_reject_all'] or self._over_limit('openai'):
+            self.throttled['chat.completions'] += 1
+            return 429, {"error": {"message": "Rate limit reached for requests", "type": "requests",
+                                   "code": "rate_limit_exceeded"}}
+        messages = body.get('messages') or []
+        prompt = "\n".join(str(m.get('content', '')) for m in messages)
+        rng = random.Random(hashlib.sha256(prompt.encode()).digest())
+        if 'Companies (JSON):' in prompt:
+            # Batched sentiment: one result per company, seeded by that company's
+            # entry alone so the same company scores the same in any batch
+            try:
+                companies = json.loads(prompt.split('Companies (JSON):', 1)[1])
+            except ValueError:
+                return 400, {"error": {"message": "Unparseable companies list"}}
+            content = {"results": [dict(self._sentiment(json.dumps(c, sort_keys=True)), id=c.get('id'))
+                                   for c in companies]}
+        elif 'sentiment' in prompt.lower():
+            content = self._sentiment(prompt)
+        else:
+            content = {"action": rng.choice(["buy", "hold", "sell"]), "confidence": round(rng.uniform(0.5, 0.9), 2),
+                       "reasoning": ["Synthetic recommendation from the fake upstream"],
+                       "targetPrice": round(rng.uniform(20, 500), 2), "timeHorizon": "6-12 months"}
+        text = json.dumps(content)
+        prompt_tokens = max(1, len(prompt) // 4)
+        completion_tokens = max(1, len(text) // 4)
+        self.tokens['prompt'] += prompt_tokens
+        self.tokens['completion'] += completion_tokens
+        return 200, {
+            "id": f"chatcmpl-fake-{self.hits['chat.completions']}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get('model', 'gpt-4'),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                      "total_tokens": prompt_tokens + completion_tokens},
+        }
+
+    @staticmethod
+    def _sentiment(seed: str) -> Dict[str, Any]:
+        rng = random.Random(hashlib.sha256(seed.encode()).digest())
+        score = round(rng.uniform(-0.8, 0.8), 2)
+        return {"score": score, "label": "positive" if score > 0.2 else "negative" if score < -0.2 else "neutral",
+                "confidence": round(rng.uniform(0.5, 0.95), 2), "themes": ["earnings", "guidance"]}
+
+    # ---- HTTP plumbing ------------------------------------------------------------------
+
+    def stats(self) -> Dict[str, Any]:
+        return {'hits': dict(self.hits), 'throttled': dict(self.throttled), 'errors': dict(self.errors),
+                'tokens': dict(self.tokens), 'connections': self.connections, 'config': dict(self.config)}
+
+    def reset(self):
+        self.hits.clear()
+        self.throttled.clear()
+        self.errors.clear()
+        self.tokens.clear()
+        self.connections = 0
+        for window in self._windows.values():
+            window.clear()
+
+    async def route(self, method: str, target: str, body: bytes) -> Tuple[int, Any]:
+        url = urlsplit(target)
+        params = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        if url.path == '/__stats':
+            return 200, self.stats()
+        if url.path == '/__reset':
+            self.reset()
+            return 200, self.stats()
+        if url.path == '/__config' and method == 'POST':
+            updates = json.loads(body or b'{}')
+            self.config.update({key: value for key, value in updates.items() if key in self.config})
+            return 200, self.stats()
+
+        if url.path == '/query':
+            upstream = params.get('function', 'unknown')
+        elif url.path.endswith('/chat/completions') and method == 'POST':
+            upstream = 'chat.completions'
+        elif url.path == '/files/company_tickers.json':
+            upstream = 'sec.company_tickers'
+        elif url.path.startswith('/submissions/CIK') and url.path.endswith('.json'):
+            upstream = 'sec.submissions'
+        else:
+            return 404, {"error": f"No fake route for {method} {url.path}"}
+
+        await self._inject_latency()
+        if self.config['error_rate'] and self.random.random() < self.config['error_rate']:
+            self.errors[upstream] += 1
+            return 503, {"error": "Injected upstream failure"}
+        if upstream.startswith('sec.'):
+            self.hits[upstream] += 1
+            return self.sec(url.path)
+        if upstream == 'chat.completions':
+            try:
+                status, payload = self.chat_completion(json.loads(body or b'{}'))
+            except json.JSONDecodeError:
+                return 400, {"error": {"message": "Invalid JSON body"}}
+            # Generation time grows with the answer, as it does for a real model
+            if status == 200 and self.config['openai_tokens_per_second']:
+                await asyncio.sleep(payload['usage']['completion_tokens'] / self.config['openai_tokens_per_second'])
+            return status, payload
+        return self.alpha_vantage(params)
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.connections += 1
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, target, _ = request_line.decode('latin-1').split(' ', 2)
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    key, _, value = line.decode('latin-1').partition(':')
+                    headers[key.strip().lower()] = value.strip()
+                length = int(headers.get('content-length', 0) or 0)
+                body = await reader.readexactly(length) if length else b''
+
+                status, payload = await self.route(method.upper(), target, body)
+                data = json.dumps(payload).encode()
+                keep_alive = headers.get('connection', '').lower() != 'close'
+                # Only the OpenAI stand-in answers 429 (Alpha Vantage sends a "Note"), and
+                # names a wait only when its quota window is what turned the call away
+                quota_429 = status == 429 and not self.config['openai_reject_all']
+                retry_after = f"Retry-After: {self._retry_after('openai')}\r\n" if quota_429 else ""
+                head = (
+                    f"HTTP/1.1 {status} {HTTP_REASONS.get(status, 'OK')}\r\n"
+                    f"Content-Type: application/json\r\n"
+                    f"Content-Length: {len(data)}\r\n"
+                    f"{retry_after}"
+                    f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+                )
+                writer.write(head.encode('latin-1') + data)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, ssl.SSLError, asyncio.IncompleteReadError, asyncio.CancelledError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def start(self):
+        self._server = await asyncio.start_server(self.handle, self.host, self.port, ssl=self.ssl_context)
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    async def serve_forever(self):
+        await self.start()
+        async with self._server:
+            await self._server.serve_forever()
+
+    def start_in_thread(self) -> "FakeUpstream":
+        """Run the server on a background event loop (port 0 picks a free port)"""
+        ready = threading.Event()
+
+        def run():
+            self._loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(self._loop)
+            self._loop.run_until_complete(self.start())
+            ready.set()
+            self._loop.run_forever()
+            self._server.close()
+            pending = asyncio.all_tasks(self._loop)
+            for task in pending:
+                task.cancel()
+            self._loop.run_until_complete(asyncio.gather(*pending, return_exceptions=True))
+            self._loop.close()
+
+        self._thread = threading.Thread(target=run, name="fake-upstream", daemon=True)
+        self._thread.start()
+        ready.wait(10)
+        return self
+
+    def stop(self):
+        if self._loop:
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join(10)
+            self._loop = None
+
+    def __enter__(self) -> "FakeUpstream":
+        return self.start_in_thread()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def main():
+    """Run the fake upstream until interrupted"""
+    parser = argparse.ArgumentParser(description="Fake Alpha Vantage / OpenAI upstream")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="Base latency added to every upstream call")
+    parser.add_argument("--jitter-ms", type=float, default=0.0, help="Uniform +/- jitter around the base latency")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of calls answered with HTTP 503")
+    parser.add_argument("--av-calls-per-minute", type=int, default=0,
+                        help="Alpha Vantage quota; calls over it get a 'Note' body (0 = unlimited)")
+    parser.add_argument("--openai-calls-per-minute", type=int, default=0,
+                        help="OpenAI quota; calls over it get HTTP 429 with Retry-After (0 = unlimited)")
+    parser.add_argument("--openai-tokens-per-second", type=float, default=0.0,
+                        help="Completion generation speed; answers take tokens / this long (0 = instant)")
+    parser.add_argument("--seed", type=int, help="Seed for latency jitter and error injection")
+    parser.add_argument("--tls", action="store_true", help="Serve HTTPS (self-signed unless --tls-cert is given)")
+    parser.add_argument("--tls-cert", help="PEM certificate for --tls")
+    parser.add_argument("--tls-key", help="PEM private key for --tls-cert")
+    args = parser.parse_args()
+
+    certfile, keyfile = args.tls_cert, args.tls_key
+    if args.tls and not certfile:
+        certfile, keyfile = generate_self_signed_cert()
+    upstream = FakeUpstream(args.host, args.port, args.latency_ms, args.jitter_ms, args.error_rate,
+                            args.av_calls_per_minute, args.openai_calls_per_minute,
+                            openai_tokens_per_second=args.openai_tokens_per_second, seed=args.seed,
+                            certfile=certfile, keyfile=keyfile)
+    print(f"🧪 Fake upstream listening on {upstream.base_url}")
+    if certfile:
+        print(f"🔐 Certificate: {certfile}")
+    try:
+        asyncio.run(upstream.serve_forever())
+    except KeyboardInterrupt:
+        print(f"\n📊 Upstream hits: {dict(upstream.hits)}")
+        sys.exit(0)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,5 @@
 import { initializeApp, getApps } from 'firebase-admin/app';
-import { mcpExecuteResource, mcpCallTool, mcpRealTime, getMCPData } from './mcpServer';
+import { mcpExecuteResource, mcpCallTool, mcpRealTime, mcpRealTimeStream, getMCPData, getMCPDataStream, getMCPDataBatch, mcpCacheStats, downloadReportPdf, mcpPortfolioRisk, mcpSentimentBatch } from './mcpServer';
 import { generateReport } from './reportGenerator';
 import { createPayPalSubscription, executePayPalAgreement } from './paypal';
 
@@ -11,7 +11,14 @@ export {
   mcpExecuteResource,
   mcpCallTool,
   mcpRealTime,
+  mcpRealTimeStream,
   getMCPData,
+  getMCPDataStream,
+  getMCPDataBatch,
+  mcpCacheStats,
+  downloadReportPdf,
+  mcpPortfolioRisk,
+  mcpSentimentBatch,
   generateReport,
   createPayPalSubscription,
   executePayPalAgreement
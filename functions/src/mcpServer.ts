@@ -1,9 +1,20 @@
 import * as functions from 'firebase-functions';
 import * as admin from 'firebase-admin';
-import { PDFDocument, rgb, StandardFonts } from 'pdf-lib';
+import { onRequest, Request } from 'firebase-functions/v2/https';
+import type { Response } from 'express';
 import { FinancialDataService } from './services/financialDataService';
-import { AIAnalysisService } from './services/aiAnalysisService';
+import { AIAnalysisService, AIRequestOptions, SentimentRequest } from './services/aiAnalysisService';
 import { NewsService } from './services/newsService';
+import { aiResultCache, marketDataCache } from './utils/lruCache';
+import { pdfCache, pdfResult } from './utils/pdfCache';
+import { PdfLayout } from './utils/pdfLayout';
+import { latestBars, PRICE_HISTORY_MAX_BARS, PriceHistory, priceHistoryStore } from './utils/priceHistory';
+import { portfolioRisk } from './utils/portfolio';
+import { QuoteEvent, QuoteHub } from './utils/quoteHub';
+import { filingIndex } from './utils/secIndex';
+import { enforceRateLimit } from './utils/rateLimiter';
+import { openAIRateLimits } from './utils/upstreams';
+import { forEachConcurrent } from './utils/workerPool';
 
 if (admin.apps.length === 0) {
   admin.initializeApp();
@@ -13,28 +24,15 @@ const financialService = new FinancialDataService();
 const aiService = new AIAnalysisService();
 const newsService = new NewsService();
 
-// Simple in-memory rate limiter per user: 30 requests per 15 min
-const RATE_LIMIT_MAX = 30;
-const RATE_LIMIT_WINDOW_MS = 15 * 60 * 1000;
-const rateMap: Map<string, { count: number; windowStart: number }> = new Map();
-
-function enforceRateLimit(uid: string) {
-  const now = Date.now();
-  const entry = rateMap.get(uid);
-  if (!entry) {
-    rateMap.set(uid, { count: 1, windowStart: now });
-    return;
-  }
-  if (now - entry.windowStart > RATE_LIMIT_WINDOW_MS) {
-    rateMap.set(uid, { count: 1, windowStart: now });
-    return;
-  }
-  if (entry.count >= RATE_LIMIT_MAX) {
-    throw new functions.https.HttpsError('resource-exhausted', 'Rate limit exceeded. Try again later.');
-  }
-  entry.count += 1;
-  rateMap.set(uid, entry);
-}
+// Each polled symbol costs one Alpha Vantage call per interval on every
+// instance with subscribers, shared with reports through the quota throttle
+const REALTIME_POLL_MS = parseInt(process.env.REALTIME_POLL_MS || '', 10) || 15000;
+const REALTIME_MAX_SYMBOLS = 20; // per connection
+const REALTIME_HEARTBEAT_MS = 25000;
+const quoteHub = new QuoteHub(async (symbol) => ({ ...(await financialService.refreshStockQuote(symbol)) }), {
+  intervalMs: REALTIME_POLL_MS,
+  maxSymbols: parseInt(process.env.REALTIME_MAX_POLLED_SYMBOLS || '', 10) || 200
+});
 
 function validateSymbol(symbol: unknown): string | null {
   if (typeof symbol !== 'string') return null;
@@ -67,121 +65,300 @@ function formatCurrency(n: number): string {
   return `$${n.toFixed(2)}`;
 }
 
-async function generatePdfSummary(report: any): Promise<string> {
-  const pdfDoc = await PDFDocument.create();
-  const page = pdfDoc.addPage();
-  const { height } = page.getSize();
-  const font = await pdfDoc.embedFont(StandardFonts.Helvetica);
-  const fontBold = await pdfDoc.embedFont(StandardFonts.HelveticaBold);
-  const fontSize = 12;
-  let y = height - 40;
-
-  const draw = (text: string, bold = false, size = fontSize) => {
-    const f = bold ? fontBold : font;
-    page.drawText(text, { x: 50, y, font: f, size, color: rgb(0, 0, 0) });
-    y -= size + 6;
-  };
+async function renderPdfSummary(report: any): Promise<Uint8Array> {
+  const layout = await PdfLayout.create();
 
-  draw(`Due Diligence Report: ${report?.overview?.name || report?.symbol}`, true, 18);
-  draw(`Symbol: ${report?.symbol}`, false, 12);
-  draw(`Generated At: ${new Date().toLocaleString()}`, false, 12);
-  y -= 10;
+  layout.heading(`Due Diligence Report: ${report?.overview?.name || report?.symbol}`, 18);
+  layout.text(`Symbol: ${report?.symbol}`);
+  // The document is cached by payload hash, so it carries the data's date rather than the render time
+  layout.text(`Data As Of: ${report?.quote?.latestTradingDay || 'N/A'}`);
+  layout.space(10);
 
-  draw('Key Metrics', true, 14);
+  layout.heading('Key Metrics');
   const km = report.keyMetrics || {};
-  Object.keys(km).forEach((k) => draw(`${k}: ${km[k]}`, false, 12));
-  y -= 6;
+  Object.keys(km).forEach((k) => layout.text(`${k}: ${km[k]}`));
+  layout.space(6);
 
-  draw('Recommendation', true, 14);
+  layout.heading('Recommendation');
   const rec = report.recommendation || {};
-  draw(`Action: ${rec.action?.toUpperCase() || 'N/A'} (Confidence: ${Math.round((rec.confidence || 0) * 100)}%)`, false, 12);
-  draw(`Target Price: ${rec.targetPrice ? `$${rec.targetPrice.toFixed(2)}` : 'N/A'} | Horizon: ${rec.timeHorizon || 'N/A'}`, false, 12);
-  y -= 6;
+  layout.text(`Action: ${rec.action?.toUpperCase() || 'N/A'} (Confidence: ${Math.round((rec.confidence || 0) * 100)}%)`);
+  layout.text(`Target Price: ${rec.targetPrice ? `$${rec.targetPrice.toFixed(2)}` : 'N/A'} | Horizon: ${rec.timeHorizon || 'N/A'}`);
+  if (rec.reasoning?.length) layout.bullets(rec.reasoning);
+  layout.space(6);
 
-  draw('Risk Assessment', true, 14);
+  layout.heading('Risk Assessment');
   const risk = report.risk || {};
-  draw(`Overall Risk: ${risk.overallRisk || 'N/A'} (${Math.round(risk.riskScore || 0)}/100)`, false, 12);
+  layout.text(`Overall Risk: ${risk.overallRisk || 'N/A'} (${Math.round(risk.riskScore || 0)}/100)`);
   if (risk.concerns?.length) {
-    draw('Concerns:', false, 12);
-    risk.concerns.slice(0, 6).forEach((c: string) => draw(`- ${c}`, false, 12));
+    layout.text('Concerns:');
+    layout.bullets(risk.concerns);
   }
-  y -= 6;
+  layout.space(6);
 
-  draw('Summary', true, 14);
-  draw(report.reportSummary || 'No summary available.', false, 12);
+  if (report.news?.length) {
+    layout.heading('Recent News');
+    layout.bullets(report.news.map((n: any) => `${n.title} (${n.source || 'Unknown'}, ${n.publishedAt || 'n/a'})`));
+    layout.space(6);
+  }
+
+  layout.heading('Summary');
+  layout.text(report.reportSummary || 'No summary available.');
 
-  const pdfBytes = await pdfDoc.save();
-  return Buffer.from(pdfBytes).toString('base64');
+  return layout.save();
+}
+
+type SectionListener = (section: string, data: any) => void;
+
+/**
+ * The report inputs as a per-request dependency graph. Each node is a
+ * memoized thunk: it starts on first use, at most once, and starts its own
+ * dependencies concurrently, so callers fetch only what they ask for.
+ */
+function analysisGraph(symbol: string, companyName: string, aiOptions: AIRequestOptions = {}) {
+  const memo: Map<string, Promise<any>> = new Map();
+  const node = <T>(name: string, compute: () => Promise<T>) => (): Promise<T> => {
+    if (!memo.has(name)) memo.set(name, compute());
+    return memo.get(name)!;
+  };
+
+  const quote = node('quote', () => financialService.getStockQuote(symbol));
+  const overview = node('overview', () => financialService.getCompanyOverview(symbol));
+  const financials = node('financials', () => financialService.getFinancialMetrics(symbol));
+  // Reports show the last 180 bars; only those are materialized from the columnar history
+  const historical = node('historical', async () => latestBars(await financialService.getPriceHistory(symbol), 180));
+  const analytics = node('analytics', () => financialService.getAnalytics(symbol));
+  const news = node('news', () => newsService.getCompanyNews(companyName, symbol));
+  const secFilings = node('secFilings', () => newsService.getSECFilings(symbol));
+  const fundamentals = node('fundamentals', async () => {
+    const [q, o, f] = await Promise.all([quote(), overview(), financials()]);
+    return { quote: q, overview: o, financials: f };
+  });
+  const sentiment = node('sentiment', async () =>
+    aiService.analyzeSentiment(companyName, (await news()).map(n => `${n.title}. ${n.description || ''}`), aiOptions)
+  );
+  // Risk falls back to fundamentals alone when the price history is unavailable
+  const risk = node('risk', async () => {
+    const [data, a] = await Promise.all([fundamentals(), analytics().catch(() => undefined)]);
+    return aiService.assessRisk({ ...data, analytics: a });
+  });
+  const recommendation = node('recommendation', async () => {
+    const [data, s, r] = await Promise.all([fundamentals(), sentiment(), risk()]);
+    return aiService.generateRecommendation(data, s, r, aiOptions);
+  });
+
+  return { quote, overview, financials, historical, analytics, news, secFilings, sentiment, risk, recommendation };
+}
+
+/**
+ * Fetches and analyzes everything a full report needs. Each section is passed
+ * to `onSection` as soon as it resolves.
+ */
+async function buildAnalysis(
+  symbol: string,
+  companyName: string,
+  onSection: SectionListener = () => undefined,
+  aiOptions: AIRequestOptions = {}
+) {
+  const graph = analysisGraph(symbol, companyName, aiOptions);
+  const section = <T>(name: string, promise: Promise<T>, view: (value: T) => any = (value) => value): Promise<T> =>
+    promise.then((value) => {
+      onSection(name, view(value));
+      return value;
+    });
+
+  const [quote, overview, financials, historical, analytics, news, secFilings, sentiment, risk, recommendation] = await Promise.all([
+    section('quote', graph.quote()),
+    section('overview', graph.overview()),
+    section('financials', graph.financials()),
+    section('historical', graph.historical()),
+    section('analytics', graph.analytics()),
+    section('news', graph.news()),
+    section('secFilings', graph.secFilings()),
+    section('sentiment', graph.sentiment()),
+    section('risk', graph.risk()),
+    section('recommendation', graph.recommendation())
+  ]);
+
+  const keyMetrics = {
+    'P/E Ratio': overview.peRatio?.toFixed?.(2) ?? String(overview.peRatio),
+    'Market Cap': formatCurrency(overview.marketCap),
+    'Dividend Yield': overview.dividendYield ? `${(overview.dividendYield * 100).toFixed(2)}%` : 'N/A',
+    '52-Week High': `$${overview.week52High?.toFixed?.(2) || 'N/A'}`,
+    '52-Week Low': `$${overview.week52Low?.toFixed?.(2) || 'N/A'}`,
+    'Profit Margin': `${(financials.profitMargin || 0).toFixed(2)}%`,
+    'ROE': `${(financials.returnOnEquity || 0).toFixed(2)}%`,
+    'Volatility (1y)': analytics.volatility === null ? 'N/A' : `${analytics.volatility.toFixed(1)}%`,
+    'Max Drawdown (1y)': `${analytics.maxDrawdown1y.toFixed(1)}%`,
+    'Beta': analytics.beta === null ? 'N/A' : analytics.beta.toFixed(2)
+  };
+
+  // Last daily returns, oldest first, scaled into [-1, 1] for the sentiment chart
+  const sentimentHistory = analytics.recentReturns.map((ret) => Math.max(-1, Math.min(1, ret * 10)));
+
+  const reportSummary = `${overview.name} (${symbol}) operates in the ${overview.sector} sector, ${overview.industry} industry. ` +
+    `Current price is $${quote.price.toFixed(2)} with P/E of ${overview.peRatio || 'N/A'}. ` +
+    `Sentiment is ${sentiment.label} (score ${sentiment.score.toFixed(2)}). Overall risk is ${risk.overallRisk}. ` +
+    `Recommendation: ${recommendation.action.toUpperCase()} with ${(recommendation.confidence * 100).toFixed(0)}% confidence.`;
+  onSection('summary', { reportSummary, keyMetrics, sentimentHistory });
+
+  return {
+    symbol,
+    overview,
+    quote,
+    financials,
+    historical,
+    analytics,
+    news,
+    secFilings,
+    sentiment,
+    risk,
+    recommendation,
+    reportSummary,
+    keyMetrics,
+    sentimentHistory
+  };
 }
 
 export const getMCPData = functions.https.onCall(async (data, context) => {
   if (!context.auth) {
     throw new functions.https.HttpsError('unauthenticated', 'Must be authenticated.');
   }
-  enforceRateLimit(context.auth.uid);
+  await enforceRateLimit(context.auth.uid);
 
   const { symbol, companyName } = await resolveSymbol(data);
 
   try {
-    const [quote, overview, financials, historical, news, secFilings] = await Promise.all([
-      financialService.getStockQuote(symbol),
-      financialService.getCompanyOverview(symbol),
-      financialService.getFinancialMetrics(symbol),
-      financialService.getHistoricalData(symbol, '1y'),
-      newsService.getCompanyNews(companyName, symbol),
-      newsService.getSECFilings(symbol)
-    ]);
-
-    const sentiment = await aiService.analyzeSentiment(companyName, news.map(n => `${n.title}. ${n.description || ''}`));
-    const risk = await aiService.assessRisk({ quote, overview, financials });
-    const recommendation = await aiService.generateRecommendation({ quote, overview, financials }, sentiment, risk);
-
-    const keyMetrics = {
-      'P/E Ratio': overview.peRatio?.toFixed?.(2) ?? String(overview.peRatio),
-      'Market Cap': formatCurrency(overview.marketCap),
-      'Dividend Yield': overview.dividendYield ? `${(overview.dividendYield * 100).toFixed(2)}%` : 'N/A',
-      '52-Week High': `$${overview.week52High?.toFixed?.(2) || 'N/A'}`,
-      '52-Week Low': `$${overview.week52Low?.toFixed?.(2) || 'N/A'}`,
-      'Profit Margin': `${(financials.profitMargin || 0).toFixed(2)}%`,
-      'ROE': `${(financials.returnOnEquity || 0).toFixed(2)}%`
-    };
+    return await buildAnalysis(symbol, companyName, undefined, { allowCached: data?.allowCached });
+  } catch (error) {
+    console.error('getMCPData error:', error);
+    throw new functions.https.HttpsError('internal', 'Failed to fetch analysis data.');
+  }
+});
+
+// HTTP (non-callable) endpoints take the ID token as a Bearer header or, since
+// EventSource cannot set headers, as ?token=. Answers 401 and returns undefined
+// when it is missing or invalid.
+async function verifyRequestUser(req: Request, res: Response): Promise<string | undefined> {
+  const idToken = req.headers.authorization?.split('Bearer ')[1] || (req.query.token as string | undefined);
+  try {
+    if (!idToken) throw new Error('Missing ID token');
+    return (await admin.auth().verifyIdToken(idToken)).uid;
+  } catch (error) {
+    res.status(401).json({ error: 'Must be authenticated.' });
+    return undefined;
+  }
+}
 
-    const sentimentHistory = historical.slice(0, 30).map((d, i) => {
-      if (i === 0) return 0;
-      const prev = historical[i - 1];
-      const ret = ((d.close - prev.close) / prev.close) || 0;
-      return Math.max(-1, Math.min(1, ret * 10));
-    }).slice(-10);
+function sendHttpsError(res: Response, error: unknown) {
+  const status = error instanceof functions.https.HttpsError ? error.httpErrorCode.status : 500;
+  res.status(status).json({ error: (error as Error).message });
+}
 
-    const reportSummary = `${overview.name} (${symbol}) operates in the ${overview.sector} sector, ${overview.industry} industry. ` +
-      `Current price is $${quote.price.toFixed(2)} with P/E of ${overview.peRatio || 'N/A'}. ` +
-      `Sentiment is ${sentiment.label} (score ${sentiment.score.toFixed(2)}). Overall risk is ${risk.overallRisk}. ` +
-      `Recommendation: ${recommendation.action.toUpperCase()} with ${(recommendation.confidence * 100).toFixed(0)}% confidence.`;
+// Switches the response to server-sent events; each call of the returned
+// function writes one `message` event carrying { section, data }.
+function openEventStream(res: Response): SectionListener {
+  res.set({
+    'Content-Type': 'text/event-stream',
+    'Cache-Control': 'no-cache',
+    'Connection': 'keep-alive',
+    'X-Accel-Buffering': 'no'
+  });
+  res.flushHeaders();
+  return (section, data) => {
+    res.write(`data: ${JSON.stringify({ section, data })}\n\n`);
+  };
+}
 
-    return {
-      symbol,
-      overview,
-      quote,
-      financials,
-      historical: historical.slice(0, 180),
-      news,
-      secFilings,
-      sentiment,
-      risk,
-      recommendation,
-      reportSummary,
-      keyMetrics,
-      sentimentHistory
-    };
+// Server-sent events variant of getMCPData: one event per report section as
+// soon as it is ready, then `done`.
+export const getMCPDataStream = onRequest({ cors: true, timeoutSeconds: 120 }, async (req, res) => {
+  const uid = await verifyRequestUser(req, res);
+  if (!uid) return;
+
+  let target: { symbol: string; companyName: string };
+  try {
+    await enforceRateLimit(uid);
+    target = await resolveSymbol(req.query);
   } catch (error) {
-    console.error('getMCPData error:', error);
-    throw new functions.https.HttpsError('internal', 'Failed to fetch analysis data.');
+    sendHttpsError(res, error);
+    return;
   }
+
+  const started = Date.now();
+  const send = openEventStream(res);
+  try {
+    await buildAnalysis(target.symbol, target.companyName, send, { allowCached: req.query.allowCached !== 'false' });
+    send('done', { symbol: target.symbol, elapsedMs: Date.now() - started });
+  } catch (error) {
+    console.error('getMCPDataStream error:', error);
+    send('error', { message: 'Failed to fetch analysis data.' });
+  }
+  res.end();
+});
+
+const BATCH_MAX_SYMBOLS = 200;
+const BATCH_DEFAULT_CONCURRENCY = 5;
+const BATCH_MAX_CONCURRENCY = 10;
+
+// Full reports for a list of tickers in one request (one rate-limit unit).
+// POST { symbols: string[], concurrency?: number }; streams a `result` or
+// `error` event per symbol in completion order, then `done`. A bounded pool
+// of workers shares the market data cache, and every Alpha Vantage call goes
+// through the per-minute quota throttle, so large batches queue rather than
+// get throttled upstream.
+export const getMCPDataBatch = onRequest({ cors: true, timeoutSeconds: 3600 }, async (req, res) => {
+  if (req.method !== 'POST') {
+    res.status(405).json({ error: 'Use POST with a JSON body { symbols: [...] }.' });
+    return;
+  }
+  const uid = await verifyRequestUser(req, res);
+  if (!uid) return;
+
+  const requested: unknown[] = Array.isArray(req.body?.symbols) ? req.body.symbols : [];
+  const invalid = requested.filter((s) => !validateSymbol(s));
+  const symbols = Array.from(new Set(requested.map(validateSymbol).filter((s): s is string => !!s)));
+  try {
+    if (!symbols.length || invalid.length) {
+      throw new functions.https.HttpsError('invalid-argument',
+        invalid.length ? `Invalid symbols: ${invalid.slice(0, 10).join(', ')}` : 'Provide a non-empty "symbols" array.');
+    }
+    if (symbols.length > BATCH_MAX_SYMBOLS) {
+      throw new functions.https.HttpsError('invalid-argument', `At most ${BATCH_MAX_SYMBOLS} symbols per batch.`);
+    }
+    await enforceRateLimit(uid);
+  } catch (error) {
+    sendHttpsError(res, error);
+    return;
+  }
+
+  const aiOptions = { allowCached: req.body.allowCached };
+  const concurrency = Math.min(BATCH_MAX_CONCURRENCY, Math.max(1, Number(req.body.concurrency) || BATCH_DEFAULT_CONCURRENCY));
+  const started = Date.now();
+  const send = openEventStream(res);
+  let failed = 0;
+  await forEachConcurrent(symbols, concurrency, async (symbol) => {
+    try {
+      send('result', { symbol, report: await buildAnalysis(symbol, symbol, undefined, aiOptions) });
+    } catch (error) {
+      failed += 1;
+      console.error(`getMCPDataBatch error for ${symbol}:`, error);
+      send('error', { symbol, message: 'Failed to fetch analysis data.' });
+    }
+  });
+  const elapsedMs = Date.now() - started;
+  send('done', {
+    symbols: symbols.length,
+    failed,
+    concurrency,
+    elapsedMs,
+    symbolsPerMinute: symbols.length / Math.max(elapsedMs, 1) * 60000
+  });
+  res.end();
 });
 
 export const mcpExecuteResource = functions.https.onCall(async (data, context) => {
   if (!context.auth) throw new functions.https.HttpsError('unauthenticated', 'Must be authenticated.');
-  enforceRateLimit(context.auth.uid);
+  await enforceRateLimit(context.auth.uid);
   const { symbol, resource } = data || {};
   const s = validateSymbol(symbol);
   if (!s) throw new functions.https.HttpsError('invalid-argument', 'Provide valid symbol.');
@@ -200,6 +377,8 @@ export const mcpExecuteResource = functions.https.onCall(async (data, context) =
         return { overview: await financialService.getCompanyOverview(s) };
       case 'metrics':
         return { metrics: await financialService.getFinancialMetrics(s) };
+      case 'analytics':
+        return { analytics: await financialService.getAnalytics(s) };
       default:
         throw new functions.https.HttpsError('invalid-argument', 'Unknown resource.');
     }
@@ -209,36 +388,190 @@ export const mcpExecuteResource = functions.https.onCall(async (data, context) =
   }
 });
 
+const MCP_TOOLS = ['analyze_risk', 'recommend', 'generate_report'];
+
+const PORTFOLIO_MAX_HOLDINGS = 500;
+const PORTFOLIO_FETCH_CONCURRENCY = 8;
+// Full history fetches one call may start: a third of a minute of the
+// default Alpha Vantage quota. Later holdings are reported as not cached
+// yet, and each call warms more of the portfolio.
+const PORTFOLIO_MAX_COLD_FETCHES = 25;
+const PORTFOLIO_MAX_LOOKBACK = PRICE_HISTORY_MAX_BARS - 1; // every return the store keeps
+
+// { holdings: [{ symbol, weight? }] } or { symbols: [...] }; duplicate symbols
+// add their weights. Weights are relative and default to equal.
+function parseHoldings(data: any): { symbols: string[]; weights?: Map<string, number> } {
+  const raw: unknown[] = Array.isArray(data?.holdings) ? data.holdings : Array.isArray(data?.symbols) ? data.symbols : [];
+  const weights = new Map<string, number>();
+  let weighted = false;
+  const invalid: string[] = [];
+  for (const entry of raw) {
+    const item = typeof entry === 'string' ? { symbol: entry } : (entry as any) || {};
+    const symbol = validateSymbol(item.symbol);
+    const weight = item.weight === undefined ? 1 : Number(item.weight);
+    if (!symbol || !(weight >= 0)) {
+      invalid.push(String(item.symbol));
+      continue;
+    }
+    weighted = weighted || item.weight !== undefined;
+    weights.set(symbol, (weights.get(symbol) || 0) + weight);
+  }
+  if (invalid.length) {
+    throw new functions.https.HttpsError('invalid-argument', `Invalid holdings: ${invalid.slice(0, 10).join(', ')}`);
+  }
+  if (weights.size < 2 || weights.size > PORTFOLIO_MAX_HOLDINGS) {
+    throw new functions.https.HttpsError('invalid-argument', `Provide between 2 and ${PORTFOLIO_MAX_HOLDINGS} holdings.`);
+  }
+  return { symbols: Array.from(weights.keys()), weights: weighted ? weights : undefined };
+}
+
+// Daily returns to use: a whole number of days, 2 to PORTFOLIO_MAX_LOOKBACK (default one year)
+function parseLookback(value: unknown): number | undefined {
+  if (value === undefined || value === null) return undefined;
+  const lookback = Number(value);
+  if (!Number.isInteger(lookback) || lookback < 2 || lookback > PORTFOLIO_MAX_LOOKBACK) {
+    throw new functions.https.HttpsError('invalid-argument',
+      `"lookback" must be a whole number of days from 2 to ${PORTFOLIO_MAX_LOOKBACK}.`);
+  }
+  return lookback;
+}
+
+// Correlation and risk aggregation over the holdings' cached price histories.
+// At most PORTFOLIO_MAX_COLD_FETCHES holdings are fetched from Alpha Vantage
+// per call; those and any whose history cannot be fetched are reported as
+// excluded. The metrics describe only the included holdings (weights are
+// renormalized over them), so `coverage` gives the % of the requested weight
+// they hold and `complete` is false whenever any holding was left out.
+async function analyzePortfolio(data: any) {
+  const { symbols, weights } = parseHoldings(data);
+  const lookback = parseLookback(data?.lookback);
+  const started = Date.now();
+  const histories: PriceHistory[] = [];
+  const unavailable: Array<{ symbol: string; reason: string }> = [];
+  const coldFetches = { remaining: PORTFOLIO_MAX_COLD_FETCHES };
+  await forEachConcurrent(symbols, PORTFOLIO_FETCH_CONCURRENCY, async (symbol) => {
+    try {
+      histories.push(await financialService.getPriceHistory(symbol, coldFetches));
+    } catch (error) {
+      const deferred = error instanceof functions.https.HttpsError && error.code === 'resource-exhausted';
+      unavailable.push({ symbol, reason: deferred ? 'price history not cached yet; retry shortly' : 'price history unavailable' });
+    }
+  });
+  const fetched = Date.now();
+  const longest = histories.reduce((max, history) => Math.max(max, history.length), 0);
+  if (lookback && histories.length && lookback >= longest) {
+    throw new functions.https.HttpsError('invalid-argument',
+      `"lookback" must be shorter than the longest available history (${longest} days).`);
+  }
+  try {
+    const portfolio = portfolioRisk(histories, weights, {
+      lookback,
+      includeMatrix: data?.includeMatrix ?? symbols.length <= 50
+    });
+    portfolio.excluded.push(...unavailable);
+    const weightOf = (symbol: string) => (weights ? weights.get(symbol) || 0 : 1);
+    const requested = symbols.reduce((sum, symbol) => sum + weightOf(symbol), 0);
+    const left = portfolio.excluded.reduce((sum, { symbol }) => sum + weightOf(symbol), 0);
+    return {
+      complete: portfolio.excluded.length === 0,
+      coverage: requested > 0 ? (1 - left / requested) * 100 : 0,
+      portfolio,
+      coldFetches: PORTFOLIO_MAX_COLD_FETCHES - coldFetches.remaining,
+      timings: { fetchMs: fetched - started, computeMs: Date.now() - fetched }
+    };
+  } catch (error) {
+    throw new functions.https.HttpsError('failed-precondition', (error as Error).message);
+  }
+}
+
+// The portfolio_risk tool: { holdings: [{ symbol, weight? }] | symbols, lookback?,
+// includeMatrix? }. Its own callable, with room for its cold fetches to queue
+// behind the Alpha Vantage quota, so mcpCallTool keeps the default timeout.
+export const mcpPortfolioRisk = functions.runWith({ timeoutSeconds: 300 }).https.onCall(async (data, context) => {
+  if (!context.auth) throw new functions.https.HttpsError('unauthenticated', 'Must be authenticated.');
+  await enforceRateLimit(context.auth.uid);
+  return analyzePortfolio(data);
+});
+
+const SENTIMENT_MAX_SYMBOLS = 200;
+const SENTIMENT_NEWS_CONCURRENCY = 8;
+const SENTIMENT_MAX_CONCURRENCY = 8; // the OpenAI client's socket pool
+
+// News sentiment for many tickers at once: { symbols, batchSize?, concurrency? }.
+// Headlines are fetched with a bounded pool, then several companies share
+// each completion (see AIAnalysisService.analyzeSentimentBatch).
+async function analyzeSentimentBatch(data: any) {
+  const requested: unknown[] = Array.isArray(data?.symbols) ? data.symbols : [];
+  const invalid = requested.filter((s) => !validateSymbol(s));
+  const symbols = Array.from(new Set(requested.map(validateSymbol).filter((s): s is string => !!s)));
+  if (!symbols.length || invalid.length) {
+    throw new functions.https.HttpsError('invalid-argument',
+      invalid.length ? `Invalid symbols: ${invalid.slice(0, 10).join(', ')}` : 'Provide a non-empty "symbols" array.');
+  }
+  if (symbols.length > SENTIMENT_MAX_SYMBOLS) {
+    throw new functions.https.HttpsError('invalid-argument', `At most ${SENTIMENT_MAX_SYMBOLS} symbols per call.`);
+  }
+
+  const started = Date.now();
+  // In request order, so the same symbol list packs into the same (cacheable) batches
+  const requests: SentimentRequest[] = new Array(symbols.length);
+  await forEachConcurrent(symbols, SENTIMENT_NEWS_CONCURRENCY, async (symbol, index) => {
+    let news: any[] = [];
+    try {
+      news = await newsService.getCompanyNews(symbol, symbol);
+    } catch (error) {
+      console.warn(`No news for ${symbol}:`, error);
+    }
+    requests[index] = { id: symbol, companyName: symbol, newsArticles: news.map(n => `${n.title}. ${n.description || ''}`) };
+  });
+  const fetched = Date.now();
+  const concurrency = Number(data?.concurrency);
+  const { results, batches, unanswered } = await aiService.analyzeSentimentBatch(requests, {
+    allowCached: data?.allowCached,
+    batchSize: Number(data?.batchSize) || undefined,
+    concurrency: concurrency > 0 ? Math.min(SENTIMENT_MAX_CONCURRENCY, concurrency) : undefined
+  });
+  return {
+    sentiment: results,
+    batches,
+    unanswered, // keyword analysis only: their batch failed or the model left them out
+    timings: { newsMs: fetched - started, analysisMs: Date.now() - fetched }
+  };
+}
+
+// The sentiment_batch tool on its own callable: 200 companies' completions,
+// with 429 backoff, outlast the default timeout that mcpCallTool keeps.
+export const mcpSentimentBatch = functions.runWith({ timeoutSeconds: 300 }).https.onCall(async (data, context) => {
+  if (!context.auth) throw new functions.https.HttpsError('unauthenticated', 'Must be authenticated.');
+  await enforceRateLimit(context.auth.uid);
+  return analyzeSentimentBatch(data);
+});
+
 export const mcpCallTool = functions.https.onCall(async (data, context) => {
   if (!context.auth) throw new functions.https.HttpsError('unauthenticated', 'Must be authenticated.');
-  enforceRateLimit(context.auth.uid);
+  await enforceRateLimit(context.auth.uid);
 
   const tool = data?.tool as string;
   if (!tool) throw new functions.https.HttpsError('invalid-argument', 'Missing tool name.');
+  if (!MCP_TOOLS.includes(tool)) throw new functions.https.HttpsError('invalid-argument', 'Unknown tool.');
 
   const { symbol, companyName } = await resolveSymbol(data);
+  // Each tool pulls only the nodes it needs; shared nodes run once per request
+  const graph = analysisGraph(symbol, companyName, { allowCached: data?.allowCached });
 
   try {
-    const quote = await financialService.getStockQuote(symbol);
-    const overview = await financialService.getCompanyOverview(symbol);
-    const financials = await financialService.getFinancialMetrics(symbol);
-    const news = await newsService.getCompanyNews(companyName, symbol);
-
     switch (tool) {
       case 'analyze_risk': {
-        const risk = await aiService.assessRisk({ quote, overview, financials });
-        return { risk };
+        return { risk: await graph.risk() };
       }
       case 'recommend': {
-        const sentiment = await aiService.analyzeSentiment(companyName, news.map(n => `${n.title}. ${n.description || ''}`));
-        const risk = await aiService.assessRisk({ quote, overview, financials });
-        const recommendation = await aiService.generateRecommendation({ quote, overview, financials }, sentiment, risk);
+        const [sentiment, risk, recommendation] = await Promise.all([graph.sentiment(), graph.risk(), graph.recommendation()]);
         return { sentiment, risk, recommendation };
       }
-      case 'generate_report': {
-        const sentiment = await aiService.analyzeSentiment(companyName, news.map(n => `${n.title}. ${n.description || ''}`));
-        const risk = await aiService.assessRisk({ quote, overview, financials });
-        const recommendation = await aiService.generateRecommendation({ quote, overview, financials }, sentiment, risk);
+      default: { // generate_report
+        const [overview, quote, risk, recommendation, news] = await Promise.all([
+          graph.overview(), graph.quote(), graph.risk(), graph.recommendation(), graph.news()
+        ]);
         const payload = {
           symbol,
           overview,
@@ -250,13 +583,12 @@ export const mcpCallTool = functions.https.onCall(async (data, context) => {
           },
           recommendation,
           risk,
+          news: news.map((n: any) => ({ title: n.title, source: n.source, publishedAt: n.publishedAt })),
           reportSummary: `${overview.name} (${symbol}) investment brief: ${recommendation.action.toUpperCase()} @ ${(recommendation.confidence * 100).toFixed(0)}% confidence.`
         };
-        const pdf = await generatePdfSummary(payload);
-        return { pdf };
+        // Same payload, same document: repeat calls skip rendering entirely
+        return pdfResult(await pdfCache.render('summary', payload, () => renderPdfSummary(payload)), data?.format);
       }
-      default:
-        throw new functions.https.HttpsError('invalid-argument', 'Unknown tool.');
     }
   } catch (e) {
     console.error('mcpCallTool error:', e);
@@ -264,8 +596,142 @@ export const mcpCallTool = functions.https.onCall(async (data, context) => {
   }
 });
 
+// Describes the push channel; clients open mcpRealTimeStream instead of
+// polling getMCPData.
 export const mcpRealTime = functions.https.onCall(async (data, context) => {
   if (!context.auth) throw new functions.https.HttpsError('unauthenticated', 'Must be authenticated.');
-  enforceRateLimit(context.auth.uid);
-  return { mode: 'polling', intervalSeconds: 30, message: 'Realtime sockets not available; use polling.' };
-});
\ No newline at end of file
+  await enforceRateLimit(context.auth.uid);
+  return {
+    mode: 'sse',
+    endpoint: 'mcpRealTimeStream',
+    query: 'symbols=AAPL,MSFT&token=<ID token>',
+    maxSymbols: REALTIME_MAX_SYMBOLS,
+    intervalSeconds: REALTIME_POLL_MS / 1000,
+    events: ['subscribed', 'snapshot', 'delta', 'heartbeat']
+  };
+});
+
+// Process-wide fan-out numbers for load testing, reported by mcpCacheStats only
+function realtimeStats() {
+  const { rss, heapUsed } = process.memoryUsage();
+  return { ...quoteHub.stats(), rss, heapUsed };
+}
+
+// Every subscriber of a symbol receives the same event object, so its frame
+// is encoded once per fan-out rather than once per connection.
+const quoteFrames = new WeakMap<QuoteEvent, string>();
+function quoteFrame(event: QuoteEvent): string {
+  let frame = quoteFrames.get(event);
+  if (!frame) {
+    frame = `data: ${JSON.stringify({ section: event.type, data: event })}\n\n`;
+    quoteFrames.set(event, frame);
+  }
+  return frame;
+}
+
+// Live quotes over server-sent events: GET ?symbols=AAPL,MSFT&token=<ID token>.
+// Sends `subscribed`, then a `snapshot` per symbol and a `delta` with only
+// the changed fields whenever a poll moves the quote, plus a `heartbeat`
+// every 25 s. One poller per symbol serves every connection on the instance
+// (see QuoteHub); the connection costs one rate-limit unit when opened.
+// EventSource reconnects by itself when the function timeout closes it.
+export const mcpRealTimeStream = onRequest({ cors: true, timeoutSeconds: 3600, concurrency: 1000 }, async (req, res) => {
+  const uid = await verifyRequestUser(req, res);
+  if (!uid) return;
+
+  const requested = String(req.query.symbols || req.query.symbol || '').split(',').filter(Boolean);
+  const symbols = Array.from(new Set(requested.map(validateSymbol)));
+  try {
+    if (!symbols.length || symbols.some((s) => !s)) {
+      throw new functions.https.HttpsError('invalid-argument', 'Provide valid comma-separated "symbols".');
+    }
+    if (symbols.length > REALTIME_MAX_SYMBOLS) {
+      throw new functions.https.HttpsError('invalid-argument', `At most ${REALTIME_MAX_SYMBOLS} symbols per stream.`);
+    }
+    await enforceRateLimit(uid);
+  } catch (error) {
+    sendHttpsError(res, error);
+    return;
+  }
+
+  const send = openEventStream(res);
+  res.write('retry: 2000\n\n');
+  const unsubscribes: Array<() => void> = [];
+  const heartbeat = setInterval(() => send('heartbeat', {}), REALTIME_HEARTBEAT_MS);
+  const close = () => {
+    clearInterval(heartbeat);
+    unsubscribes.forEach((unsubscribe) => unsubscribe());
+    unsubscribes.length = 0;
+  };
+  // The response, not the request: a request emits 'close' once its body is read
+  res.on('close', close);
+  // Before subscribing: a symbol already polled delivers its snapshot at once
+  send('subscribed', { symbols });
+  try {
+    for (const symbol of symbols as string[]) {
+      unsubscribes.push(quoteHub.subscribe(symbol, (event) => res.write(quoteFrame(event))));
+    }
+    // Closed while the rate limiter was consulted; nothing will call close() now
+    if (res.destroyed) close();
+  } catch (error) {
+    send('error', { message: (error as Error).message });
+    close();
+    res.end();
+    return;
+  }
+});
+
+export const mcpCacheStats = functions.https.onCall(async (data, context) => {
+  if (!context.auth) throw new functions.https.HttpsError('unauthenticated', 'Must be authenticated.');
+  // Lets the harness simulate a cold instance; never honoured outside the emulator
+  if (data?.flushLocal) {
+    if (process.env.FUNCTIONS_EMULATOR !== 'true') {
+      throw new functions.https.HttpsError('permission-denied', 'flushLocal is only available in the emulator.');
+    }
+    marketDataCache.clearLocal();
+    aiResultCache.clearLocal();
+    pdfCache.clearLocal();
+    priceHistoryStore.clearLocal();
+    filingIndex.clearLocal();
+  }
+  return {
+    marketData: marketDataCache.stats(),
+    aiResults: aiResultCache.stats(),
+    pdf: pdfCache.stats(),
+    priceHistory: priceHistoryStore.stats(),
+    secFilings: filingIndex.stats(),
+    realtime: realtimeStats(),
+    openAIRateLimits
+  };
+});
+
+// Raw bytes of a PDF rendered by mcpCallTool('generate_report') or
+// generateReport, by the `pdfHash` they return. The hash names the content,
+// so it doubles as a strong ETag and the response never changes.
+export const downloadReportPdf = onRequest({ cors: true }, async (req, res) => {
+  const uid = await verifyRequestUser(req, res);
+  if (!uid) return;
+
+  const hash = String(req.query.hash || '');
+  if (!/^[0-9a-f]{64}$/.test(hash)) {
+    res.status(400).json({ error: 'Provide the 64-character hex "hash" of a rendered PDF.' });
+    return;
+  }
+  const etag = `"${hash}"`;
+  if (req.headers['if-none-match'] === etag) {
+    res.status(304).end();
+    return;
+  }
+  const pdf = await pdfCache.get(hash);
+  if (!pdf) {
+    res.status(404).json({ error: 'Unknown or expired PDF; generate the report again.' });
+    return;
+  }
+  res.set({
+    'Content-Type': 'application/pdf',
+    'Content-Length': String(pdf.length),
+    'Cache-Control': 'private, max-age=31536000, immutable',
+    'ETag': etag
+  });
+  res.end(pdf);
+});
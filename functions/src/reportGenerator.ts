@@ -1,72 +1,107 @@
 import * as functions from "firebase-functions";
 import * as logger from "firebase-functions/logger";
 import { onCall } from 'firebase-functions/v2/https';
-import { PDFDocument, rgb, StandardFonts } from 'pdf-lib';
+import { pdfCache, pdfResult } from './utils/pdfCache';
+import { PdfLayout, TableColumn } from './utils/pdfLayout';
+import { enforceRateLimit } from './utils/rateLimiter';
 
+const PRICE_COLUMNS: TableColumn[] = [
+  { header: 'Date', width: 90 },
+  { header: 'Open', width: 80, align: 'right' },
+  { header: 'High', width: 80, align: 'right' },
+  { header: 'Low', width: 80, align: 'right' },
+  { header: 'Close', width: 80, align: 'right' },
+  { header: 'Volume', width: 100, align: 'right' }
+];
+
+const price = (n: any) => (typeof n === 'number' && isFinite(n) ? n.toFixed(2) : String(n ?? ''));
+
+async function renderReport(reportData: any): Promise<Uint8Array> {
+  const layout = await PdfLayout.create();
+
+  layout.heading(`Due Diligence Report: ${reportData.companyName || 'Unknown Company'}`, 18);
+  layout.space(20);
+
+  if (reportData.ticker) {
+    layout.text(`Ticker: ${reportData.ticker}`);
+  }
+  // Only the hashed report data's own timestamp: the cached document outlives the render time
+  layout.text(`Generated At: ${reportData.generatedAt ? new Date(reportData.generatedAt).toLocaleString() : 'N/A'}`);
+  layout.space(20);
+
+  if (reportData.executiveSummary) {
+    layout.heading('Executive Summary');
+    layout.text(reportData.executiveSummary);
+    layout.space(20);
+  }
+
+  if (reportData.recommendation) {
+    layout.heading('Recommendation');
+    layout.text(`${reportData.recommendation} (Confidence: ${reportData.confidence || 'N/A'}%)`);
+    layout.space(20);
+  }
+
+  if (reportData.riskRating) {
+    layout.heading('Risk Rating');
+    layout.text(reportData.riskRating);
+    layout.space(20);
+  }
+
+  if (reportData.keyFindings && Array.isArray(reportData.keyFindings)) {
+    layout.heading('Key Findings');
+    layout.bullets(reportData.keyFindings);
+    layout.space(20);
+  }
+
+  if (Array.isArray(reportData.concerns) && reportData.concerns.length) {
+    layout.heading('Concerns');
+    layout.bullets(reportData.concerns);
+    layout.space(20);
+  }
+
+  if (Array.isArray(reportData.news) && reportData.news.length) {
+    layout.heading('News');
+    layout.bullets(reportData.news.map((n: any) =>
+      typeof n === 'string' ? n : `${n.title} (${n.source || 'Unknown'}, ${n.publishedAt || 'n/a'})`));
+    layout.space(20);
+  }
+
+  if (Array.isArray(reportData.priceHistory) && reportData.priceHistory.length) {
+    layout.heading('Price History');
+    layout.table(PRICE_COLUMNS, reportData.priceHistory.map((bar: any) => [
+      bar.date, price(bar.open), price(bar.high), price(bar.low), price(bar.close),
+      typeof bar.volume === 'number' ? bar.volume.toLocaleString('en-US') : String(bar.volume ?? '')
+    ]));
+  }
+
+  return layout.save();
+}
+
+// reportData may also carry concerns, news and priceHistory ({ date, open, high,
+// low, close, volume } bars), laid out over as many pages as they need.
+// Returns { pdf (base64), pdfHash, bytes }, or with format: 'binary' only the
+// hash for downloading the bytes from downloadReportPdf. Every new payload is
+// rendered and stored, so callers must be signed in and count against the
+// per-user rate limit.
 export const generateReport = onCall(async (request) => {
+  if (!request.auth) throw new functions.https.HttpsError('unauthenticated', 'Must be authenticated.');
+  await enforceRateLimit(request.auth.uid);
+  const { reportData, format } = request.data;
+
+  if (!reportData) {
+    throw new functions.https.HttpsError('invalid-argument', 'Report data is required');
+  }
+
   try {
-    const { reportData } = request.data;
-
-    if (!reportData) {
-      throw new functions.https.HttpsError('invalid-argument', 'Report data is required');
-    }
-
-    const pdfDoc = await PDFDocument.create();
-    const page = pdfDoc.addPage();
-
-    const { height } = page.getSize();
-    const font = await pdfDoc.embedFont(StandardFonts.Helvetica);
-    const fontSize = 12;
-
-    let y = height - 40;
-
-    const drawText = (text: string, x: number, yPos: number, size = fontSize) => {
-      page.drawText(text, { x, y: yPos, font, size, color: rgb(0, 0, 0) });
-      return size + 5;
-    };
-
-    y -= drawText(`Due Diligence Report: ${reportData.companyName || 'Unknown Company'}`, 50, y, 18);
-    y -= 20;
-
-    if (reportData.ticker) {
-      y -= drawText(`Ticker: ${reportData.ticker}`, 50, y);
-    }
-    y -= drawText(`Generated At: ${new Date(reportData.generatedAt || Date.now()).toLocaleString()}`, 50, y);
-    y -= 20;
-
-    if (reportData.executiveSummary) {
-      y -= drawText('Executive Summary', 50, y, 14);
-      y -= drawText(reportData.executiveSummary, 50, y);
-      y -= 20;
-    }
-
-    if (reportData.recommendation) {
-      y -= drawText('Recommendation', 50, y, 14);
-      y -= drawText(`${reportData.recommendation} (Confidence: ${reportData.confidence || 'N/A'}%)`, 50, y);
-      y -= 20;
-    }
-
-    if (reportData.riskRating) {
-      y -= drawText('Risk Rating', 50, y, 14);
-      y -= drawText(reportData.riskRating, 50, y);
-      y -= 20;
-    }
-
-    if (reportData.keyFindings && Array.isArray(reportData.keyFindings)) {
-      y -= drawText('Key Findings', 50, y, 14);
-      reportData.keyFindings.forEach((finding: string) => {
-        y -= drawText(`- ${finding}`, 60, y);
-      });
-    }
-
-    const pdfBytes = await pdfDoc.save();
+    const rendered = await pdfCache.render('report', reportData, () => renderReport(reportData));
 
     logger.info('PDF report generated successfully', { 
       companyName: reportData.companyName,
-      size: pdfBytes.length 
+      size: rendered.pdf.length,
+      pdfHash: rendered.hash
     });
 
-    return { pdf: Buffer.from(pdfBytes).toString('base64') };
+    return pdfResult(rendered, format);
   } catch (error) {
     logger.error('Error generating PDF report:', error as Error);
     throw new functions.https.HttpsError('internal', 'Failed to generate PDF report');
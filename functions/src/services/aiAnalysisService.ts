@@ -1,5 +1,9 @@
-import axios from 'axios';
+import { createHash } from 'crypto';
 import * as functions from 'firebase-functions';
+import { TechnicalAnalytics } from '../utils/analytics';
+import { aiResultCache } from '../utils/lruCache';
+import { OPENAI_CHAT_URL, openAI } from '../utils/upstreams';
+import { forEachConcurrent } from '../utils/workerPool';
 
 interface SentimentAnalysis {
   score: number; // -1 to 1
@@ -20,6 +24,29 @@ interface RiskAssessment {
   concerns: string[];
 }
 
+export interface AIRequestOptions {
+  // false skips the cached result and replaces it with a fresh completion
+  allowCached?: boolean;
+}
+
+export interface SentimentRequest {
+  id: string; // echoed back by the model to match results to companies
+  companyName: string;
+  newsArticles: string[];
+}
+
+export interface SentimentBatchOptions extends AIRequestOptions {
+  batchSize?: number; // companies per completion; 1 sends each through analyzeSentiment
+  concurrency?: number; // completions in flight
+}
+
+const SENTIMENT_ARTICLES = 5;
+export const SENTIMENT_BATCH_SIZE = 8;
+export const SENTIMENT_MAX_BATCH_SIZE = 20;
+const SENTIMENT_BATCH_CONCURRENCY = 4;
+const SENTIMENT_TOKENS_PER_COMPANY = 120;
+const SENTIMENT_BATCH_ROUNDS = 2; // the first pass, then one for companies the model left out
+
 interface AIRecommendation {
   action: 'buy' | 'hold' | 'sell';
   confidence: number;
@@ -28,14 +55,50 @@ interface AIRecommendation {
   timeHorizon: string;
 }
 
+// Baseline regulatory exposure by Alpha Vantage sector; 50 for the rest
+const SECTOR_REGULATORY_RISK: Record<string, number> = {
+  'FINANCIAL SERVICES': 70,
+  'HEALTHCARE': 70,
+  'UTILITIES': 65,
+  'ENERGY': 60,
+  'COMMUNICATION SERVICES': 55,
+  'TECHNOLOGY': 45,
+  'CONSUMER CYCLICAL': 40,
+  'CONSUMER DEFENSIVE': 40
+};
+
 export class AIAnalysisService {
   private openaiKey: string;
+  private cacheTTL = 6 * 60 * 60 * 1000; // 6 hours
 
   constructor() {
     this.openaiKey = functions.config().openai?.key || process.env.OPENAI_API_KEY || '';
   }
 
-  async analyzeSentiment(companyName: string, newsArticles: string[]): Promise<SentimentAnalysis> {
+  /**
+   * Sends a chat completion and parses its content, caching the parsed result
+   * under a hash of the whole request body. The prompt embeds every input (news
+   * titles, quote, overview, financials), so unchanged inputs skip the model
+   * call; failures throw and are never cached.
+   */
+  private completion<T>(kind: string, body: object, parse: (content: string) => T, options: AIRequestOptions): Promise<T> {
+    const cacheKey = `${kind}_${createHash('sha256').update(JSON.stringify(body)).digest('hex')}`;
+    const request = async () => {
+      const response = await openAI.post(OPENAI_CHAT_URL, body, {
+        headers: {
+          'Authorization': `Bearer ${this.openaiKey}`,
+          'Content-Type': 'application/json'
+        },
+        timeout: 30000
+      });
+      const result = parse(response.data.choices[0].message.content);
+      aiResultCache.set(cacheKey, result, this.cacheTTL);
+      return result;
+    };
+    return options.allowCached === false ? request() : aiResultCache.load(cacheKey, request);
+  }
+
+  async analyzeSentiment(companyName: string, newsArticles: string[], options: AIRequestOptions = {}): Promise<SentimentAnalysis> {
     if (!this.openaiKey) {
       // Fallback to simple sentiment analysis
       return this.simpleSentimentAnalysis(newsArticles);
@@ -51,39 +114,142 @@ export class AIAnalysisService {
       
       Respond in JSON format: { "score": number, "label": string, "confidence": number, "themes": string[] }`;
 
-      const response = await axios.post(
-        'https://api.openai.com/v1/chat/completions',
-        {
-          model: 'gpt-4',
-          messages: [
-            { role: 'system', content: 'You are a financial analyst expert in sentiment analysis.' },
-            { role: 'user', content: prompt }
-          ],
-          temperature: 0.3,
-          max_tokens: 500
-        },
-        {
-          headers: {
-            'Authorization': `Bearer ${this.openaiKey}`,
-            'Content-Type': 'application/json'
-          },
-          timeout: 30000
-        }
-      );
-
-      const result = JSON.parse(response.data.choices[0].message.content);
-      return {
-        score: result.score,
-        label: result.label,
-        confidence: result.confidence,
-        sources: result.themes || []
-      };
+      return await this.completion('sentiment', {
+        model: 'gpt-4',
+        messages: [
+          { role: 'system', content: 'You are a financial analyst expert in sentiment analysis.' },
+          { role: 'user', content: prompt }
+        ],
+        temperature: 0.3,
+        max_tokens: 500
+      }, (content): SentimentAnalysis => {
+        const result = JSON.parse(content);
+        return {
+          score: result.score,
+          label: result.label,
+          confidence: result.confidence,
+          sources: result.themes || []
+        };
+      }, options);
     } catch (error) {
       console.error('Error in AI sentiment analysis:', error);
       return this.simpleSentimentAnalysis(newsArticles);
     }
   }
 
+  /**
+   * Sentiment for many companies, packing up to `batchSize` of them into one
+   * structured completion so the instructions go out once per batch and each
+   * company comes back under its id. At most `concurrency` batches are in
+   * flight; rate-limited calls are retried by the OpenAI client. Results are
+   * also cached per company (name and articles), locally and in the shared
+   * Firestore tier, so a company analyzed before is not re-sent whatever batch
+   * it lands in. Companies the model leaves out are sent again together, once.
+   * A batch that still fails costs no further calls: its companies get the
+   * keyword analysis and are listed as `unanswered`.
+   */
+  async analyzeSentimentBatch(
+    requests: SentimentRequest[],
+    options: SentimentBatchOptions = {}
+  ): Promise<{ results: Record<string, SentimentAnalysis>; batches: number; unanswered: string[] }> {
+    const results: Record<string, SentimentAnalysis> = {};
+    const concurrency = options.concurrency || SENTIMENT_BATCH_CONCURRENCY;
+    const batchSize = Math.min(SENTIMENT_MAX_BATCH_SIZE, Math.max(1, Math.floor(options.batchSize || SENTIMENT_BATCH_SIZE)));
+    if (!this.openaiKey || batchSize === 1) {
+      await forEachConcurrent(requests, concurrency, async (request) => {
+        results[request.id] = await this.analyzeSentiment(request.companyName, request.newsArticles, options);
+      });
+      return { results, batches: this.openaiKey ? requests.length : 0, unanswered: [] };
+    }
+
+    // Uncached companies keep request order, so the same list packs into the same (cacheable) batches
+    const missing: boolean[] = new Array(requests.length);
+    await forEachConcurrent(requests, concurrency * batchSize, async (request, index) => {
+      const cached = options.allowCached === false ? undefined : await aiResultCache.lookup(this.sentimentItemKey(request));
+      if (cached && !cached.stale) results[request.id] = cached.value;
+      else missing[index] = true;
+    });
+    let pending = requests.filter((_, index) => missing[index]);
+
+    let batches = 0;
+    const unanswered: SentimentRequest[] = [];
+    for (let round = 0; round < SENTIMENT_BATCH_ROUNDS && pending.length; round++) {
+      const chunks: SentimentRequest[][] = [];
+      for (let i = 0; i < pending.length; i += batchSize) chunks.push(pending.slice(i, i + batchSize));
+      batches += chunks.length;
+      const omitted: SentimentRequest[] = [];
+      await forEachConcurrent(chunks, concurrency, async (chunk) => {
+        let answered: Record<string, SentimentAnalysis>;
+        try {
+          answered = await this.sentimentBatch(chunk, options);
+        } catch (error) {
+          console.error('Error in batched AI sentiment analysis:', error);
+          unanswered.push(...chunk);
+          return;
+        }
+        for (const request of chunk) {
+          const result = answered[request.id];
+          if (!result) {
+            omitted.push(request);
+            continue;
+          }
+          aiResultCache.set(this.sentimentItemKey(request), result, this.cacheTTL);
+          results[request.id] = result;
+        }
+      });
+      pending = omitted;
+    }
+
+    unanswered.push(...pending);
+    for (const request of unanswered) results[request.id] = this.simpleSentimentAnalysis(request.newsArticles);
+    return { results, batches, unanswered: unanswered.map((request) => request.id) };
+  }
+
+  private sentimentItemKey(request: SentimentRequest): string {
+    const inputs = JSON.stringify([request.companyName, request.newsArticles.slice(0, SENTIMENT_ARTICLES)]);
+    return `sentiment_item_${createHash('sha256').update(inputs).digest('hex')}`;
+  }
+
+  private sentimentBatch(batch: SentimentRequest[], options: AIRequestOptions): Promise<Record<string, SentimentAnalysis>> {
+    const companies = batch.map((request) => ({
+      id: request.id,
+      company: request.companyName,
+      articles: request.newsArticles.slice(0, SENTIMENT_ARTICLES)
+    }));
+    const prompt = `Analyze the sentiment of the news articles about each company below.
+      For each company provide a sentiment score from -1 (very negative) to 1 (very positive),
+      a label (positive/negative/neutral), confidence level (0-1) and key themes.
+
+      Respond in JSON format, with one result per company id:
+      { "results": [{ "id": string, "score": number, "label": string, "confidence": number, "themes": string[] }] }
+
+      Companies (JSON):
+      ${JSON.stringify(companies)}`;
+
+    return this.completion('sentiment_batch', {
+      model: 'gpt-4',
+      messages: [
+        { role: 'system', content: 'You are a financial analyst expert in sentiment analysis.' },
+        { role: 'user', content: prompt }
+      ],
+      temperature: 0.3,
+      max_tokens: SENTIMENT_TOKENS_PER_COMPANY * batch.length
+    }, (content) => {
+      const ids = new Set(batch.map((request) => request.id));
+      const parsed: Record<string, SentimentAnalysis> = {};
+      for (const result of JSON.parse(content).results || []) {
+        if (!ids.has(result?.id) || typeof result.score !== 'number') continue;
+        parsed[result.id] = {
+          score: Math.max(-1, Math.min(1, result.score)),
+          label: result.label,
+          confidence: result.confidence,
+          sources: result.themes || []
+        };
+      }
+      return parsed;
+    }, options);
+  }
+
   private simpleSentimentAnalysis(articles: string[]): SentimentAnalysis {
     const positiveWords = ['growth', 'profit', 'increase', 'strong', 'success', 'gain', 'positive', 'beat', 'exceed'];
     const negativeWords = ['loss', 'decline', 'decrease', 'weak', 'fail', 'drop', 'negative', 'miss', 'concern'];
@@ -116,8 +282,16 @@ export class AIAnalysisService {
     };
   }
 
+  /**
+   * Scores risk from fundamentals and, when `companyData.analytics` is set
+   * (see FinancialDataService.getAnalytics), from the price history: realized
+   * volatility, beta measured against the benchmark, last-year drawdown and
+   * the 200-day trend. Without analytics volatility is unknown and scored
+   * as middling, and the overview's beta is used.
+   */
   async assessRisk(companyData: any): Promise<RiskAssessment> {
-    const { financials, overview, quote } = companyData;
+    const { financials, overview } = companyData;
+    const analytics: TechnicalAnalytics | undefined = companyData.analytics;
 
     // Financial risk factors
     const debtToEquity = financials.debtToEquity || 0;
@@ -127,16 +301,17 @@ export class AIAnalysisService {
     const financialRisk = this.calculateFinancialRisk(debtToEquity, currentRatio, profitMargin);
 
     // Market risk factors
-    const beta = overview.beta || 1;
-    const volatility = Math.abs(quote.changePercent) || 0;
+    const beta = analytics?.beta ?? (overview.beta || 1);
+    // Annualized percent, or null without a price history: one day's move says nothing about it
+    const volatility = analytics?.volatility ?? null;
+    const drawdown = analytics?.maxDrawdown1y || 0;
+    const belowTrend = !!analytics?.sma200 && analytics.close < analytics.sma200;
 
-    const marketRisk = this.calculateMarketRisk(beta, volatility);
+    const marketRisk = this.calculateMarketRisk(beta, volatility, drawdown, belowTrend);
 
-    // Operational risk (simplified)
-    const operationalRisk = 50; // Default medium risk
+    const operationalRisk = this.calculateOperationalRisk(financials);
 
-    // Regulatory risk (simplified)
-    const regulatoryRisk = 50; // Default medium risk
+    const regulatoryRisk = SECTOR_REGULATORY_RISK[String(overview.sector || '').toUpperCase()] ?? 50;
 
     const overallRiskScore = (financialRisk + marketRisk + operationalRisk + regulatoryRisk) / 4;
 
@@ -145,6 +320,12 @@ export class AIAnalysisService {
     if (currentRatio < 1) concerns.push('Low current ratio - liquidity concerns');
     if (profitMargin < 5) concerns.push('Low profit margins');
     if (beta > 1.5) concerns.push('High market volatility');
+    if (volatility != null && volatility > 40) concerns.push(`High realized volatility (${volatility.toFixed(0)}% annualized)`);
+    if (drawdown > 25) concerns.push(`Deep drawdown in the last year (${drawdown.toFixed(0)}% peak to trough)`);
+    if (belowTrend) concerns.push('Trading below its 200-day moving average');
+    if (analytics?.rsi14 != null && analytics.rsi14 > 70) concerns.push(`Overbought (RSI ${analytics.rsi14.toFixed(0)})`);
+    if (analytics?.rsi14 != null && analytics.rsi14 < 30) concerns.push(`Oversold (RSI ${analytics.rsi14.toFixed(0)})`);
+    if (financials.operatingCashFlow < 0) concerns.push('Negative operating cash flow');
 
     return {
       overallRisk: overallRiskScore < 40 ? 'low' : overallRiskScore < 70 ? 'medium' : 'high',
@@ -178,7 +359,7 @@ export class AIAnalysisService {
     return Math.min(risk, 100);
   }
 
-  private calculateMarketRisk(beta: number, volatility: number): number {
+  private calculateMarketRisk(beta: number, volatility: number | null, drawdown: number, belowTrend: boolean): number {
     let risk = 0;
 
     // Beta risk
@@ -186,14 +367,44 @@ export class AIAnalysisService {
     else if (beta > 1.5) risk += 25;
     else if (beta > 1) risk += 10;
 
-    // Volatility risk
-    if (volatility > 5) risk += 30;
-    else if (volatility > 3) risk += 15;
+    // Volatility risk (annualized %); unknown counts as middling
+    if (volatility == null) risk += 10;
+    else if (volatility > 60) risk += 30;
+    else if (volatility > 40) risk += 20;
+    else if (volatility > 25) risk += 10;
+
+    // Drawdown risk (last year, %)
+    if (drawdown > 40) risk += 20;
+    else if (drawdown > 25) risk += 10;
+
+    if (belowTrend) risk += 10;
 
     return Math.min(risk, 100);
   }
 
-  async generateRecommendation(companyData: any, sentiment: SentimentAnalysis, risk: RiskAssessment): Promise<AIRecommendation> {
+  private calculateOperationalRisk(financials: any): number {
+    let risk = 20;
+
+    // Earnings not backed by cash
+    const operatingCashFlow = financials.operatingCashFlow || 0;
+    const netIncome = financials.netIncome || 0;
+    if (operatingCashFlow < 0) risk += 40;
+    else if (netIncome > 0 && operatingCashFlow < netIncome * 0.8) risk += 20;
+
+    if ((financials.returnOnEquity || 0) < 0) risk += 20;
+
+    // Statements we could not read are unknowns, not good news
+    if (financials.missingStatements?.length) risk += 10 * financials.missingStatements.length;
+
+    return Math.min(risk, 100);
+  }
+
+  async generateRecommendation(
+    companyData: any,
+    sentiment: SentimentAnalysis,
+    risk: RiskAssessment,
+    options: AIRequestOptions = {}
+  ): Promise<AIRecommendation> {
     const { quote, overview, financials } = companyData;
 
     if (!this.openaiKey) {
@@ -216,27 +427,15 @@ export class AIAnalysisService {
       Provide: action (buy/hold/sell), confidence (0-1), reasoning (array of strings), target price, and time horizon.
       Respond in JSON format.`;
 
-      const response = await axios.post(
-        'https://api.openai.com/v1/chat/completions',
-        {
-          model: 'gpt-4',
-          messages: [
-            { role: 'system', content: 'You are an expert financial analyst providing investment recommendations.' },
-            { role: 'user', content: prompt }
-          ],
-          temperature: 0.3,
-          max_tokens: 800
-        },
-        {
-          headers: {
-            'Authorization': `Bearer ${this.openaiKey}`,
-            'Content-Type': 'application/json'
-          },
-          timeout: 30000
-        }
-      );
-
-      return JSON.parse(response.data.choices[0].message.content);
+      return await this.completion('recommendation', {
+        model: 'gpt-4',
+        messages: [
+          { role: 'system', content: 'You are an expert financial analyst providing investment recommendations.' },
+          { role: 'user', content: prompt }
+        ],
+        temperature: 0.3,
+        max_tokens: 800
+      }, (content): AIRecommendation => JSON.parse(content), options);
     } catch (error) {
       console.error('Error generating AI recommendation:', error);
       return this.simpleRecommendation(quote, sentiment, risk);
@@ -1,5 +1,8 @@
-import axios from 'axios';
 import * as functions from 'firebase-functions';
+import { computeAnalytics, TechnicalAnalytics } from '../utils/analytics';
+import { marketDataCache } from '../utils/lruCache';
+import { DailyBar, latestBars, PriceHistory, priceHistoryStore } from '../utils/priceHistory';
+import { ALPHA_VANTAGE_URL, alphaVantage } from '../utils/upstreams';
 
 interface StockQuote {
   symbol: string;
@@ -13,6 +16,7 @@ interface StockQuote {
   low: number;
   open: number;
   previousClose: number;
+  latestTradingDay: string; // the session the prices are from, YYYY-MM-DD
 }
 
 interface CompanyOverview {
@@ -41,36 +45,35 @@ interface FinancialMetrics {
   currentRatio: number;
   returnOnEquity: number;
   profitMargin: number;
+  missingStatements?: string[];
 }
 
 export class FinancialDataService {
   private alphaVantageKey: string;
-  private cache: Map<string, { data: any; timestamp: number }> = new Map();
   private cacheTTL = 15 * 60 * 1000; // 15 minutes
+  // Keyed by the last bar's date, so a day is the longest an entry can be useful
+  private analyticsTTL = 24 * 60 * 60 * 1000;
+  private benchmarkSymbol = process.env.ANALYTICS_BENCHMARK || 'SPY';
 
   constructor() {
     this.alphaVantageKey = functions.config().alphavantage?.key || process.env.ALPHA_VANTAGE_API_KEY || 'demo';
   }
 
-  private getCached(key: string): any | null {
-    const cached = this.cache.get(key);
-    if (cached && Date.now() - cached.timestamp < this.cacheTTL) {
-      return cached.data;
-    }
-    return null;
-  }
-
   private setCache(key: string, data: any): void {
-    this.cache.set(key, { data, timestamp: Date.now() });
+    marketDataCache.set(key, data, this.cacheTTL);
   }
 
   async getStockQuote(symbol: string): Promise<StockQuote> {
-    const cacheKey = `quote_${symbol}`;
-    const cached = this.getCached(cacheKey);
-    if (cached) return cached;
+    return marketDataCache.load(`quote_${symbol}`, () => this.refreshStockQuote(symbol));
+  }
 
+  /**
+   * Fetches a current quote regardless of the cache, then caches it; the
+   * realtime pollers use this so cached reports see the prices they push.
+   */
+  async refreshStockQuote(symbol: string): Promise<StockQuote> {
     try {
-      const response = await axios.get('https://www.alphavantage.co/query', {
+      const response = await alphaVantage.get(ALPHA_VANTAGE_URL, {
         params: {
           function: 'GLOBAL_QUOTE',
           symbol: symbol.toUpperCase(),
@@ -95,10 +98,11 @@ export class FinancialDataService {
         high: parseFloat(quote['03. high']),
         low: parseFloat(quote['04. low']),
         open: parseFloat(quote['02. open']),
-        previousClose: parseFloat(quote['08. previous close'])
+        previousClose: parseFloat(quote['08. previous close']),
+        latestTradingDay: quote['07. latest trading day']
       };
 
-      this.setCache(cacheKey, result);
+      this.setCache(`quote_${symbol}`, result);
       return result;
     } catch (error) {
       console.error('Error fetching stock quote:', error);
@@ -108,159 +112,179 @@ export class FinancialDataService {
 
   async getCompanyOverview(symbol: string): Promise<CompanyOverview> {
     const cacheKey = `overview_${symbol}`;
-    const cached = this.getCached(cacheKey);
-    if (cached) return cached;
-
-    try {
-      const response = await axios.get('https://www.alphavantage.co/query', {
-        params: {
-          function: 'OVERVIEW',
-          symbol: symbol.toUpperCase(),
-          apikey: this.alphaVantageKey
-        },
-        timeout: 10000
-      });
-
-      const data = response.data;
-      if (!data || Object.keys(data).length === 0 || data.Note) {
-        throw new Error(`No overview data found for symbol: ${symbol}`);
+    return marketDataCache.load(cacheKey, async () => {
+      try {
+        const response = await alphaVantage.get(ALPHA_VANTAGE_URL, {
+          params: {
+            function: 'OVERVIEW',
+            symbol: symbol.toUpperCase(),
+            apikey: this.alphaVantageKey
+          },
+          timeout: 10000
+        });
+
+        const data = response.data;
+        if (!data || Object.keys(data).length === 0 || data.Note) {
+          throw new Error(`No overview data found for symbol: ${symbol}`);
+        }
+
+        const result: CompanyOverview = {
+          symbol: data.Symbol,
+          name: data.Name,
+          description: data.Description,
+          sector: data.Sector,
+          industry: data.Industry,
+          marketCap: parseFloat(data.MarketCapitalization) || 0,
+          peRatio: parseFloat(data.PERatio) || 0,
+          dividendYield: parseFloat(data.DividendYield) || 0,
+          eps: parseFloat(data.EPS) || 0,
+          beta: parseFloat(data.Beta) || 0,
+          week52High: parseFloat(data['52WeekHigh']) || 0,
+          week52Low: parseFloat(data['52WeekLow']) || 0
+        };
+
+        this.setCache(cacheKey, result);
+        return result;
+      } catch (error) {
+        console.error('Error fetching company overview:', error);
+        throw new functions.https.HttpsError('unavailable', `Failed to fetch company overview for ${symbol}`);
       }
-
-      const result: CompanyOverview = {
-        symbol: data.Symbol,
-        name: data.Name,
-        description: data.Description,
-        sector: data.Sector,
-        industry: data.Industry,
-        marketCap: parseFloat(data.MarketCapitalization) || 0,
-        peRatio: parseFloat(data.PERatio) || 0,
-        dividendYield: parseFloat(data.DividendYield) || 0,
-        eps: parseFloat(data.EPS) || 0,
-        beta: parseFloat(data.Beta) || 0,
-        week52High: parseFloat(data['52WeekHigh']) || 0,
-        week52Low: parseFloat(data['52WeekLow']) || 0
-      };
-
-      this.setCache(cacheKey, result);
-      return result;
-    } catch (error) {
-      console.error('Error fetching company overview:', error);
-      throw new functions.https.HttpsError('unavailable', `Failed to fetch company overview for ${symbol}`);
-    }
+    });
   }
 
   async getFinancialMetrics(symbol: string): Promise<FinancialMetrics> {
     const cacheKey = `metrics_${symbol}`;
-    const cached = this.getCached(cacheKey);
-    if (cached) return cached;
-
-    try {
-      // Fetch income statement
-      const incomeResponse = await axios.get('https://www.alphavantage.co/query', {
-        params: {
-          function: 'INCOME_STATEMENT',
-          symbol: symbol.toUpperCase(),
-          apikey: this.alphaVantageKey
-        },
-        timeout: 10000
-      });
-
-      // Fetch balance sheet
-      const balanceResponse = await axios.get('https://www.alphavantage.co/query', {
-        params: {
-          function: 'BALANCE_SHEET',
-          symbol: symbol.toUpperCase(),
-          apikey: this.alphaVantageKey
-        },
-        timeout: 10000
-      });
-
-      // Fetch cash flow
-      const cashFlowResponse = await axios.get('https://www.alphavantage.co/query', {
-        params: {
-          function: 'CASH_FLOW',
-          symbol: symbol.toUpperCase(),
-          apikey: this.alphaVantageKey
-        },
-        timeout: 10000
-      });
-
-      const latestIncome = incomeResponse.data.annualReports?.[0];
-      const latestBalance = balanceResponse.data.annualReports?.[0];
-      const latestCashFlow = cashFlowResponse.data.annualReports?.[0];
-
-      if (!latestIncome || !latestBalance || !latestCashFlow) {
-        throw new Error(`Incomplete financial data for symbol: ${symbol}`);
+    return marketDataCache.load(cacheKey, async () => {
+      try {
+        // Fetch income statement, balance sheet and cash flow concurrently
+        const statements = ['INCOME_STATEMENT', 'BALANCE_SHEET', 'CASH_FLOW'];
+        const responses = await Promise.allSettled(statements.map((statement) =>
+          alphaVantage.get(ALPHA_VANTAGE_URL, {
+            params: {
+              function: statement,
+              symbol: symbol.toUpperCase(),
+              apikey: this.alphaVantageKey
+            },
+            timeout: 10000
+          })
+        ));
+
+        const reports = responses.map((response) =>
+          response.status === 'fulfilled' ? response.value.data.annualReports?.[0] : undefined
+        );
+        const [latestIncome, latestBalance, latestCashFlow] = reports;
+        const missingStatements = statements.filter((_, i) => !reports[i]);
+
+        if (missingStatements.length === statements.length) {
+          throw new Error(`No financial data for symbol: ${symbol}`);
+        }
+
+        const income = latestIncome || {};
+        const balance = latestBalance || {};
+        const totalAssets = parseFloat(balance.totalAssets) || 0;
+        const totalLiabilities = parseFloat(balance.totalLiabilities) || 0;
+        const shareholderEquity = parseFloat(balance.totalShareholderEquity) || 0;
+        const revenue = parseFloat(income.totalRevenue) || 0;
+        const netIncome = parseFloat(income.netIncome) || 0;
+
+        const result: FinancialMetrics = {
+          revenue,
+          netIncome,
+          operatingCashFlow: parseFloat(latestCashFlow?.operatingCashflow) || 0,
+          totalAssets,
+          totalLiabilities,
+          shareholderEquity,
+          debtToEquity: totalLiabilities / shareholderEquity || 0,
+          currentRatio: parseFloat(balance.totalCurrentAssets) / parseFloat(balance.totalCurrentLiabilities) || 0,
+          returnOnEquity: (netIncome / shareholderEquity) * 100 || 0,
+          profitMargin: (netIncome / revenue) * 100 || 0
+        };
+
+        // Partial results are returned but not cached so the next call retries the missing statements
+        if (missingStatements.length) {
+          console.warn(`Partial financial data for ${symbol}, missing: ${missingStatements.join(', ')}`);
+          result.missingStatements = missingStatements;
+        } else {
+          this.setCache(cacheKey, result);
+        }
+        return result;
+      } catch (error) {
+        console.error('Error fetching financial metrics:', error);
+        throw new functions.https.HttpsError('unavailable', `Failed to fetch financial metrics for ${symbol}`);
       }
-
-      const totalAssets = parseFloat(latestBalance.totalAssets) || 0;
-      const totalLiabilities = parseFloat(latestBalance.totalLiabilities) || 0;
-      const shareholderEquity = parseFloat(latestBalance.totalShareholderEquity) || 0;
-      const revenue = parseFloat(latestIncome.totalRevenue) || 0;
-      const netIncome = parseFloat(latestIncome.netIncome) || 0;
-
-      const result: FinancialMetrics = {
-        revenue,
-        netIncome,
-        operatingCashFlow: parseFloat(latestCashFlow.operatingCashflow) || 0,
-        totalAssets,
-        totalLiabilities,
-        shareholderEquity,
-        debtToEquity: totalLiabilities / shareholderEquity,
-        currentRatio: parseFloat(latestBalance.totalCurrentAssets) / parseFloat(latestBalance.totalCurrentLiabilities) || 0,
-        returnOnEquity: (netIncome / shareholderEquity) * 100,
-        profitMargin: (netIncome / revenue) * 100
-      };
-
-      this.setCache(cacheKey, result);
-      return result;
-    } catch (error) {
-      console.error('Error fetching financial metrics:', error);
-      throw new functions.https.HttpsError('unavailable', `Failed to fetch financial metrics for ${symbol}`);
-    }
+    });
   }
 
-  async getHistoricalData(symbol: string, period: string = '1y'): Promise<any[]> {
-    const cacheKey = `historical_${symbol}_${period}`;
-    const cached = this.getCached(cacheKey);
-    if (cached) return cached;
-
+  /**
+   * Columnar daily history, adjusted for splits and dividends so returns
+   * derived from it are real: fetched in full once per symbol, then extended
+   * with compact fetches (see PriceHistoryStore). With a `coldFetches`
+   * budget, a symbol no tier holds yet takes one from it and fails with
+   * resource-exhausted once it is spent, so one caller cannot queue an
+   * unbounded number of full fetches behind the shared Alpha Vantage quota.
+   */
+  async getPriceHistory(symbol: string, coldFetches?: { remaining: number }): Promise<PriceHistory> {
+    const upper = symbol.toUpperCase();
     try {
-      const response = await axios.get('https://www.alphavantage.co/query', {
-        params: {
-          function: 'TIME_SERIES_DAILY',
-          symbol: symbol.toUpperCase(),
-          outputsize: period === '1y' ? 'full' : 'compact',
-          apikey: this.alphaVantageKey
-        },
-        timeout: 10000
+      return await priceHistoryStore.get(upper, async (outputsize) => {
+        if (coldFetches && outputsize === 'full') {
+          if (coldFetches.remaining <= 0) {
+            throw new functions.https.HttpsError('resource-exhausted', `Price history for ${upper} is not cached yet.`);
+          }
+          coldFetches.remaining -= 1;
+        }
+        const response = await alphaVantage.get(ALPHA_VANTAGE_URL, {
+          params: {
+            function: 'TIME_SERIES_DAILY_ADJUSTED',
+            symbol: upper,
+            outputsize,
+            apikey: this.alphaVantageKey
+          },
+          timeout: 10000
+        });
+
+        const timeSeries = response.data['Time Series (Daily)'];
+        if (!timeSeries) {
+          throw new Error(`No historical data found for symbol: ${symbol}`);
+        }
+        return timeSeries;
       });
-
-      const timeSeries = response.data['Time Series (Daily)'];
-      if (!timeSeries) {
-        throw new Error(`No historical data found for symbol: ${symbol}`);
-      }
-
-      const result = Object.entries(timeSeries).map(([date, values]: [string, any]) => ({
-        date,
-        open: parseFloat(values['1. open']),
-        high: parseFloat(values['2. high']),
-        low: parseFloat(values['3. low']),
-        close: parseFloat(values['4. close']),
-        volume: parseInt(values['5. volume'])
-      })).slice(0, 365); // Last year of data
-
-      this.setCache(cacheKey, result);
-      return result;
     } catch (error) {
+      if (error instanceof functions.https.HttpsError && error.code === 'resource-exhausted') throw error;
       console.error('Error fetching historical data:', error);
       throw new functions.https.HttpsError('unavailable', `Failed to fetch historical data for ${symbol}`);
     }
   }
 
+  /**
+   * Volatility, drawdowns, beta, moving averages and RSI over the full price
+   * history. Results are cached per symbol and last bar date, so they are
+   * computed once per trading day; beta is left null when the benchmark
+   * history cannot be fetched.
+   */
+  async getAnalytics(symbol: string): Promise<TechnicalAnalytics> {
+    const history = await this.getPriceHistory(symbol);
+    const cacheKey = `analytics_${history.symbol}_${history.dates[history.length - 1] || 'empty'}`;
+    return marketDataCache.load(cacheKey, async () => {
+      const benchmark = history.symbol === this.benchmarkSymbol ? history :
+        await this.getPriceHistory(this.benchmarkSymbol).catch((error) => {
+          console.warn(`Benchmark history unavailable for ${symbol} analytics:`, error);
+          return undefined;
+        });
+      const result = computeAnalytics(history, benchmark);
+      marketDataCache.set(cacheKey, result, this.analyticsTTL);
+      return result;
+    });
+  }
+
+  async getHistoricalData(symbol: string, period: string = '1y'): Promise<DailyBar[]> {
+    const history = await this.getPriceHistory(symbol);
+    return latestBars(history, period === '1y' ? 365 : 100); // Last year, or the compact window
+  }
+
   async searchSymbol(query: string): Promise<any[]> {
     try {
-      const response = await axios.get('https://www.alphavantage.co/query', {
+      const response = await alphaVantage.get(ALPHA_VANTAGE_URL, {
         params: {
           function: 'SYMBOL_SEARCH',
           keywords: query,
@@ -1,5 +1,7 @@
-import axios from 'axios';
 import * as functions from 'firebase-functions';
+import { marketDataCache } from '../utils/lruCache';
+import { cikIndex, filingIndex, latestFilings } from '../utils/secIndex';
+import { ALPHA_VANTAGE_URL, SEC_SUBMISSIONS_URL, SEC_TICKERS_URL, alphaVantage, secEdgar } from '../utils/upstreams';
 
 interface NewsArticle {
   title: string;
@@ -11,62 +13,52 @@ interface NewsArticle {
 }
 
 export class NewsService {
-  private cache: Map<string, { data: any; timestamp: number }> = new Map();
   private cacheTTL = 30 * 60 * 1000; // 30 minutes
 
-  private getCached(key: string): any | null {
-    const cached = this.cache.get(key);
-    if (cached && Date.now() - cached.timestamp < this.cacheTTL) {
-      return cached.data;
-    }
-    return null;
-  }
-
   private setCache(key: string, data: any): void {
-    this.cache.set(key, { data, timestamp: Date.now() });
+    marketDataCache.set(key, data, this.cacheTTL);
   }
 
   async getCompanyNews(companyName: string, symbol: string): Promise<NewsArticle[]> {
     const cacheKey = `news_${symbol}`;
-    const cached = this.getCached(cacheKey);
-    if (cached) return cached;
-
-    try {
-      // Try Alpha Vantage News Sentiment API first
-      const alphaVantageKey = functions.config().alphavantage?.key || process.env.ALPHA_VANTAGE_API_KEY;
+    return marketDataCache.load(cacheKey, async () => {
+      try {
+        // Try Alpha Vantage News Sentiment API first
+        const alphaVantageKey = functions.config().alphavantage?.key || process.env.ALPHA_VANTAGE_API_KEY;
       
-      if (alphaVantageKey && alphaVantageKey !== 'demo') {
-        const response = await axios.get('https://www.alphavantage.co/query', {
-          params: {
-            function: 'NEWS_SENTIMENT',
-            tickers: symbol.toUpperCase(),
-            apikey: alphaVantageKey,
-            limit: 50
-          },
-          timeout: 10000
-        });
-
-        if (response.data.feed && response.data.feed.length > 0) {
-          const articles: NewsArticle[] = response.data.feed.map((item: any) => ({
-            title: item.title,
-            description: item.summary,
-            url: item.url,
-            publishedAt: item.time_published,
-            source: item.source,
-            sentiment: item.overall_sentiment_label
-          }));
-
-          this.setCache(cacheKey, articles);
-          return articles;
+        if (alphaVantageKey && alphaVantageKey !== 'demo') {
+          const response = await alphaVantage.get(ALPHA_VANTAGE_URL, {
+            params: {
+              function: 'NEWS_SENTIMENT',
+              tickers: symbol.toUpperCase(),
+              apikey: alphaVantageKey,
+              limit: 50
+            },
+            timeout: 10000
+          });
+
+          if (response.data.feed && response.data.feed.length > 0) {
+            const articles: NewsArticle[] = response.data.feed.map((item: any) => ({
+              title: item.title,
+              description: item.summary,
+              url: item.url,
+              publishedAt: item.time_published,
+              source: item.source,
+              sentiment: item.overall_sentiment_label
+            }));
+
+            this.setCache(cacheKey, articles);
+            return articles;
+          }
         }
-      }
 
-      // Fallback to mock news if API not available
-      return this.generateMockNews(companyName, symbol);
-    } catch (error) {
-      console.error('Error fetching news:', error);
-      return this.generateMockNews(companyName, symbol);
-    }
+        // Fallback to mock news if API not available
+        return this.generateMockNews(companyName, symbol);
+      } catch (error) {
+        console.error('Error fetching news:', error);
+        return this.generateMockNews(companyName, symbol);
+      }
+    });
   }
 
   private generateMockNews(companyName: string, symbol: string): NewsArticle[] {
@@ -118,40 +110,25 @@ export class NewsService {
     return articles;
   }
 
+  /**
+   * The 10 most recent EDGAR filings for a ticker. The ticker is mapped to
+   * its CIK through the shared index, and filings come from the company's
+   * incrementally updated filing index, so a warm call makes no request.
+   * Tickers EDGAR does not list have no filings; mock filings are only used
+   * while EDGAR itself is unreachable.
+   */
   async getSECFilings(symbol: string): Promise<any[]> {
-    const cacheKey = `sec_${symbol}`;
-    const cached = this.getCached(cacheKey);
-    if (cached) return cached;
-
     try {
-      // SEC EDGAR API
-      const response = await axios.get(
-        `https://data.sec.gov/submissions/CIK${symbol}.json`,
-        {
-          headers: {
-            'User-Agent': 'Aidiligence.pro contact@aidiligence.pro'
-          },
-          timeout: 10000
-        }
+      const cik = await cikIndex.lookup(symbol, async () =>
+        (await secEdgar.get(SEC_TICKERS_URL, { timeout: 10000 })).data
       );
-
-      const filings = response.data.filings?.recent || {};
-      const result = [];
-
-      for (let i = 0; i < Math.min(10, filings.form?.length || 0); i++) {
-        result.push({
-          form: filings.form[i],
-          filingDate: filings.filingDate[i],
-          accessionNumber: filings.accessionNumber[i],
-          primaryDocument: filings.primaryDocument[i]
-        });
-      }
-
-      this.setCache(cacheKey, result);
-      return result;
+      if (!cik) return [];
+      const filings = await filingIndex.get(cik, async () =>
+        (await secEdgar.get(`${SEC_SUBMISSIONS_URL}/CIK${cik}.json`, { timeout: 10000 })).data
+      );
+      return latestFilings(filings, 10);
     } catch (error) {
       console.error('Error fetching SEC filings:', error);
-      // Return mock SEC filings
       return this.generateMockSECFilings(symbol);
     }
   }
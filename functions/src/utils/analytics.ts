@@ -0,0 +1,196 @@
+import { PriceHistory } from './priceHistory';
+
+export const TRADING_DAYS = 252;
+const MOVING_AVERAGES = [20, 50, 200] as const;
+const RSI_PERIOD = 14;
+const RECENT_RETURNS = 10;
+
+/**
+ * Risk and technical indicators for one symbol as of its last bar.
+ * Percentages are in percent (12.5 means 12.5%); indicators that need more
+ * bars than the history has are null.
+ */
+export interface TechnicalAnalytics {
+  symbol: string;
+  asOf: string; // date of the last bar
+  bars: number;
+  close: number;
+  volatility: number | null; // annualized stdev of daily log returns over the last year
+  volatilityFull: number | null; // the same over the whole retained history (up to ten years)
+  maxDrawdown: number; // deepest peak-to-trough fall over the retained history
+  maxDrawdown1y: number;
+  drawdownPeak: string | null;
+  drawdownTrough: string | null;
+  currentDrawdown: number; // below the high of the retained history
+  benchmark: string | null;
+  beta: number | null; // vs `benchmark`, daily log returns over the last year of common dates
+  correlation: number | null;
+  sma20: number | null;
+  sma50: number | null;
+  sma200: number | null;
+  rsi14: number | null; // Wilder's RSI
+  recentReturns: number[]; // last daily simple returns, oldest first
+}
+
+// Running mean and variance (Welford), numerically stable in one pass
+class Moments {
+  count = 0;
+  mean = 0;
+  m2 = 0;
+
+  add(value: number): void {
+    this.count += 1;
+    const delta = value - this.mean;
+    this.mean += delta / this.count;
+    this.m2 += delta * (value - this.mean);
+  }
+
+  variance(): number | null {
+    return this.count > 1 ? this.m2 / (this.count - 1) : null;
+  }
+}
+
+const annualized = (variance: number | null) =>
+  variance === null ? null : Math.sqrt(variance * TRADING_DAYS) * 100;
+
+/**
+ * Every single-series indicator in one pass over the close column: log
+ * returns feed two running variances (retained history and last year), two
+ * running peaks track drawdowns, the moving averages sum only their tail,
+ * and RSI is smoothed as the pass goes. Nothing is allocated per bar.
+ */
+export function computeAnalytics(history: PriceHistory, benchmark?: PriceHistory): TechnicalAnalytics {
+  const { close, dates } = history;
+  const n = history.length;
+  const yearStart = Math.max(0, n - 1 - TRADING_DAYS); // first close of the last year of returns
+
+  const full = new Moments();
+  const year = new Moments();
+  let peak = -Infinity;
+  let peakIndex = 0;
+  let yearPeak = -Infinity;
+  let maxDrawdown = 0;
+  let maxDrawdown1y = 0;
+  let drawdownPeak = -1;
+  let drawdownTrough = -1;
+  const sums = MOVING_AVERAGES.map(() => 0);
+  let avgGain = 0;
+  let avgLoss = 0;
+
+  for (let i = 0; i < n; i++) {
+    const price = close[i];
+    if (price > peak) {
+      peak = price;
+      peakIndex = i;
+    }
+    const drawdown = 1 - price / peak;
+    if (drawdown > maxDrawdown) {
+      maxDrawdown = drawdown;
+      drawdownPeak = peakIndex;
+      drawdownTrough = i;
+    }
+    if (i >= yearStart) {
+      if (price > yearPeak) yearPeak = price;
+      maxDrawdown1y = Math.max(maxDrawdown1y, 1 - price / yearPeak);
+    }
+    for (let w = 0; w < MOVING_AVERAGES.length; w++) {
+      if (i >= n - MOVING_AVERAGES[w]) sums[w] += price;
+    }
+    if (i === 0) continue;
+
+    const r = Math.log(price / close[i - 1]);
+    full.add(r);
+    if (i > yearStart) year.add(r);
+    const change = price - close[i - 1];
+    const gain = change > 0 ? change : 0;
+    const loss = change < 0 ? -change : 0;
+    if (i <= RSI_PERIOD) {
+      // Seed with the simple average of the first RSI_PERIOD changes
+      avgGain += gain / RSI_PERIOD;
+      avgLoss += loss / RSI_PERIOD;
+    } else {
+      avgGain = (avgGain * (RSI_PERIOD - 1) + gain) / RSI_PERIOD;
+      avgLoss = (avgLoss * (RSI_PERIOD - 1) + loss) / RSI_PERIOD;
+    }
+  }
+
+  const recentReturns: number[] = [];
+  for (let i = Math.max(1, n - RECENT_RETURNS); i < n; i++) recentReturns.push(close[i] / close[i - 1] - 1);
+  const [sma20, sma50, sma200] = MOVING_AVERAGES.map((window, w) => (n >= window ? sums[w] / window : null));
+  const relative = benchmark ? betaAgainst(history, benchmark) : { beta: null, correlation: null };
+
+  return {
+    symbol: history.symbol,
+    asOf: n ? dates[n - 1] : '',
+    bars: n,
+    close: n ? close[n - 1] : 0,
+    volatility: annualized(year.variance()),
+    volatilityFull: annualized(full.variance()),
+    maxDrawdown: maxDrawdown * 100,
+    maxDrawdown1y: maxDrawdown1y * 100,
+    drawdownPeak: drawdownPeak >= 0 ? dates[drawdownPeak] : null,
+    drawdownTrough: drawdownTrough >= 0 ? dates[drawdownTrough] : null,
+    currentDrawdown: n ? (1 - close[n - 1] / peak) * 100 : 0,
+    benchmark: benchmark?.symbol || null,
+    ...relative,
+    sma20,
+    sma50,
+    sma200,
+    rsi14: n > RSI_PERIOD ? (avgLoss === 0 ? 100 : 100 - 100 / (1 + avgGain / avgLoss)) : null,
+    recentReturns
+  };
+}
+
+/**
+ * Beta and correlation of daily log returns over the last year of dates both
+ * histories have. The date columns are sorted, so the common dates are found
+ * by walking both backwards from their ends; returns are taken between
+ * consecutive common dates, which keeps a holiday on one side from pairing
+ * returns of different days.
+ */
+export function betaAgainst(history: PriceHistory, benchmark: PriceHistory): { beta: number | null; correlation: number | null } {
+  let i = history.length - 1;
+  let j = benchmark.length - 1;
+  let prevAsset = NaN;
+  let prevIndex = NaN;
+  let pairs = 0;
+  let meanA = 0;
+  let meanB = 0;
+  let cov = 0;
+  let varA = 0;
+  let varB = 0;
+  while (i >= 0 && j >= 0 && pairs < TRADING_DAYS) {
+    const a = history.dates[i];
+    const b = benchmark.dates[j];
+    if (a > b) {
+      i--;
+      continue;
+    }
+    if (b > a) {
+      j--;
+      continue;
+    }
+    const asset = history.close[i--];
+    const index = benchmark.close[j--];
+    if (!Number.isNaN(prevAsset)) {
+      // Walking backwards: the return ends at the previously visited (later) date
+      const ra = Math.log(prevAsset / asset);
+      const rb = Math.log(prevIndex / index);
+      pairs += 1;
+      const da = ra - meanA;
+      const db = rb - meanB;
+      meanA += da / pairs;
+      meanB += db / pairs;
+      cov += da * (rb - meanB);
+      varA += da * (ra - meanA);
+      varB += db * (rb - meanB);
+    }
+    prevAsset = asset;
+    prevIndex = index;
+  }
+  if (pairs < 2 || varB === 0) return { beta: null, correlation: null };
+  return {
+    beta: cov / varB,
+    correlation: varA === 0 ? null : cov / Math.sqrt(varA * varB)
+  };
+}
@@ -0,0 +1,47 @@
+import { getFirestore, Timestamp } from 'firebase-admin/firestore';
+
+export interface StoredValue {
+  value: any;
+  expiresAt: number;
+}
+
+/**
+ * Second-level cache shared by every instance, one document per cache key.
+ * Values are stored as a JSON string so arbitrary service results (including
+ * undefined fields and nested arrays) round-trip unchanged; `expiresAt` also
+ * drives the collection's Firestore TTL policy.
+ */
+export class FirestoreCache {
+  private collection: string;
+
+  constructor(collection: string) {
+    this.collection = collection;
+  }
+
+  private doc(key: string) {
+    // Firestore is resolved lazily: this module loads before admin.initializeApp() runs
+    return getFirestore().collection(this.collection).doc(key.replace(/\//g, '_'));
+  }
+
+  async get(key: string): Promise<StoredValue | undefined> {
+    const snapshot = await this.doc(key).get();
+    if (!snapshot.exists) return undefined;
+
+    const data = snapshot.data()!;
+    const expiresAt = (data.expiresAt as Timestamp).toMillis();
+    if (expiresAt <= Date.now()) return undefined;
+    return { value: JSON.parse(data.payload), expiresAt };
+  }
+
+  async set(key: string, value: any, ttlMs: number): Promise<void> {
+    const now = Date.now();
+    const [resource, ...rest] = key.split('_');
+    await this.doc(key).set({
+      resource,
+      symbol: rest[0] || null,
+      payload: JSON.stringify(value),
+      storedAt: Timestamp.fromMillis(now),
+      expiresAt: Timestamp.fromMillis(now + ttlMs)
+    });
+  }
+}
@@ -0,0 +1,247 @@
+import { FirestoreCache, StoredValue } from './firestoreCache';
+import { SingleFlight } from './singleFlight';
+import { withTimeout } from './withTimeout';
+
+interface CacheEntry {
+  value: any;
+  size: number;
+  expiresAt: number;
+  staleUntil: number;
+}
+
+interface SecondLevelCache {
+  get(key: string): Promise<StoredValue | undefined>;
+  set(key: string, value: any, ttlMs: number): Promise<void>;
+}
+
+interface LRUCacheOptions {
+  maxEntries: number;
+  maxBytes: number;
+  staleWindowMs: number;
+  secondLevel?: SecondLevelCache;
+}
+
+// Upper bound on how long a load waits for its second-level write to land
+const SECOND_LEVEL_WRITE_TIMEOUT_MS = 2000;
+
+export interface CacheStats {
+  hits: number;
+  staleHits: number;
+  misses: number;
+  evictions: number;
+  expirations: number;
+  refreshErrors: number;
+  l2Hits: number;
+  l2Misses: number;
+  l2Errors: number;
+  entries: number;
+  bytes: number;
+  maxEntries: number;
+  maxBytes: number;
+}
+
+// Rough serialized size; good enough to keep large entries (full price
+// histories) from crowding out the byte budget unnoticed.
+function approximateSize(value: any): number {
+  try {
+    return Buffer.byteLength(JSON.stringify(value) || '');
+  } catch {
+    return 0;
+  }
+}
+
+/**
+ * Bounded LRU cache with per-entry TTL and stale-while-revalidate.
+ *
+ * Entries are fresh until their TTL, then served stale for `staleWindowMs`
+ * while a single background load refreshes them, and dropped after that.
+ * Map insertion order doubles as recency order: reads re-insert the key, so
+ * the first key is always the least recently used.
+ *
+ * With a `secondLevel` cache, local misses (in `load` and `lookup`) read
+ * through it before calling the loader, and every `set` is written through to it.
+ */
+export class LRUCache {
+  private entries: Map<string, CacheEntry> = new Map();
+  private inFlight = new SingleFlight();
+  private pendingWrites: Map<string, Promise<void>> = new Map();
+  private bytes = 0;
+  private counters = {
+    hits: 0, staleHits: 0, misses: 0, evictions: 0, expirations: 0, refreshErrors: 0,
+    l2Hits: 0, l2Misses: 0, l2Errors: 0
+  };
+  private options: LRUCacheOptions;
+
+  constructor(options: LRUCacheOptions) {
+    this.options = options;
+  }
+
+  get(key: string): { value: any; stale: boolean } | undefined {
+    const entry = this.entries.get(key);
+    if (!entry) return undefined;
+
+    const now = Date.now();
+    if (now >= entry.staleUntil) {
+      this.remove(key, entry);
+      this.counters.expirations += 1;
+      return undefined;
+    }
+    this.entries.delete(key);
+    this.entries.set(key, entry);
+    return { value: entry.value, stale: now >= entry.expiresAt };
+  }
+
+  set(key: string, value: any, ttlMs: number): void {
+    this.store(key, value, ttlMs);
+
+    const secondLevel = this.options.secondLevel;
+    if (!secondLevel) return;
+    const write = secondLevel.set(key, value, ttlMs)
+      .catch((error) => {
+        this.counters.l2Errors += 1;
+        console.warn(`Second-level cache write failed for ${key}:`, error);
+      })
+      .finally(() => {
+        if (this.pendingWrites.get(key) === write) this.pendingWrites.delete(key);
+      });
+    this.pendingWrites.set(key, write);
+  }
+
+  delete(key: string): void {
+    const entry = this.entries.get(key);
+    if (entry) this.remove(key, entry);
+  }
+
+  /** Empties this instance's entries, leaving the second level untouched. */
+  clearLocal(): void {
+    this.entries.clear();
+    this.bytes = 0;
+  }
+
+  /**
+   * Like `get`, but a local miss reads through the second level, for callers
+   * that fill the cache themselves (e.g. one completion for many keys).
+   */
+  async lookup(key: string): Promise<{ value: any; stale: boolean } | undefined> {
+    const cached = this.get(key);
+    if (cached) return cached;
+    const stored = await this.readSecondLevel(key);
+    return stored === undefined ? undefined : { value: stored.value, stale: false };
+  }
+
+  /**
+   * Returns the cached value for `key`, loading it through `loader` on a miss.
+   * Concurrent misses share one load. A stale value is returned immediately
+   * and refreshed in the background. Misses and refreshes check the second
+   * level before `loader`, which is responsible for calling `set` with
+   * whatever should be cached.
+   */
+  load<T>(key: string, loader: () => Promise<T>): Promise<T> {
+    const cached = this.get(key);
+    if (cached && !cached.stale) {
+      this.counters.hits += 1;
+      return Promise.resolve(cached.value);
+    }
+    if (cached) {
+      this.counters.staleHits += 1;
+      this.inFlight.do(key, () => this.loadThrough(key, loader)).catch((error) => {
+        this.counters.refreshErrors += 1;
+        console.warn(`Background refresh failed for ${key}:`, error);
+      });
+      return Promise.resolve(cached.value);
+    }
+    this.counters.misses += 1;
+    return this.inFlight.do(key, () => this.loadThrough(key, loader));
+  }
+
+  stats(): CacheStats {
+    return {
+      ...this.counters,
+      entries: this.entries.size,
+      bytes: this.bytes,
+      maxEntries: this.options.maxEntries,
+      maxBytes: this.options.maxBytes
+    };
+  }
+
+  private async loadThrough<T>(key: string, loader: () => Promise<T>): Promise<T> {
+    const stored = await this.readSecondLevel(key);
+    if (stored) return stored.value;
+
+    const value = await loader();
+    // Finish the write-through before responding; instances may be throttled right after
+    const write = this.pendingWrites.get(key);
+    if (write) await withTimeout(write, SECOND_LEVEL_WRITE_TIMEOUT_MS).catch(() => undefined);
+    return value;
+  }
+
+  // A second-level hit is also stored locally for the rest of its TTL
+  private async readSecondLevel(key: string): Promise<StoredValue | undefined> {
+    const secondLevel = this.options.secondLevel;
+    if (!secondLevel) return undefined;
+    let stored: StoredValue | undefined;
+    try {
+      stored = await secondLevel.get(key);
+    } catch (error) {
+      this.counters.l2Errors += 1;
+      console.warn(`Second-level cache read failed for ${key}:`, error);
+    }
+    if (!stored) {
+      this.counters.l2Misses += 1;
+      return undefined;
+    }
+    this.counters.l2Hits += 1;
+    this.store(key, stored.value, stored.expiresAt - Date.now());
+    return stored;
+  }
+
+  private store(key: string, value: any, ttlMs: number): void {
+    const existing = this.entries.get(key);
+    if (existing) this.remove(key, existing);
+
+    const now = Date.now();
+    const size = approximateSize(value);
+    if (size > this.options.maxBytes) return;
+
+    this.entries.set(key, { value, size, expiresAt: now + ttlMs, staleUntil: now + ttlMs + this.options.staleWindowMs });
+    this.bytes += size;
+    this.evict(now);
+  }
+
+  private remove(key: string, entry: CacheEntry): void {
+    this.entries.delete(key);
+    this.bytes -= entry.size;
+  }
+
+  private evict(now: number): void {
+    // Drop dead entries sitting at the LRU end first, then enforce the bounds
+    for (const [key, entry] of this.entries) {
+      if (now < entry.staleUntil) break;
+      this.remove(key, entry);
+      this.counters.expirations += 1;
+    }
+    while (this.entries.size > this.options.maxEntries || this.bytes > this.options.maxBytes) {
+      const [key, entry] = this.entries.entries().next().value as [string, CacheEntry];
+      this.remove(key, entry);
+      this.counters.evictions += 1;
+    }
+  }
+}
+
+// Shared by FinancialDataService and NewsService so both draw on one budget per
+// instance; the Firestore tier is shared across instances (MARKET_CACHE_L2=off disables it)
+export const marketDataCache = new LRUCache({
+  maxEntries: parseInt(process.env.MARKET_CACHE_MAX_ENTRIES || '', 10) || 5000,
+  maxBytes: parseInt(process.env.MARKET_CACHE_MAX_BYTES || '', 10) || 64 * 1024 * 1024,
+  staleWindowMs: 15 * 60 * 1000,
+  secondLevel: process.env.MARKET_CACHE_L2 === 'off' ? undefined : new FirestoreCache('market_data_cache')
+});
+
+// Parsed LLM results keyed by a hash of the request; see AIAnalysisService.
+// Never served stale: a refresh would cost the same model call as a miss.
+export const aiResultCache = new LRUCache({
+  maxEntries: parseInt(process.env.AI_CACHE_MAX_ENTRIES || '', 10) || 2000,
+  maxBytes: parseInt(process.env.AI_CACHE_MAX_BYTES || '', 10) || 8 * 1024 * 1024,
+  staleWindowMs: 0,
+  secondLevel: process.env.AI_CACHE_L2 === 'off' ? undefined : new FirestoreCache('ai_result_cache')
+});
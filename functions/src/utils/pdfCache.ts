@@ -0,0 +1,172 @@
+import { createHash } from 'crypto';
+import { getStorage } from 'firebase-admin/storage';
+import { SingleFlight } from './singleFlight';
+
+interface PdfCacheOptions {
+  maxBytes: number;
+  // Cloud Storage folder for the shared tier; undefined keeps PDFs per instance
+  storagePrefix?: string;
+}
+
+export interface PdfCacheStats {
+  hits: number;
+  misses: number;
+  renders: number;
+  storageHits: number;
+  storageErrors: number;
+  evictions: number;
+  entries: number;
+  bytes: number;
+  maxBytes: number;
+}
+
+export interface RenderedPdf {
+  hash: string;
+  pdf: Buffer;
+  storagePath?: string;
+}
+
+/**
+ * Rendered PDFs addressed by a hash of what they were rendered from.
+ *
+ * Identical report payloads produce identical documents, so the hash of the
+ * payload names the PDF for good: local entries never go stale, they are only
+ * evicted by the byte budget. Bytes are kept as Buffers (no base64 copy),
+ * concurrent renders of one payload share a single render, and with a
+ * `storagePrefix` every render is also written to Cloud Storage, where other
+ * instances and authenticated clients (see storage.rules) can read it by hash.
+ * The bucket's lifecycle rule (storage.lifecycle.json) deletes stored copies
+ * 30 days after they are written; a payload requested after that is simply
+ * rendered and stored again.
+ */
+export class PdfCache {
+  private entries: Map<string, Buffer> = new Map();
+  private inFlight = new SingleFlight();
+  private bytes = 0;
+  private counters = { hits: 0, misses: 0, renders: 0, storageHits: 0, storageErrors: 0, evictions: 0 };
+  private options: PdfCacheOptions;
+
+  constructor(options: PdfCacheOptions) {
+    this.options = options;
+  }
+
+  static hash(kind: string, input: unknown): string {
+    return createHash('sha256').update(kind).update('\0').update(JSON.stringify(input)).digest('hex');
+  }
+
+  storagePath(hash: string): string | undefined {
+    return this.options.storagePrefix ? `${this.options.storagePrefix}/${hash}.pdf` : undefined;
+  }
+
+  /** The PDF for (`kind`, `input`), calling `renderer` only when no tier has it. */
+  async render(kind: string, input: unknown, renderer: () => Promise<Uint8Array>): Promise<RenderedPdf> {
+    const hash = PdfCache.hash(kind, input);
+    const cached = this.local(hash);
+    if (cached) {
+      this.counters.hits += 1;
+      return { hash, pdf: cached, storagePath: this.storagePath(hash) };
+    }
+    this.counters.misses += 1;
+    const pdf = await this.inFlight.do(hash, async () => {
+      const stored = await this.readStorage(hash);
+      if (stored) return stored;
+      this.counters.renders += 1;
+      const rendered = Buffer.from(await renderer());
+      this.store(hash, rendered);
+      await this.writeStorage(hash, rendered);
+      return rendered;
+    });
+    return { hash, pdf, storagePath: this.storagePath(hash) };
+  }
+
+  /** A previously rendered PDF by hash, from this instance or Cloud Storage. */
+  async get(hash: string): Promise<Buffer | undefined> {
+    if (!/^[0-9a-f]{64}$/.test(hash)) return undefined;
+    const cached = this.local(hash);
+    if (cached) {
+      this.counters.hits += 1;
+      return cached;
+    }
+    this.counters.misses += 1;
+    return this.inFlight.do(hash, () => this.readStorage(hash));
+  }
+
+  clearLocal(): void {
+    this.entries.clear();
+    this.bytes = 0;
+  }
+
+  stats(): PdfCacheStats {
+    return { ...this.counters, entries: this.entries.size, bytes: this.bytes, maxBytes: this.options.maxBytes };
+  }
+
+  private local(hash: string): Buffer | undefined {
+    const pdf = this.entries.get(hash);
+    if (pdf) {
+      this.entries.delete(hash);
+      this.entries.set(hash, pdf);
+    }
+    return pdf;
+  }
+
+  private store(hash: string, pdf: Buffer): void {
+    if (this.entries.has(hash) || pdf.length > this.options.maxBytes) return;
+    this.entries.set(hash, pdf);
+    this.bytes += pdf.length;
+    while (this.bytes > this.options.maxBytes) {
+      const [oldest, evicted] = this.entries.entries().next().value as [string, Buffer];
+      this.entries.delete(oldest);
+      this.bytes -= evicted.length;
+      this.counters.evictions += 1;
+    }
+  }
+
+  private async readStorage(hash: string): Promise<Buffer | undefined> {
+    const path = this.storagePath(hash);
+    if (!path) return undefined;
+    try {
+      const [pdf] = await getStorage().bucket().file(path).download();
+      this.counters.storageHits += 1;
+      this.store(hash, pdf);
+      return pdf;
+    } catch (error: any) {
+      if (error?.code !== 404) {
+        this.counters.storageErrors += 1;
+        console.warn(`PDF storage read failed for ${hash}:`, error);
+      }
+      return undefined;
+    }
+  }
+
+  private async writeStorage(hash: string, pdf: Buffer): Promise<void> {
+    const path = this.storagePath(hash);
+    if (!path) return;
+    try {
+      await getStorage().bucket().file(path).save(pdf, {
+        resumable: false,
+        contentType: 'application/pdf',
+        metadata: { cacheControl: 'private, max-age=31536000, immutable' }
+      });
+    } catch (error) {
+      this.counters.storageErrors += 1;
+      console.warn(`PDF storage write failed for ${hash}:`, error);
+    }
+  }
+}
+
+// Shared by mcpCallTool and generateReport; PDF_CACHE_L2=off keeps PDFs per instance
+export const pdfCache = new PdfCache({
+  maxBytes: parseInt(process.env.PDF_CACHE_MAX_BYTES || '', 10) || 32 * 1024 * 1024,
+  storagePrefix: process.env.PDF_CACHE_L2 === 'off' ? undefined : 'reports/pdf'
+});
+
+// Callable response for a rendered PDF. Callables can only return JSON, so the
+// default inlines the document as base64; format 'binary' returns just the
+// hash, for fetching the raw bytes from downloadReportPdf (or Cloud Storage).
+export function pdfResult(rendered: RenderedPdf, format?: string) {
+  const meta = { pdfHash: rendered.hash, bytes: rendered.pdf.length };
+  if (format === 'binary') {
+    return { ...meta, downloadPath: `downloadReportPdf?hash=${rendered.hash}`, storagePath: rendered.storagePath };
+  }
+  return { ...meta, pdf: rendered.pdf.toString('base64') };
+}
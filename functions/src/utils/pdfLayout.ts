@@ -0,0 +1,231 @@
+import { PDFDocument, PDFFont, PDFPage, rgb, StandardFonts } from 'pdf-lib';
+
+const PAGE_SIZE: [number, number] = [612, 792]; // US Letter
+const MARGIN_X = 50;
+const MARGIN_TOP = 40;
+const MARGIN_BOTTOM = 50;
+const LINE_GAP = 6;
+const FOOTER_SIZE = 9;
+const BLACK = rgb(0, 0, 0);
+const GREY = rgb(0.4, 0.4, 0.4);
+
+interface TextOptions {
+  size?: number;
+  bold?: boolean;
+  indent?: number;
+}
+
+export interface TableColumn {
+  header: string;
+  width: number;
+  align?: 'left' | 'right';
+}
+
+/**
+ * Flowing text layout over pdf-lib for reports of any length.
+ *
+ * Fonts are embedded once per document and shared by every page. Words are
+ * measured once per font (at size 1, scaled per use) and lines are filled
+ * greedily, so wrapping costs one lookup per word and rendering time grows
+ * linearly with the amount of text. Content that would cross the bottom
+ * margin starts a new page; headings are kept with their first line, table
+ * headers repeat on each page, and every page gets a "Page i of n" footer.
+ * Characters the standard fonts cannot encode (WinAnsi) are drawn as '?'
+ * instead of failing the whole document.
+ */
+export class PdfLayout {
+  private doc: PDFDocument;
+  private fonts: { regular: PDFFont; bold: PDFFont };
+  private charset: Set<number>;
+  private widths: Map<PDFFont, Map<string, number>>;
+  private page!: PDFPage;
+  private y = 0;
+
+  private constructor(doc: PDFDocument, regular: PDFFont, bold: PDFFont) {
+    this.doc = doc;
+    this.fonts = { regular, bold };
+    // Helvetica and Helvetica-Bold share the WinAnsi character set
+    this.charset = new Set(regular.getCharacterSet());
+    this.widths = new Map([[regular, new Map()], [bold, new Map()]]);
+    this.newPage();
+  }
+
+  static async create(): Promise<PdfLayout> {
+    const doc = await PDFDocument.create();
+    const [regular, bold] = await Promise.all([
+      doc.embedFont(StandardFonts.Helvetica),
+      doc.embedFont(StandardFonts.HelveticaBold)
+    ]);
+    return new PdfLayout(doc, regular, bold);
+  }
+
+  get contentWidth(): number {
+    return PAGE_SIZE[0] - 2 * MARGIN_X;
+  }
+
+  heading(text: string, size = 14): void {
+    // Keep the heading with at least one line of body text
+    this.ensureSpace(size + LINE_GAP + 12 + LINE_GAP);
+    this.text(text, { size, bold: true });
+  }
+
+  /** Wrapped text; newlines start new lines. */
+  text(text: string, options: TextOptions = {}): void {
+    const { size = 12, bold = false, indent = 0 } = options;
+    const font = bold ? this.fonts.bold : this.fonts.regular;
+    for (const paragraph of this.encodable(text).split('\n')) {
+      for (const line of this.wrap(paragraph, font, size, this.contentWidth - indent)) {
+        this.line(line, font, size, MARGIN_X + indent);
+      }
+    }
+  }
+
+  /** One wrapped item per entry, continuation lines hanging under the text. */
+  bullets(items: string[], options: TextOptions = {}): void {
+    const { size = 12, bold = false, indent = 10 } = options;
+    const font = bold ? this.fonts.bold : this.fonts.regular;
+    const marker = '- ';
+    const hang = this.measure(marker, font) * size;
+    const width = this.contentWidth - indent - hang;
+    for (const item of items) {
+      const lines = this.wrap(this.encodable(String(item)).replace(/\s*\n\s*/g, ' '), font, size, width);
+      lines.forEach((line, i) => {
+        if (i === 0) this.line(marker + line, font, size, MARGIN_X + indent);
+        else this.line(line, font, size, MARGIN_X + indent + hang);
+      });
+    }
+  }
+
+  /** Single-line rows; cells too wide for their column are cut with an ellipsis. */
+  table(columns: TableColumn[], rows: Array<Array<string | number>>, size = 9): void {
+    const rowHeight = size + 4;
+    const drawRow = (cells: Array<string | number>, font: PDFFont) => {
+      let x = MARGIN_X;
+      columns.forEach((column, i) => {
+        const text = this.fit(this.encodable(String(cells[i] ?? '')), font, size, column.width - 4);
+        const offset = column.align === 'right' ? column.width - 4 - this.measure(text, font) * size : 0;
+        this.page.drawText(text, { x: x + offset, y: this.y, font, size, color: BLACK });
+        x += column.width;
+      });
+      this.y -= rowHeight;
+    };
+    const header = () => drawRow(columns.map((c) => c.header), this.fonts.bold);
+
+    this.ensureSpace(2 * rowHeight);
+    header();
+    for (const row of rows) {
+      if (this.y - rowHeight < MARGIN_BOTTOM) {
+        this.newPage();
+        header();
+      }
+      drawRow(row, this.fonts.regular);
+    }
+    this.y -= LINE_GAP;
+  }
+
+  space(points: number): void {
+    this.y -= points;
+  }
+
+  async save(): Promise<Uint8Array> {
+    const pages = this.doc.getPages();
+    pages.forEach((page, i) => {
+      const label = `Page ${i + 1} of ${pages.length}`;
+      const width = this.measure(label, this.fonts.regular) * FOOTER_SIZE;
+      page.drawText(label, {
+        x: PAGE_SIZE[0] - MARGIN_X - width,
+        y: MARGIN_BOTTOM / 2,
+        font: this.fonts.regular,
+        size: FOOTER_SIZE,
+        color: GREY
+      });
+    });
+    return this.doc.save();
+  }
+
+  private newPage(): void {
+    this.page = this.doc.addPage(PAGE_SIZE);
+    this.y = PAGE_SIZE[1] - MARGIN_TOP;
+  }
+
+  private ensureSpace(height: number): void {
+    if (this.y - height < MARGIN_BOTTOM) this.newPage();
+  }
+
+  private line(text: string, font: PDFFont, size: number, x: number): void {
+    this.ensureSpace(size);
+    if (text) this.page.drawText(text, { x, y: this.y, font, size, color: BLACK });
+    this.y -= size + LINE_GAP;
+  }
+
+  // Width of `text` at size 1
+  private measure(text: string, font: PDFFont): number {
+    const cache = this.widths.get(font)!;
+    let width = cache.get(text);
+    if (width === undefined) {
+      width = font.widthOfTextAtSize(text, 1);
+      cache.set(text, width);
+    }
+    return width;
+  }
+
+  private wrap(text: string, font: PDFFont, size: number, maxWidth: number): string[] {
+    const limit = maxWidth / size;
+    const space = this.measure(' ', font);
+    const lines: string[] = [];
+    let line = '';
+    let lineWidth = 0;
+    for (const word of text.split(/\s+/)) {
+      if (!word) continue;
+      const width = this.measure(word, font);
+      if (line && lineWidth + space + width <= limit) {
+        line += ` ${word}`;
+        lineWidth += space + width;
+        continue;
+      }
+      if (line) lines.push(line);
+      if (width <= limit) {
+        line = word;
+        lineWidth = width;
+        continue;
+      }
+      // A word wider than the line (URLs, identifiers) is broken by character
+      line = '';
+      lineWidth = 0;
+      for (const char of word) {
+        const charWidth = this.measure(char, font);
+        if (line && lineWidth + charWidth > limit) {
+          lines.push(line);
+          line = '';
+          lineWidth = 0;
+        }
+        line += char;
+        lineWidth += charWidth;
+      }
+    }
+    lines.push(line);
+    return lines;
+  }
+
+  private fit(text: string, font: PDFFont, size: number, maxWidth: number): string {
+    const limit = maxWidth / size;
+    if (this.measure(text, font) <= limit) return text;
+    const ellipsis = '...';
+    let width = this.measure(ellipsis, font);
+    let end = 0;
+    for (const char of text) {
+      width += this.measure(char, font);
+      if (width > limit) break;
+      end += char.length;
+    }
+    return text.slice(0, end) + ellipsis;
+  }
+
+  private encodable(text: string): string {
+    let out = '';
+    for (const char of text.replace(/\r\n?/g, '\n').replace(/\t/g, ' ')) {
+      out += char === '\n' || this.charset.has(char.codePointAt(0)!) ? char : '?';
+    }
+    return out;
+  }
+}
@@ -0,0 +1,213 @@
+import { TRADING_DAYS } from './analytics';
+import { PriceHistory } from './priceHistory';
+
+// A holding must have at least this share of the portfolio's trading days
+const MIN_COVERAGE = 0.9;
+const TOP_PAIRS = 10;
+const TOP_CONTRIBUTORS = 25;
+
+interface PortfolioOptions {
+  lookback?: number; // daily returns used, ending at the latest common date
+  includeMatrix?: boolean; // full correlation matrix (k x k) in the result
+}
+
+export interface PortfolioRisk {
+  holdings: number;
+  excluded: Array<{ symbol: string; reason: string }>;
+  observations: number; // daily returns per holding on the portfolio calendar
+  startDate: string;
+  endDate: string;
+  volatility: number; // annualized %, from the covariance matrix and weights
+  diversificationRatio: number; // weighted sum of holding volatilities over portfolio volatility
+  averageCorrelation: number;
+  concentration: {
+    hhi: number; // sum of squared weights
+    effectiveHoldings: number;
+    maxWeight: number; // %
+    top5Weight: number; // %
+  };
+  riskContributions: Array<{ symbol: string; weight: number; volatility: number; contribution: number }>;
+  topPairs: Array<{ a: string; b: string; correlation: number }>;
+  symbols?: string[];
+  correlationMatrix?: number[][];
+}
+
+/**
+ * Puts the histories on one calendar. The portfolio's trading days are the
+ * dates at least half the holdings traded within the lookback; holdings
+ * missing more than a tenth of them are excluded (recent listings, halted
+ * names). A remaining holding's gaps carry its last close forward (a flat
+ * day, then the move lands on the next bar), since intersecting the dates
+ * of hundreds of holdings would leave few days. Dates are sorted in every
+ * history, so each holding is matched to the calendar with a single merge walk.
+ */
+export function alignCloses(histories: PriceHistory[], lookback: number) {
+  const window = Math.ceil((lookback + 1) * 1.25); // slack for dates some holdings miss
+  const counts = new Map<string, number>();
+  for (const history of histories) {
+    for (let i = Math.max(0, history.length - window); i < history.length; i++) {
+      const date = history.dates[i];
+      counts.set(date, (counts.get(date) || 0) + 1);
+    }
+  }
+  const calendar = Array.from(counts).filter(([, count]) => count * 2 >= histories.length)
+    .map(([date]) => date).sort().slice(-(lookback + 1));
+
+  const excluded: Array<{ symbol: string; reason: string }> = [];
+  const included: PriceHistory[] = [];
+  const matches: Int32Array[] = [];
+  for (const history of histories) {
+    const matched = matchCalendar(history, calendar);
+    let covered = 0;
+    for (const index of matched) if (index >= 0) covered++;
+    if (covered < calendar.length * MIN_COVERAGE || covered < 3) {
+      excluded.push({ symbol: history.symbol, reason: `traded on ${covered} of ${calendar.length} portfolio dates` });
+      continue;
+    }
+    included.push(history);
+    matches.push(matched);
+  }
+
+  const dates = calendar;
+  const columns = dates.length;
+  const closes = new Float64Array(included.length * columns);
+  included.forEach((history, h) => {
+    const matched = matches[h];
+    // Before its first calendar bar, a holding takes that bar's close
+    let last = history.close[matched.find((index) => index >= 0) as number];
+    for (let d = 0; d < columns; d++) {
+      if (matched[d] >= 0) last = history.close[matched[d]];
+      closes[h * columns + d] = last;
+    }
+  });
+  return { dates, included, excluded, closes };
+}
+
+// For each calendar date, the index of the same date in `history`, or -1
+function matchCalendar(history: PriceHistory, calendar: string[]): Int32Array {
+  const matched = new Int32Array(calendar.length).fill(-1);
+  let i = history.length - 1;
+  for (let d = calendar.length - 1; d >= 0 && i >= 0; d--) {
+    while (i >= 0 && history.dates[i] > calendar[d]) i--;
+    if (i >= 0 && history.dates[i] === calendar[d]) matched[d] = i;
+  }
+  return matched;
+}
+
+/**
+ * Correlation, covariance-based volatility and concentration for a set of
+ * holdings. Returns are demeaned into one row-major Float64Array, and the
+ * covariance matrix is filled from its upper triangle with contiguous inner
+ * loops, so 500 holdings x 252 returns is about 32M multiply-adds. Returns
+ * come from the histories' split- and dividend-adjusted closes (see
+ * parseDailySeries), so a split in any holding is not a one-day crash.
+ * `weights` default to equal weights and are renormalized over the holdings
+ * that survive alignment.
+ */
+export function portfolioRisk(
+  histories: PriceHistory[],
+  weights: Map<string, number> | undefined,
+  options: PortfolioOptions = {}
+): PortfolioRisk {
+  const lookback = options.lookback || TRADING_DAYS;
+  const { dates, included, excluded, closes } = alignCloses(histories, lookback);
+  const k = included.length;
+  const columns = dates.length;
+  const t = columns - 1;
+  if (k < 2 || t < 2) {
+    throw new Error(`Need at least two holdings with overlapping history (have ${k} over ${Math.max(t, 0)} days)`);
+  }
+
+  const returns = new Float64Array(k * t);
+  for (let h = 0; h < k; h++) {
+    let sum = 0;
+    const row = h * t;
+    for (let d = 0; d < t; d++) {
+      const r = Math.log(closes[h * columns + d + 1] / closes[h * columns + d]);
+      returns[row + d] = r;
+      sum += r;
+    }
+    const mean = sum / t;
+    for (let d = 0; d < t; d++) returns[row + d] -= mean;
+  }
+
+  const cov = new Float64Array(k * k);
+  for (let a = 0; a < k; a++) {
+    const rowA = a * t;
+    for (let b = a; b < k; b++) {
+      const rowB = b * t;
+      let dot = 0;
+      for (let d = 0; d < t; d++) dot += returns[rowA + d] * returns[rowB + d];
+      cov[a * k + b] = cov[b * k + a] = dot / (t - 1);
+    }
+  }
+
+  const w = new Float64Array(k);
+  let total = 0;
+  included.forEach((history, h) => {
+    w[h] = weights ? Math.max(0, weights.get(history.symbol) || 0) : 1;
+    total += w[h];
+  });
+  if (total <= 0) throw new Error('Holding weights must be positive');
+  for (let h = 0; h < k; h++) w[h] /= total;
+
+  const sigma = new Float64Array(k);
+  for (let h = 0; h < k; h++) sigma[h] = Math.sqrt(cov[h * k + h]);
+  const covW = new Float64Array(k);
+  let variance = 0;
+  let weightedSigma = 0;
+  let hhi = 0;
+  for (let a = 0; a < k; a++) {
+    let sum = 0;
+    for (let b = 0; b < k; b++) sum += cov[a * k + b] * w[b];
+    covW[a] = sum;
+    variance += w[a] * sum;
+    weightedSigma += w[a] * sigma[a];
+    hhi += w[a] * w[a];
+  }
+
+  let correlationSum = 0;
+  const topPairs: Array<{ a: string; b: string; correlation: number }> = [];
+  const matrix = options.includeMatrix ? Array.from({ length: k }, () => new Array<number>(k).fill(1)) : undefined;
+  for (let a = 0; a < k; a++) {
+    for (let b = a + 1; b < k; b++) {
+      const correlation = sigma[a] && sigma[b] ? cov[a * k + b] / (sigma[a] * sigma[b]) : 0;
+      correlationSum += correlation;
+      if (matrix) matrix[a][b] = matrix[b][a] = Math.round(correlation * 1e4) / 1e4;
+      if (topPairs.length < TOP_PAIRS || correlation > topPairs[topPairs.length - 1].correlation) {
+        topPairs.push({ a: included[a].symbol, b: included[b].symbol, correlation });
+        topPairs.sort((x, y) => y.correlation - x.correlation);
+        if (topPairs.length > TOP_PAIRS) topPairs.pop();
+      }
+    }
+  }
+
+  const annualize = (v: number) => Math.sqrt(v * TRADING_DAYS) * 100;
+  const sortedWeights = Array.from(w).sort((x, y) => y - x);
+  const riskContributions = included.map((history, h) => ({
+    symbol: history.symbol,
+    weight: w[h] * 100,
+    volatility: annualize(cov[h * k + h]),
+    contribution: variance > 0 ? (w[h] * covW[h] / variance) * 100 : 0
+  })).sort((x, y) => y.contribution - x.contribution).slice(0, TOP_CONTRIBUTORS);
+
+  return {
+    holdings: k,
+    excluded,
+    observations: t,
+    startDate: dates[0],
+    endDate: dates[columns - 1],
+    volatility: annualize(variance),
+    diversificationRatio: variance > 0 ? weightedSigma / Math.sqrt(variance) : 1,
+    averageCorrelation: correlationSum / (k * (k - 1) / 2),
+    concentration: {
+      hhi,
+      effectiveHoldings: 1 / hhi,
+      maxWeight: sortedWeights[0] * 100,
+      top5Weight: sortedWeights.slice(0, 5).reduce((sum, x) => sum + x, 0) * 100
+    },
+    riskContributions,
+    topPairs,
+    ...(matrix ? { symbols: included.map((history) => history.symbol), correlationMatrix: matrix } : {})
+  };
+}
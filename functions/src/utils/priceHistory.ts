@@ -0,0 +1,329 @@
+import { getFirestore, Timestamp } from 'firebase-admin/firestore';
+import { SingleFlight } from './singleFlight';
+
+const COLUMNS = ['open', 'high', 'low', 'close', 'volume'] as const;
+const PRICE_COLUMNS = ['open', 'high', 'low', 'close'] as const;
+type Column = typeof COLUMNS[number];
+
+// Ten years of daily returns: older bars are dropped, so a symbol stays
+// around 130 KB however long its listing
+export const PRICE_HISTORY_MAX_BARS = 10 * 252 + 1;
+// Spare rows added when appending outgrows a column, so daily merges copy rarely
+const GROWTH_BARS = 32;
+
+/**
+ * Daily bars for one symbol as parallel columns, oldest first so updates
+ * append, at most PRICE_HISTORY_MAX_BARS of them. Prices are adjusted for splits and dividends when the payload
+ * carries an adjusted close, so a split is not a one-day crash in the
+ * returns. Columns may have spare capacity past `length`; read them
+ * through `column()` or `latestBars()`.
+ */
+export interface PriceHistory {
+  symbol: string;
+  length: number;
+  dates: string[];
+  open: Float64Array;
+  high: Float64Array;
+  low: Float64Array;
+  close: Float64Array;
+  volume: Float64Array;
+  checkedAt: number; // when the upstream was last asked for new bars
+}
+
+export interface DailyBar {
+  date: string;
+  open: number;
+  high: number;
+  low: number;
+  close: number;
+  volume: number;
+}
+
+export type SeriesFetcher = (outputsize: 'full' | 'compact') => Promise<Record<string, any>>;
+
+/**
+ * Parses an Alpha Vantage "Time Series (Daily)" object straight into columns.
+ * TIME_SERIES_DAILY_ADJUSTED entries ("5. adjusted close", "6. volume") have
+ * every price scaled by adjusted / raw close; plain TIME_SERIES_DAILY
+ * entries are kept as they are.
+ */
+export function parseDailySeries(symbol: string, series: Record<string, any>): PriceHistory {
+  // ISO dates sort as strings; the API lists them newest first
+  const dates = Object.keys(series).sort().slice(-PRICE_HISTORY_MAX_BARS);
+  const history = emptyHistory(symbol, dates.length);
+  for (let i = 0; i < dates.length; i++) {
+    const values = series[dates[i]];
+    const close = +values['4. close'];
+    const adjusted = values['5. adjusted close'];
+    const factor = adjusted === undefined || !close ? 1 : +adjusted / close;
+    history.open[i] = +values['1. open'] * factor;
+    history.high[i] = +values['2. high'] * factor;
+    history.low[i] = +values['3. low'] * factor;
+    history.close[i] = close * factor;
+    history.volume[i] = +(values['6. volume'] ?? values['5. volume']);
+  }
+  history.dates = dates;
+  history.length = dates.length;
+  return history;
+}
+
+/**
+ * Folds a newer (compact) history into `history` in place: stored bars from
+ * the update's first date on are replaced, since the last one may have been
+ * taken intraday, and later bars are appended. A split or dividend since the
+ * full fetch rescales every earlier adjusted price, so the stored bars before
+ * the update are scaled by how its first close moved against the stored close
+ * of that date. Returns false, leaving `history` untouched, when `update`
+ * starts after the stored bars end, i.e. bars would be missing.
+ */
+export function mergeHistory(history: PriceHistory, update: PriceHistory): boolean {
+  if (!update.length) return true;
+  if (history.length && update.dates[0] > history.dates[history.length - 1]) return false;
+
+  let from = history.length;
+  while (from > 0 && history.dates[from - 1] >= update.dates[0]) from--;
+  if (from < history.length && history.dates[from] === update.dates[0] && history.close[from]) {
+    const scale = update.close[0] / history.close[from];
+    if (scale !== 1) {
+      for (const name of PRICE_COLUMNS) {
+        const values = history[name];
+        for (let i = 0; i < from; i++) values[i] *= scale;
+      }
+    }
+  }
+  reserve(history, from + update.length);
+  for (let i = 0; i < update.length; i++) {
+    history.dates[from + i] = update.dates[i];
+    for (const column of COLUMNS) history[column][from + i] = update[column][i];
+  }
+  history.length = from + update.length;
+  history.dates.length = history.length;
+  trimHistory(history);
+  return true;
+}
+
+// Drops the oldest bars past PRICE_HISTORY_MAX_BARS, keeping the capacity
+function trimHistory(history: PriceHistory): void {
+  const excess = history.length - PRICE_HISTORY_MAX_BARS;
+  if (excess <= 0) return;
+  for (const name of COLUMNS) history[name].copyWithin(0, excess, history.length);
+  history.dates.splice(0, excess);
+  history.length -= excess;
+}
+
+/** A read-only view of one column without its spare capacity. */
+export function column(history: PriceHistory, name: Column): Float64Array {
+  return history[name].subarray(0, history.length);
+}
+
+/** The most recent `count` bars as objects, newest first (the API's row shape). */
+export function latestBars(history: PriceHistory, count: number): DailyBar[] {
+  const bars: DailyBar[] = [];
+  for (let i = history.length - 1; i >= 0 && bars.length < count; i--) {
+    bars.push({
+      date: history.dates[i],
+      open: history.open[i],
+      high: history.high[i],
+      low: history.low[i],
+      close: history.close[i],
+      volume: history.volume[i]
+    });
+  }
+  return bars;
+}
+
+function emptyHistory(symbol: string, capacity: number): PriceHistory {
+  return {
+    symbol,
+    length: 0,
+    dates: [],
+    open: new Float64Array(capacity),
+    high: new Float64Array(capacity),
+    low: new Float64Array(capacity),
+    close: new Float64Array(capacity),
+    volume: new Float64Array(capacity),
+    checkedAt: Date.now()
+  };
+}
+
+function reserve(history: PriceHistory, length: number): void {
+  if (length <= history.close.length) return;
+  // A few weeks of appends, not a fraction of the history: spare rows are resident memory too
+  const capacity = length + GROWTH_BARS;
+  for (const name of COLUMNS) {
+    const grown = new Float64Array(capacity);
+    grown.set(history[name].subarray(0, history.length));
+    history[name] = grown;
+  }
+}
+
+function sizeOf(history: PriceHistory): number {
+  // 8 bytes per column slot plus roughly 12 per ISO date string
+  return history.close.length * 8 * COLUMNS.length + history.length * 12;
+}
+
+interface PriceHistoryStoreOptions {
+  maxBytes: number;
+  refreshMs: number; // how long bars are served before asking for newer ones
+  collection?: string; // Firestore tier; undefined keeps histories per instance
+  ttlMs: number; // how long an untouched Firestore copy lives
+}
+
+/**
+ * Price histories per symbol, fetched in full once and then kept current with
+ * compact (last 100 bars) fetches that are merged in place.
+ *
+ * Histories live in a byte-bounded LRU per instance and, with a `collection`,
+ * in one Firestore document per symbol holding the columns as raw bytes, so
+ * any instance can pick up where another left off without a full fetch.
+ * A history older than `refreshMs` is still returned immediately while a
+ * single background update brings it up to date, like the market data cache.
+ */
+export class PriceHistoryStore {
+  private entries: Map<string, { history: PriceHistory; size: number }> = new Map();
+  private inFlight = new SingleFlight();
+  private bytes = 0;
+  private counters = { hits: 0, staleHits: 0, misses: 0, fullFetches: 0, compactFetches: 0, l2Hits: 0, l2Errors: 0, evictions: 0 };
+  private options: PriceHistoryStoreOptions;
+
+  constructor(options: PriceHistoryStoreOptions) {
+    this.options = options;
+  }
+
+  get(symbol: string, fetchSeries: SeriesFetcher): Promise<PriceHistory> {
+    const entry = this.entries.get(symbol);
+    if (entry) {
+      this.entries.delete(symbol);
+      this.entries.set(symbol, entry);
+      if (Date.now() - entry.history.checkedAt < this.options.refreshMs) {
+        this.counters.hits += 1;
+        return Promise.resolve(entry.history);
+      }
+      this.counters.staleHits += 1;
+      this.inFlight.do(symbol, () => this.update(symbol, entry.history, fetchSeries)).catch((error) => {
+        console.warn(`Price history refresh failed for ${symbol}:`, error);
+      });
+      return Promise.resolve(entry.history);
+    }
+    this.counters.misses += 1;
+    return this.inFlight.do(symbol, async () => {
+      const stored = await this.read(symbol);
+      if (!stored) return this.fetchFull(symbol, fetchSeries);
+      this.counters.l2Hits += 1;
+      this.store(symbol, stored);
+      if (Date.now() - stored.checkedAt < this.options.refreshMs) return stored;
+      // As on a stale hit, the stored bars beat an error if the update fails
+      return this.update(symbol, stored, fetchSeries).catch((error) => {
+        console.warn(`Price history refresh failed for ${symbol}:`, error);
+        return stored;
+      });
+    });
+  }
+
+  clearLocal(): void {
+    this.entries.clear();
+    this.bytes = 0;
+  }
+
+  stats() {
+    return { ...this.counters, symbols: this.entries.size, bytes: this.bytes, maxBytes: this.options.maxBytes };
+  }
+
+  private async fetchFull(symbol: string, fetchSeries: SeriesFetcher): Promise<PriceHistory> {
+    this.counters.fullFetches += 1;
+    const history = parseDailySeries(symbol, await fetchSeries('full'));
+    this.store(symbol, history);
+    await this.write(history);
+    return history;
+  }
+
+  private async update(symbol: string, history: PriceHistory, fetchSeries: SeriesFetcher): Promise<PriceHistory> {
+    this.counters.compactFetches += 1;
+    const recent = parseDailySeries(symbol, await fetchSeries('compact'));
+    // Out for longer than the compact window: start over rather than leave a gap
+    if (!mergeHistory(history, recent)) return this.fetchFull(symbol, fetchSeries);
+    history.checkedAt = Date.now();
+    this.store(symbol, history);
+    await this.write(history);
+    return history;
+  }
+
+  private store(symbol: string, history: PriceHistory): void {
+    const existing = this.entries.get(symbol);
+    if (existing) {
+      this.entries.delete(symbol);
+      this.bytes -= existing.size;
+    }
+    const size = sizeOf(history);
+    if (size > this.options.maxBytes) return;
+    this.entries.set(symbol, { history, size });
+    this.bytes += size;
+    while (this.bytes > this.options.maxBytes) {
+      const [oldest, evicted] = this.entries.entries().next().value as [string, { size: number }];
+      this.entries.delete(oldest);
+      this.bytes -= evicted.size;
+      this.counters.evictions += 1;
+    }
+  }
+
+  private doc(symbol: string) {
+    return getFirestore().collection(this.options.collection!).doc(symbol.replace(/\//g, '_'));
+  }
+
+  private async read(symbol: string): Promise<PriceHistory | undefined> {
+    if (!this.options.collection) return undefined;
+    try {
+      const snapshot = await this.doc(symbol).get();
+      // Copies written before prices were adjusted are fetched again in full
+      if (!snapshot.exists || !snapshot.data()!.adjusted) return undefined;
+      const data = snapshot.data()!;
+      const length: number = data.length;
+      const bytes: Buffer = data.columns;
+      const history = emptyHistory(symbol, length);
+      COLUMNS.forEach((name, i) => {
+        // Copy out: the Buffer's offset need not be 8-byte aligned
+        const slice = bytes.subarray(i * length * 8, (i + 1) * length * 8);
+        new Uint8Array(history[name].buffer).set(slice);
+      });
+      history.dates = length ? (data.dates as string).split(',') : [];
+      history.length = length;
+      history.checkedAt = data.checkedAt;
+      return history;
+    } catch (error) {
+      this.counters.l2Errors += 1;
+      console.warn(`Price history read failed for ${symbol}:`, error);
+      return undefined;
+    }
+  }
+
+  private async write(history: PriceHistory): Promise<void> {
+    if (!this.options.collection) return;
+    try {
+      const columns = Buffer.concat(COLUMNS.map((name) => {
+        const view = column(history, name);
+        return Buffer.from(view.buffer, view.byteOffset, view.byteLength);
+      }));
+      await this.doc(history.symbol).set({
+        symbol: history.symbol,
+        length: history.length,
+        dates: history.dates.join(','),
+        columns,
+        adjusted: true,
+        checkedAt: history.checkedAt,
+        expiresAt: Timestamp.fromMillis(Date.now() + this.options.ttlMs)
+      });
+    } catch (error) {
+      this.counters.l2Errors += 1;
+      console.warn(`Price history write failed for ${history.symbol}:`, error);
+    }
+  }
+}
+
+// About 130 KB per symbol at PRICE_HISTORY_MAX_BARS, so the default holds 500 symbols;
+// PRICE_HISTORY_L2=off keeps histories per instance
+export const priceHistoryStore = new PriceHistoryStore({
+  maxBytes: parseInt(process.env.PRICE_HISTORY_MAX_BYTES || '', 10) || 64 * 1024 * 1024,
+  refreshMs: 15 * 60 * 1000,
+  collection: process.env.PRICE_HISTORY_L2 === 'off' ? undefined : 'price_history',
+  ttlMs: 7 * 24 * 60 * 60 * 1000
+});
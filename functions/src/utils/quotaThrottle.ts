@@ -0,0 +1,36 @@
+// Admits at most `limit` calls per sliding window, queueing the rest in FIFO
+// order until the oldest call in the window ages out. A limit of 0 disables it.
+export class QuotaThrottle {
+  private calls: number[] = [];
+  private waiters: Array<() => void> = [];
+  private timer?: NodeJS.Timeout;
+
+  constructor(private limit: number, private windowMs: number) {}
+
+  acquire(): Promise<void> {
+    if (this.limit <= 0) return Promise.resolve();
+    return new Promise((resolve) => {
+      this.waiters.push(resolve);
+      this.drain();
+    });
+  }
+
+  get queued(): number {
+    return this.waiters.length;
+  }
+
+  private drain(): void {
+    const now = Date.now();
+    while (this.calls.length && now - this.calls[0] >= this.windowMs) this.calls.shift();
+    while (this.waiters.length && this.calls.length < this.limit) {
+      this.calls.push(now);
+      this.waiters.shift()!();
+    }
+    if (this.waiters.length && !this.timer) {
+      this.timer = setTimeout(() => {
+        this.timer = undefined;
+        this.drain();
+      }, this.calls[0] + this.windowMs - now);
+    }
+  }
+}
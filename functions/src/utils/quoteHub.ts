@@ -0,0 +1,135 @@
+export type Quote = Record<string, unknown>;
+export type QuoteFetcher = (symbol: string) => Promise<Quote>;
+
+/**
+ * One update for a symbol. A `snapshot` carries the whole quote and is sent
+ * to a new subscriber (and to everyone after the first poll); a `delta`
+ * carries only the fields that changed since the previous poll.
+ */
+export interface QuoteEvent {
+  type: 'snapshot' | 'delta';
+  symbol: string;
+  quote: Quote;
+  seq: number; // per symbol, increases by one with every delta
+  at: number; // epoch ms when the poll that produced it returned
+}
+
+export type QuoteListener = (event: QuoteEvent) => void;
+
+interface QuoteHubOptions {
+  intervalMs: number; // pause between the end of one poll and the next, per symbol
+  maxSymbols: number; // symbols polled at once per instance
+}
+
+interface Feed {
+  listeners: Set<QuoteListener>;
+  last?: Quote;
+  seq: number;
+  at: number;
+  timer?: ReturnType<typeof setTimeout>;
+}
+
+// Fields of `next` whose value differs from `previous`
+function diff(previous: Quote, next: Quote): Quote {
+  const changed: Quote = {};
+  for (const [field, value] of Object.entries(next)) {
+    if (previous[field] !== value) changed[field] = value;
+  }
+  return changed;
+}
+
+/**
+ * Fans quote updates out to any number of subscribers per symbol.
+ *
+ * The first subscriber to a symbol starts a single poller for it and the
+ * last one to leave stops it, so upstream calls grow with the number of
+ * symbols watched on the instance, not with the number of open dashboards.
+ * Polls that change nothing send nothing; otherwise every subscriber gets
+ * the same event object, so callers can encode it once per fan-out.
+ */
+export class QuoteHub {
+  private feeds: Map<string, Feed> = new Map();
+  private counters = { polls: 0, pollErrors: 0, deltas: 0, unchanged: 0, delivered: 0, listenerErrors: 0 };
+  private fetchQuote: QuoteFetcher;
+  private options: QuoteHubOptions;
+
+  constructor(fetchQuote: QuoteFetcher, options: QuoteHubOptions) {
+    this.fetchQuote = fetchQuote;
+    this.options = options;
+  }
+
+  /** Starts delivering `symbol` updates to `listener`; returns the unsubscribe function. */
+  subscribe(symbol: string, listener: QuoteListener): () => void {
+    let feed = this.feeds.get(symbol);
+    if (!feed) {
+      if (this.feeds.size >= this.options.maxSymbols) {
+        throw new Error(`Realtime quotes are limited to ${this.options.maxSymbols} symbols per instance`);
+      }
+      feed = { listeners: new Set(), seq: 0, at: 0 };
+      this.feeds.set(symbol, feed);
+      this.poll(symbol, feed);
+    }
+    feed.listeners.add(listener);
+    if (feed.last) {
+      this.deliver(listener, { type: 'snapshot', symbol, quote: feed.last, seq: feed.seq, at: feed.at });
+    }
+
+    const subscribed = feed;
+    return () => {
+      if (!subscribed.listeners.delete(listener) || subscribed.listeners.size) return;
+      clearTimeout(subscribed.timer);
+      if (this.feeds.get(symbol) === subscribed) this.feeds.delete(symbol);
+    };
+  }
+
+  stats() {
+    let subscribers = 0;
+    for (const feed of this.feeds.values()) subscribers += feed.listeners.size;
+    return { ...this.counters, symbols: this.feeds.size, subscribers, intervalMs: this.options.intervalMs };
+  }
+
+  private async poll(symbol: string, feed: Feed): Promise<void> {
+    this.counters.polls += 1;
+    try {
+      const quote = await this.fetchQuote(symbol);
+      if (this.feeds.get(symbol) !== feed) return;
+      feed.at = Date.now();
+      if (!feed.last) {
+        feed.last = quote;
+        this.publish(feed, { type: 'snapshot', symbol, quote, seq: feed.seq, at: feed.at });
+      } else {
+        const changed = diff(feed.last, quote);
+        if (Object.keys(changed).length) {
+          feed.last = quote;
+          feed.seq += 1;
+          this.counters.deltas += 1;
+          this.publish(feed, { type: 'delta', symbol, quote: changed, seq: feed.seq, at: feed.at });
+        } else {
+          this.counters.unchanged += 1;
+        }
+      }
+    } catch (error) {
+      this.counters.pollErrors += 1;
+      console.warn(`Realtime quote poll failed for ${symbol}:`, error);
+    } finally {
+      if (this.feeds.get(symbol) === feed) {
+        feed.timer = setTimeout(() => this.poll(symbol, feed), this.options.intervalMs);
+      }
+    }
+  }
+
+  private publish(feed: Feed, event: QuoteEvent): void {
+    for (const listener of feed.listeners) this.deliver(listener, event);
+  }
+
+  private deliver(listener: QuoteListener, event: QuoteEvent): void {
+    try {
+      listener(event);
+      this.counters.delivered += 1;
+    } catch (error) {
+      // One broken connection must not stop the fan-out to the rest
+      this.counters.listenerErrors += 1;
+      console.warn(`Realtime quote listener failed for ${event.symbol}:`, error);
+    }
+  }
+}
@@ -0,0 +1,87 @@
+import { getFirestore, Timestamp } from 'firebase-admin/firestore';
+import * as functions from 'firebase-functions';
+
+interface RateLimiterOptions {
+  collection: string;
+  capacity: number; // burst size, and calls allowed per window at a steady rate
+  windowMs: number; // time for an empty bucket to refill completely
+  shards: number;
+}
+
+/**
+ * Token bucket shared by every instance through Firestore.
+ *
+ * A key's bucket is split across `shards` documents, each holding an integer
+ * share of the capacity and refilling at the matching share of the rate, so
+ * concurrent calls for one key mostly lock different documents. A call takes
+ * a token from a random shard in one transaction and only moves on to the
+ * next shard when that one is empty, so the cost is one transaction until the
+ * key is close to its limit. A bucket that has refilled is equivalent to a
+ * missing document, so `expiresAt` is the collection's TTL field and idle
+ * buckets are deleted by Firestore rather than accumulating.
+ */
+export class FirestoreRateLimiter {
+  private options: RateLimiterOptions;
+
+  constructor(options: RateLimiterOptions) {
+    this.options = { ...options, shards: Math.max(1, Math.min(options.shards, options.capacity)) };
+  }
+
+  async tryAcquire(key: string): Promise<boolean> {
+    const { shards } = this.options;
+    const first = Math.floor(Math.random() * shards);
+    for (let i = 0; i < shards; i++) {
+      if (await this.takeFromShard(key, (first + i) % shards)) return true;
+    }
+    return false;
+  }
+
+  private takeFromShard(key: string, shard: number): Promise<boolean> {
+    // Integer shares that add up to the capacity, so no fraction of a token is stranded per shard
+    const capacity = Math.floor((this.options.capacity + shard) / this.options.shards);
+    const refillPerMs = capacity / this.options.windowMs;
+    const db = getFirestore();
+    const ref = db.collection(this.options.collection).doc(`${key}_${shard}`);
+
+    return db.runTransaction(async (tx) => {
+      const snapshot = await tx.get(ref);
+      const now = Date.now();
+      const stored = snapshot.data();
+      const tokens = stored
+        ? Math.min(capacity, stored.tokens + Math.max(0, now - stored.updatedAt) * refillPerMs)
+        : capacity;
+      if (tokens < 1) return false;
+
+      const remaining = tokens - 1;
+      tx.set(ref, {
+        tokens: remaining,
+        updatedAt: now,
+        expiresAt: Timestamp.fromMillis(now + Math.ceil((capacity - remaining) / refillPerMs))
+      });
+      return true;
+    });
+  }
+}
+
+// Per-user token bucket shared across instances and endpoints: 30 requests per 15 min
+const RATE_LIMIT_MAX = 30;
+const RATE_LIMIT_WINDOW_MS = 15 * 60 * 1000;
+const rateLimiter = new FirestoreRateLimiter({
+  collection: 'rate_limits',
+  capacity: RATE_LIMIT_MAX,
+  windowMs: RATE_LIMIT_WINDOW_MS,
+  shards: 3
+});
+
+export async function enforceRateLimit(uid: string) {
+  let allowed = true;
+  try {
+    allowed = await rateLimiter.tryAcquire(uid);
+  } catch (error) {
+    // Fail open: a Firestore hiccup should not take every endpoint down with it
+    console.warn('Rate limiter unavailable, allowing request:', error);
+  }
+  if (!allowed) {
+    throw new functions.https.HttpsError('resource-exhausted', 'Rate limit exceeded. Try again later.');
+  }
+}
@@ -0,0 +1,276 @@
+import { getFirestore, Timestamp } from 'firebase-admin/firestore';
+import { SingleFlight } from './singleFlight';
+
+export type TickerFetcher = () => Promise<Record<string, { cik_str: number; ticker: string; title?: string }>>;
+export type SubmissionsFetcher = () => Promise<any>;
+
+interface CikIndexOptions {
+  refreshMs: number; // how long a loaded ticker file is used before reloading it
+  retryMs: number; // how long a failed load makes lookups fail fast
+  collection?: string; // Firestore copy shared by instances
+}
+
+// EDGAR writes share classes with a dash (BRK-B); tickers here may use a dot
+const normalizeTicker = (ticker: string) => ticker.trim().toUpperCase().replace(/\./g, '-');
+
+/**
+ * Ticker to CIK lookup over EDGAR's company_tickers file.
+ *
+ * The file (about 10k companies) is loaded once per instance into a Map and
+ * reloaded in the background once a day. A compact "TICKER=CIK,..." copy is
+ * kept in one Firestore document, so a new instance reads one document instead
+ * of downloading the file. After a failed load, lookups throw immediately for
+ * `retryMs` rather than each waiting on the same unreachable host.
+ */
+export class CikIndex {
+  private ciks: Map<string, number> | undefined;
+  private loadedAt = 0;
+  private failedAt = 0;
+  private inFlight = new SingleFlight();
+  private options: CikIndexOptions;
+
+  constructor(options: CikIndexOptions) {
+    this.options = options;
+  }
+
+  /** Zero-padded 10-digit CIK for `ticker`, or undefined when EDGAR does not list it. */
+  async lookup(ticker: string, fetchTickers: TickerFetcher): Promise<string | undefined> {
+    let ciks = this.ciks;
+    if (!ciks) {
+      if (Date.now() - this.failedAt < this.options.retryMs) {
+        throw new Error('SEC ticker index unavailable');
+      }
+      ciks = await this.inFlight.do('load', () => this.load(fetchTickers, true));
+    } else if (Date.now() - this.loadedAt >= this.options.refreshMs) {
+      this.inFlight.do('load', () => this.load(fetchTickers, false)).catch((error) => {
+        console.warn('SEC ticker index refresh failed:', error);
+      });
+    }
+    const cik = ciks.get(normalizeTicker(ticker));
+    return cik === undefined ? undefined : String(cik).padStart(10, '0');
+  }
+
+  get size(): number {
+    return this.ciks?.size || 0;
+  }
+
+  private async load(fetchTickers: TickerFetcher, allowStored: boolean): Promise<Map<string, number>> {
+    try {
+      const stored = allowStored ? await this.read() : undefined;
+      if (stored && Date.now() - stored.loadedAt < this.options.refreshMs) {
+        return this.use(stored.ciks, stored.loadedAt);
+      }
+      const ciks = new Map<string, number>();
+      for (const company of Object.values(await fetchTickers())) {
+        ciks.set(normalizeTicker(company.ticker), company.cik_str);
+      }
+      await this.write(ciks);
+      return this.use(ciks, Date.now());
+    } catch (error) {
+      this.failedAt = Date.now();
+      throw error;
+    }
+  }
+
+  private use(ciks: Map<string, number>, loadedAt: number): Map<string, number> {
+    this.ciks = ciks;
+    this.loadedAt = loadedAt;
+    return ciks;
+  }
+
+  private doc() {
+    return getFirestore().collection(this.options.collection!).doc('company_tickers');
+  }
+
+  private async read(): Promise<{ ciks: Map<string, number>; loadedAt: number } | undefined> {
+    if (!this.options.collection) return undefined;
+    try {
+      const snapshot = await this.doc().get();
+      if (!snapshot.exists) return undefined;
+      const data = snapshot.data()!;
+      const ciks = new Map<string, number>();
+      for (const pair of (data.entries as string).split(',')) {
+        const split = pair.lastIndexOf('=');
+        ciks.set(pair.slice(0, split), Number(pair.slice(split + 1)));
+      }
+      return { ciks, loadedAt: data.loadedAt };
+    } catch (error) {
+      console.warn('SEC ticker index read failed:', error);
+      return undefined;
+    }
+  }
+
+  private async write(ciks: Map<string, number>): Promise<void> {
+    if (!this.options.collection) return;
+    try {
+      const entries = Array.from(ciks, ([ticker, cik]) => `${ticker}=${cik}`).join(',');
+      await this.doc().set({ entries, count: ciks.size, loadedAt: Date.now() });
+    } catch (error) {
+      console.warn('SEC ticker index write failed:', error);
+    }
+  }
+}
+
+/** One company's filings, newest first, as parallel columns like EDGAR's `filings.recent`. */
+export interface CompanyFilings {
+  cik: string;
+  name: string;
+  form: string[];
+  filingDate: string[];
+  accessionNumber: string[];
+  primaryDocument: string[];
+  checkedAt: number;
+}
+
+const FILING_COLUMNS = ['form', 'filingDate', 'accessionNumber', 'primaryDocument'] as const;
+
+/**
+ * Folds EDGAR submissions into `filings` in place. `filings.recent` lists
+ * newest first, so only the entries ahead of the newest known accession
+ * number are read, then the index is capped at `maxFilings`. Returns the
+ * number of filings added.
+ */
+export function mergeSubmissions(filings: CompanyFilings, submissions: any, maxFilings: number): number {
+  const recent = submissions?.filings?.recent || {};
+  const known = filings.accessionNumber[0];
+  const count = Math.min(recent.accessionNumber?.length || 0, maxFilings);
+  let added = 0;
+  while (added < count && recent.accessionNumber[added] !== known) added++;
+  if (added) {
+    for (const column of FILING_COLUMNS) {
+      filings[column] = (recent[column] || []).slice(0, added).map((value: any) => String(value ?? ''))
+        .concat(filings[column]).slice(0, maxFilings);
+    }
+  }
+  if (submissions?.name) filings.name = submissions.name;
+  filings.checkedAt = Date.now();
+  return added;
+}
+
+/** The `count` most recent filings as rows. */
+export function latestFilings(filings: CompanyFilings, count: number) {
+  return filings.form.slice(0, count).map((form, i) => ({
+    form,
+    filingDate: filings.filingDate[i],
+    accessionNumber: filings.accessionNumber[i],
+    primaryDocument: filings.primaryDocument[i]
+  }));
+}
+
+interface FilingIndexOptions {
+  maxEntries: number; // companies kept per instance
+  maxFilings: number; // filings kept per company
+  refreshMs: number;
+  collection?: string;
+}
+
+/**
+ * Compact per-company filing indexes keyed by CIK, kept in an LRU per
+ * instance and one Firestore document per company. A stale index is served
+ * immediately while a single background fetch merges newer filings into it.
+ */
+export class FilingIndex {
+  private entries: Map<string, CompanyFilings> = new Map();
+  private inFlight = new SingleFlight();
+  private counters = { hits: 0, staleHits: 0, misses: 0, fetches: 0, filingsAdded: 0, l2Hits: 0, evictions: 0 };
+  private options: FilingIndexOptions;
+
+  constructor(options: FilingIndexOptions) {
+    this.options = options;
+  }
+
+  get(cik: string, fetchSubmissions: SubmissionsFetcher): Promise<CompanyFilings> {
+    const cached = this.entries.get(cik);
+    if (cached) {
+      this.entries.delete(cik);
+      this.entries.set(cik, cached);
+      if (Date.now() - cached.checkedAt < this.options.refreshMs) {
+        this.counters.hits += 1;
+        return Promise.resolve(cached);
+      }
+      this.counters.staleHits += 1;
+      this.inFlight.do(cik, () => this.update(cached, fetchSubmissions)).catch((error) => {
+        console.warn(`SEC filings refresh failed for CIK ${cik}:`, error);
+      });
+      return Promise.resolve(cached);
+    }
+    this.counters.misses += 1;
+    return this.inFlight.do(cik, async () => {
+      const stored = await this.read(cik);
+      if (stored) {
+        this.counters.l2Hits += 1;
+        this.store(stored);
+        if (Date.now() - stored.checkedAt < this.options.refreshMs) return stored;
+      }
+      const empty: CompanyFilings = { cik, name: '', form: [], filingDate: [], accessionNumber: [], primaryDocument: [], checkedAt: 0 };
+      return this.update(stored || empty, fetchSubmissions);
+    });
+  }
+
+  stats() {
+    return { ...this.counters, companies: this.entries.size, maxEntries: this.options.maxEntries };
+  }
+
+  clearLocal(): void {
+    this.entries.clear();
+  }
+
+  private async update(filings: CompanyFilings, fetchSubmissions: SubmissionsFetcher): Promise<CompanyFilings> {
+    this.counters.fetches += 1;
+    const submissions = await fetchSubmissions();
+    this.counters.filingsAdded += mergeSubmissions(filings, submissions, this.options.maxFilings);
+    this.store(filings);
+    await this.write(filings);
+    return filings;
+  }
+
+  private store(filings: CompanyFilings): void {
+    this.entries.delete(filings.cik);
+    this.entries.set(filings.cik, filings);
+    while (this.entries.size > this.options.maxEntries) {
+      this.entries.delete(this.entries.keys().next().value as string);
+      this.counters.evictions += 1;
+    }
+  }
+
+  private doc(cik: string) {
+    return getFirestore().collection(this.options.collection!).doc(`CIK${cik}`);
+  }
+
+  private async read(cik: string): Promise<CompanyFilings | undefined> {
+    if (!this.options.collection) return undefined;
+    try {
+      const snapshot = await this.doc(cik).get();
+      return snapshot.exists ? (snapshot.data() as CompanyFilings) : undefined;
+    } catch (error) {
+      console.warn(`SEC filings read failed for CIK ${cik}:`, error);
+      return undefined;
+    }
+  }
+
+  private async write(filings: CompanyFilings): Promise<void> {
+    if (!this.options.collection) return;
+    try {
+      await this.doc(filings.cik).set({ ...filings, updatedAt: Timestamp.now() });
+    } catch (error) {
+      console.warn(`SEC filings write failed for CIK ${filings.cik}:`, error);
+    }
+  }
+}
+
+// SEC_INDEX_L2=off keeps both indexes per instance
+const secCollection = (name: string) => (process.env.SEC_INDEX_L2 === 'off' ? undefined : name);
+
+export const cikIndex = new CikIndex({
+  refreshMs: 24 * 60 * 60 * 1000,
+  retryMs: 5 * 60 * 1000,
+  collection: secCollection('sec_index')
+});
+
+// sec_filings is readable by signed-in clients (see firestore.rules)
+export const filingIndex = new FilingIndex({
+  maxEntries: 2000,
+  maxFilings: 200,
+  refreshMs: 60 * 60 * 1000,
+  collection: secCollection('sec_filings')
+});
@@ -0,0 +1,16 @@
+// Coalesces concurrent calls for the same key into one in-flight promise, so
+// simultaneous cache misses trigger a single upstream fetch. Only within one
+// process: 1st-gen functions serve one request per instance, so across
+// instances it is the Firestore second-level caches that share fetched data.
+export class SingleFlight {
+  private inFlight: Map<string, Promise<any>> = new Map();
+
+  do<T>(key: string, fn: () => Promise<T>): Promise<T> {
+    const pending = this.inFlight.get(key);
+    if (pending) return pending;
+
+    const promise = fn().finally(() => this.inFlight.delete(key));
+    this.inFlight.set(key, promise);
+    return promise;
+  }
+}
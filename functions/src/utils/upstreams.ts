@@ -0,0 +1,97 @@
+import axios, { AxiosError, AxiosInstance } from 'axios';
+import * as functions from 'firebase-functions';
+import * as http from 'http';
+import * as https from 'https';
+import { QuotaThrottle } from './quotaThrottle';
+
+// Upstream endpoints can be redirected (e.g. to fake_upstream.py under the
+// emulator) through runtime config or environment variables.
+const trimSlash = (url: string) => url.replace(/\/+$/, '');
+
+export const ALPHA_VANTAGE_URL = `${trimSlash(
+  functions.config().alphavantage?.base_url || process.env.ALPHA_VANTAGE_BASE_URL || 'https://www.alphavantage.co'
+)}/query`;
+
+export const OPENAI_CHAT_URL = `${trimSlash(
+  functions.config().openai?.base_url || process.env.OPENAI_BASE_URL || 'https://api.openai.com/v1'
+)}/chat/completions`;
+
+// EDGAR serves the ticker file from www.sec.gov and submissions from
+// data.sec.gov; SEC_BASE_URL points both at one host (e.g. the fake upstream).
+const SEC_BASE_URL = functions.config().sec?.base_url || process.env.SEC_BASE_URL;
+export const SEC_TICKERS_URL = `${trimSlash(SEC_BASE_URL || 'https://www.sec.gov')}/files/company_tickers.json`;
+export const SEC_SUBMISSIONS_URL = `${trimSlash(SEC_BASE_URL || 'https://data.sec.gov')}/submissions`;
+
+// Alpha Vantage enforces a per-minute call quota per key (75 on the smallest
+// premium plan). Calls beyond it are queued here rather than answered with a
+// rate-limit "Note"; the window carries a second of slack for request latency.
+// The throttle is per instance, so size the quota for the expected instance count.
+export const ALPHA_VANTAGE_CALLS_PER_MINUTE = parseInt(
+  functions.config().alphavantage?.calls_per_minute || process.env.ALPHA_VANTAGE_CALLS_PER_MINUTE || '', 10
+) || 75;
+
+export const alphaVantageQuota = new QuotaThrottle(ALPHA_VANTAGE_CALLS_PER_MINUTE, 61 * 1000);
+
+// EDGAR's fair access policy: at most 10 requests per second, with a User-Agent naming the caller
+export const secEdgarQuota = new QuotaThrottle(10, 1000);
+
+// One keep-alive socket pool per upstream host, so concurrent calls reuse warm
+// TCP/TLS connections instead of handshaking per request. `maxSockets` caps
+// in-flight connections to the host (extra calls queue in the agent); idle
+// sockets are dropped after 30s, before upstream load balancers close them.
+function keepAliveClient(maxSockets: number) {
+  const options = { keepAlive: true, maxSockets, maxFreeSockets: maxSockets, timeout: 30000 };
+  return axios.create({ httpAgent: new http.Agent(options), httpsAgent: new https.Agent(options) });
+}
+
+export const alphaVantage = keepAliveClient(16);
+alphaVantage.interceptors.request.use(async (config) => {
+  await alphaVantageQuota.acquire();
+  return config;
+});
+
+export const openAI = keepAliveClient(8);
+
+// OpenAI answers 429 once the per-minute request or token budget is spent.
+// Those calls are retried up to OPENAI_MAX_RETRIES times, after the server's
+// Retry-After when it sends one and otherwise after an exponential backoff
+// with full jitter, so callers that hit the limit together spread out again.
+export const OPENAI_MAX_RETRIES = parseInt(
+  functions.config().openai?.max_retries || process.env.OPENAI_MAX_RETRIES || '', 10
+) || 4;
+const RETRY_BASE_MS = 1000;
+const RETRY_MAX_MS = 30000;
+
+export const openAIRateLimits = { throttled: 0, retried: 0, exhausted: 0 };
+
+function retryRateLimited(client: AxiosInstance, retries: number, stats: typeof openAIRateLimits) {
+  client.interceptors.response.use(undefined, async (error: AxiosError) => {
+    // The count rides on the config itself: client.request() merges it into a
+    // new config object, which carries the property over to the retry's error
+    const config = error.config as (AxiosError['config'] & { rateLimitRetries?: number }) | undefined;
+    if (error.response?.status !== 429 || !config) throw error;
+    stats.throttled += 1;
+    const attempt = (config.rateLimitRetries || 0) + 1;
+    if (attempt > retries) {
+      stats.exhausted += 1;
+      throw error;
+    }
+    config.rateLimitRetries = attempt;
+    const retryAfter = Number(error.response.headers?.['retry-after']);
+    const delay = Number.isFinite(retryAfter) && retryAfter >= 0
+      ? retryAfter * 1000 + Math.random() * RETRY_BASE_MS
+      : Math.random() * RETRY_BASE_MS * 2 ** (attempt - 1);
+    await new Promise((resolve) => setTimeout(resolve, Math.min(delay, RETRY_MAX_MS)));
+    stats.retried += 1;
+    return client.request(config);
+  });
+}
+
+retryRateLimited(openAI, OPENAI_MAX_RETRIES, openAIRateLimits);
+
+export const secEdgar = keepAliveClient(4);
+secEdgar.defaults.headers.common['User-Agent'] = 'Aidiligence.pro contact@aidiligence.pro';
+secEdgar.interceptors.request.use(async (config) => {
+  await secEdgarQuota.acquire();
+  return config;
+});
@@ -0,0 +1,17 @@
+// Runs `worker` over `items` with at most `concurrency` calls in flight. Workers
+// take the next item as soon as they finish one, so a slow item never holds up
+// the rest. Errors are the worker's to handle; a rejection stops that worker.
+export async function forEachConcurrent<T>(
+  items: T[],
+  concurrency: number,
+  worker: (item: T, index: number) => Promise<void>
+): Promise<void> {
+  let next = 0;
+  const run = async () => {
+    while (next < items.length) {
+      const index = next++;
+      await worker(items[index], index);
+    }
+  };
+  await Promise.all(Array.from({ length: Math.max(1, Math.min(concurrency, items.length)) }, run));
+}
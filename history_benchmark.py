@@ -0,0 +1,279 @@
+#!/usr/bin/env python3
+"""
+Price History Benchmark for AI Diligence Pro
+Parse time and retained memory of TIME_SERIES_DAILY payloads across many symbols:
+one object per row (the previous getHistoricalData) vs parallel columns (PriceHistory),
+plus the cost of keeping a cached history current with a compact fetch
+
+By default this is a layout model in Python, not the functions' code:
+payloads come from the fake upstream's generator, a pool of distinct series
+is reused across symbols, and ColumnarHistory mirrors the layout of
+functions/src/utils/priceHistory.ts (float64 columns oldest first, a list of
+dates, compact updates merged in place). It compares the two layouts, and
+its numbers are Python's.
+
+With --functions-url, getHistoricalData runs in the emulator instead
+(mcpExecuteResource 'stock_data') for --symbols cold symbols served by an
+in-process fake upstream, and the retained size is the price history
+store's own mcpCacheStats().priceHistory.bytes. The store keeps the last
+PRICE_HISTORY_MAX_BARS of a history, so the gate is resident KB per symbol:
+the default 134 lets the 500 default symbols share the store's 64 MiB.
+Raise ALPHA_VANTAGE_CALLS_PER_MINUTE so 500 symbols do not queue for minutes.
+"""
+
+import argparse
+import json
+import math
+import sys
+import time
+import tracemalloc
+from array import array
+from bisect import bisect_left
+from datetime import datetime
+from typing import Dict, Any, List
+
+from fake_upstream import FakeUpstream
+from latency_histogram import LatencyHistogram
+
+FIELDS = (('open', '1. open'), ('high', '2. high'), ('low', '3. low'), ('close', '4. close'), ('volume', '5. volume'))
+ROWS_KEPT = 365  # what the row parser cached: the last year of the full history
+PRICE_HISTORY_MAX_BARS = 10 * 252 + 1  # bars the functions' price history keeps of a symbol
+
+
+class ColumnarHistory:
+    """Python twin of PriceHistory"""
+
+    __slots__ = ('dates', 'open', 'high', 'low', 'close', 'volume')
+
+    def __init__(self):
+        self.dates: List[str] = []
+        for name, _ in FIELDS:
+            setattr(self, name, array('d'))
+
+
+def parse_rows(series: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """The previous parser: an object per row for the whole payload, then the latest year"""
+    rows = [{
+        'date': day,
+        'open': float(values['1. open']),
+        'high': float(values['2. high']),
+        'low': float(values['3. low']),
+        'close': float(values['4. close']),
+        'volume': int(values['5. volume']),
+    } for day, values in series.items()]
+    return rows[:ROWS_KEPT]
+
+
+def parse_columns(series: Dict[str, Any]) -> ColumnarHistory:
+    history = ColumnarHistory()
+    history.dates = sorted(series)
+    for name, field in FIELDS:
+        getattr(history, name).extend(float(series[day][field]) for day in history.dates)
+    return history
+
+
+def merge_compact(history: ColumnarHistory, series: Dict[str, Any]) -> bool:
+    """Fold a compact payload into `history` like mergeHistory; False when it would leave a gap"""
+    update = parse_columns(series)
+    if not update.dates:
+        return True
+    if update.dates[0] > history.dates[-1]:
+        return False
+    start = bisect_left(history.dates, update.dates[0])
+    if start < len(history.dates) and history.dates[start] == update.dates[0] and history.close[start]:
+        # Rescale earlier prices by an adjustment made since they were fetched
+        scale = update.close[0] / history.close[start]
+        if scale != 1:
+            for name in ('open', 'high', 'low', 'close'):
+                values = getattr(history, name)
+                for i in range(start):
+                    values[i] *= scale
+    del history.dates[start:]
+    history.dates.extend(update.dates)
+    for name, _ in FIELDS:
+        values = getattr(history, name)
+        del values[start:]
+        values.extend(getattr(update, name))
+    return True
+
+
+class HistoryBenchmark:
+    def __init__(self, symbols: int = 500, history_days: int = 5000, distinct: int = 20):
+        self.symbols = symbols
+        self.history_days = history_days
+        upstream = FakeUpstream(full_history_days=history_days, seed=0)
+        self.payloads = [
+            (json.dumps(upstream._time_series_daily(f"H{i:04d}", 'full')),
+             json.dumps(upstream._time_series_daily(f"H{i:04d}", 'compact')))
+            for i in range(min(distinct, symbols))
+        ]
+
+    def payload(self, index: int, outputsize: str = 'full') -> str:
+        full, compact = self.payloads[index % len(self.payloads)]
+        return full if outputsize == 'full' else compact
+
+    def time_parsers(self) -> Dict[str, Any]:
+        """Per-symbol parse time (JSON decode included) for both layouts and for a compact update"""
+        histograms = {name: LatencyHistogram() for name in ('rows', 'columns', 'compact_update')}
+        for index in range(self.symbols):
+            full = self.payload(index)
+            compact = self.payload(index, 'compact')
+
+            start = time.perf_counter()
+            parse_rows(json.loads(full)['Time Series (Daily)'])
+            histograms['rows'].record(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            history = parse_columns(json.loads(full)['Time Series (Daily)'])
+            histograms['columns'].record(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            if not merge_compact(history, json.loads(compact)['Time Series (Daily)']):
+                raise RuntimeError(f"compact update for symbol {index} left a gap")
+            histograms['compact_update'].record(time.perf_counter() - start)
+        return {name: histogram.to_dict() for name, histogram in histograms.items()}
+
+    def retained_memory(self, parser) -> int:
+        """Bytes still allocated after parsing every symbol and keeping the results"""
+        kept = []
+        tracemalloc.start()
+        try:
+            for index in range(self.symbols):
+                series = json.loads(self.payload(index))['Time Series (Daily)']
+                kept.append(parser(series))
+                del series
+            current, _ = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        return current
+
+    def run(self) -> Dict[str, Any]:
+        print(f"📈 Layout model (Python): parsing {self.symbols} symbols x {self.history_days} daily bars")
+        timings = self.time_parsers()
+        memory = {'rows': self.retained_memory(parse_rows), 'columns': self.retained_memory(parse_columns)}
+        bars = {'rows': ROWS_KEPT, 'columns': self.history_days}
+
+        print(f"{'Layout':16} {'p50 ms':>9} {'p99 ms':>9} {'total s':>9} {'KB/symbol':>10} {'B/bar':>7}")
+        for name in ('rows', 'columns', 'compact_update'):
+            stats = timings[name]
+            line = f"{name:16} {stats['p50_ms']:9.2f} {stats['p99_ms']:9.2f} {stats['mean_ms'] * stats['count'] / 1000:9.2f}"
+            if name in memory:
+                per_symbol = memory[name] / self.symbols
+                line += f" {per_symbol / 1024:10.1f} {per_symbol / bars[name]:7.1f}"
+            print(line)
+
+        speedup = timings['rows']['p50_ms'] / timings['columns']['p50_ms']
+        bytes_per_bar = {name: memory[name] / self.symbols / bars[name] for name in memory}
+        update_ratio = timings['columns']['p50_ms'] / timings['compact_update']['p50_ms']
+        print(f"⚡ Columns parse at {speedup:.2f}x the speed of rows; a compact update costs 1/{update_ratio:.0f} "
+              f"of a full parse")
+        return {
+            'timestamp': datetime.now().isoformat(),
+            'mode': 'model',
+            'symbols': self.symbols,
+            'history_days': self.history_days,
+            'parse': timings,
+            'retained_bytes': memory,
+            'retained_bars_per_symbol': bars,
+            'bytes_per_bar': bytes_per_bar,
+            'column_speedup': speedup,
+            'compact_update_ratio': update_ratio,
+        }
+
+    def run_functions(self, functions_url: str, auth_url: str, upstream_url: str) -> Dict[str, Any]:
+        """getHistoricalData for cold symbols in the emulator; the store's resident bytes per symbol"""
+        from performance_test import AIDiligencePerformanceTester
+
+        # Each user may make 30 calls per 15 minutes
+        tester = AIDiligencePerformanceTester(functions_url, auth_url, upstream_url,
+                                              users=math.ceil(self.symbols / 25))
+        tester.upstream_config(latency_ms=0, jitter_ms=0, error_rate=0)
+        print(f"🛰️  getHistoricalData in the functions: {self.symbols} symbols x {self.history_days} daily bars")
+        before = tester.cache_stats(flush_local=True, cache='priceHistory')
+        calls = LatencyHistogram()
+        errors = []
+        for _ in range(self.symbols):
+            symbol = tester.fresh_symbol()
+            start = time.perf_counter()
+            try:
+                served = tester.call('mcpExecuteResource', {'symbol': symbol, 'resource': 'stock_data'})
+                calls.record(time.perf_counter() - start)
+                if not served['historical']:
+                    errors.append(f"{symbol}: no bars")
+            except Exception as e:
+                errors.append(f"{symbol}: {e}")
+        after = tester.cache_stats(cache='priceHistory')
+
+        kept = after['symbols'] - before['symbols']
+        bars = kept * min(self.history_days, PRICE_HISTORY_MAX_BARS)
+        bytes_per_bar = after['bytes'] / bars if bars else float('inf')
+        kb_per_symbol = after['bytes'] / kept / 1024 if kept else float('inf')
+        stats = calls.to_dict()
+        print(f"    {kept} histories kept in {after['bytes'] / 1024 / 1024:.1f} MiB "
+              f"({kb_per_symbol:.1f} KB/symbol, {bytes_per_bar:.1f} B/bar), "
+              f"{after['fullFetches'] - before['fullFetches']} full fetches, {after['evictions']} evictions; "
+              f"call p50 {stats.get('p50_ms', 0):.1f} ms, p99 {stats.get('p99_ms', 0):.1f} ms")
+        for error in errors[:5]:
+            print(f"    ⚠️  {error}")
+        return {
+            'timestamp': datetime.now().isoformat(),
+            'mode': 'functions',
+            'symbols': self.symbols,
+            'history_days': self.history_days,
+            'calls': stats,
+            'price_history': after,
+            'histories_kept': kept,
+            'kb_per_symbol': kb_per_symbol,
+            'bytes_per_bar': bytes_per_bar,
+            'errors': errors,
+        }
+
+
+def main():
+    """Run the parse and memory benchmark"""
+    parser = argparse.ArgumentParser(description="AI Diligence Pro price history parse/memory benchmark")
+    parser.add_argument("--symbols", type=int, default=500, help="Symbols to parse")
+    parser.add_argument("--history-days", type=int, default=5000, help="Bars in a full history payload")
+    parser.add_argument("--distinct", type=int, default=20, help="Distinct generated series reused across symbols")
+    parser.add_argument("--functions-url", help="Run getHistoricalData in the functions emulator instead")
+    parser.add_argument("--auth-url", default="http://127.0.0.1:9099", help="Auth emulator base URL")
+    parser.add_argument("--upstream-port", type=int, default=8765,
+                        help="Port for the in-process fake upstream the emulator is configured to call")
+    parser.add_argument("--max-kb-per-symbol", type=float, default=134.0,
+                        help="Fail above this many resident KB per symbol, 64 MiB over 500 symbols "
+                             "by default (--functions-url)")
+    parser.add_argument("--json", help="Write the results to this JSON file")
+    args = parser.parse_args()
+
+    benchmark = HistoryBenchmark(args.symbols, args.history_days, args.distinct)
+    if args.functions_url:
+        upstream = FakeUpstream(port=args.upstream_port, full_history_days=args.history_days).start_in_thread()
+        try:
+            results = benchmark.run_functions(args.functions_url, args.auth_url, upstream.base_url)
+        finally:
+            upstream.stop()
+    else:
+        results = benchmark.run()
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    if args.functions_url:
+        # Every history must stay resident, within the store budget's share of a symbol
+        success = (not results['errors'] and results['histories_kept'] == args.symbols
+                   and results['kb_per_symbol'] <= args.max_kb_per_symbol)
+        print("✅ Price histories retained compactly in the functions" if success
+              else "❌ Price histories were lost or larger than expected")
+        sys.exit(0 if success else 1)
+
+    # Columns must hold a bar in less memory, and keeping a history current
+    # must be much cheaper than re-reading it
+    per_bar = results['bytes_per_bar']
+    success = per_bar['columns'] < per_bar['rows'] and results['compact_update_ratio'] >= 10
+    print("✅ Layout model: columnar history is smaller per bar and cheap to update" if success
+          else "❌ Layout model: columnar history did not beat the row layout")
+    sys.exit(0 if success else 1)
+
+
+if __name__ == "__main__":
+    main()
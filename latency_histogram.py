@@ -0,0 +1,247 @@
+#!/usr/bin/env python3
+"""
+Latency Histograms for AI Diligence Pro Test Harnesses
+HDR-style log-linear histograms with per-endpoint connect/TTFB/total capture
+"""
+
+import json
+import math
+import threading
+import time
+from typing import Dict, Any, Optional
+from urllib.parse import urlparse
+
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+PHASES = ("connect", "ttfb", "total")
+PERCENTILES = (50, 90, 99)
+
+# Connect time of the request currently running on this thread, filled in by
+# the timed urllib3 connections and drained by the response hook.
+_connect_timer = threading.local()
+
+
+class LatencyHistogram:
+    """HDR-style histogram of latencies recorded in microseconds
+
+    Values below 2**sub_bucket_bits are stored exactly; larger values share a
+    bucket with neighbours that agree in their top `sub_bucket_bits` bits, so
+    the relative error stays under 2 / 2**sub_bucket_bits (about 1.6% at the
+    default of 7 bits) while memory grows with the log of the value range.
+    """
+
+    def __init__(self, sub_bucket_bits: int = 7):
+        self.sub_bucket_bits = sub_bucket_bits
+        self.sub_bucket_count = 1 << sub_bucket_bits
+        self.half_count = self.sub_bucket_count >> 1
+        self.counts: Dict[int, int] = {}
+        self.count = 0
+        self.total_us = 0
+        self.min_us: Optional[int] = None
+        self.max_us = 0
+
+    def _index(self, value_us: int) -> int:
+        if value_us < self.sub_bucket_count:
+            return value_us
+        shift = value_us.bit_length() - self.sub_bucket_bits
+        return shift * self.half_count + (value_us >> shift)
+
+    def _highest_equivalent(self, index: int) -> int:
+        if index < self.sub_bucket_count:
+            return index
+        shift = index // self.half_count - 1
+        sub_bucket = index - shift * self.half_count
+        return ((sub_bucket + 1) << shift) - 1
+
+    def record(self, seconds: float):
+        """Record one latency sample given in seconds"""
+        value_us = max(0, int(round(seconds * 1_000_000)))
+        index = self._index(value_us)
+        self.counts[index] = self.counts.get(index, 0) + 1
+        self.count += 1
+        self.total_us += value_us
+        self.min_us = value_us if self.min_us is None else min(self.min_us, value_us)
+        self.max_us = max(self.max_us, value_us)
+
+    def merge(self, other: "LatencyHistogram"):
+        """Fold another histogram with the same precision into this one"""
+        for index, count in other.counts.items():
+            self.counts[index] = self.counts.get(index, 0) + count
+        self.count += other.count
+        self.total_us += other.total_us
+        if other.min_us is not None:
+            self.min_us = other.min_us if self.min_us is None else min(self.min_us, other.min_us)
+        self.max_us = max(self.max_us, other.max_us)
+
+    def percentile(self, percent: float) -> float:
+        """Latency in milliseconds at the given percentile (0-100)"""
+        if not self.count:
+            return 0.0
+        target = max(1, math.ceil(percent / 100 * self.count))
+        running = 0
+        for index in sorted(self.counts):
+            running += self.counts[index]
+            if running >= target:
+                return min(self._highest_equivalent(index), self.max_us) / 1000
+        return self.max_us / 1000
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Summary statistics in milliseconds"""
+        summary = {'count': self.count}
+        if not self.count:
+            return summary
+        summary['min_ms'] = self.min_us / 1000
+        summary['mean_ms'] = self.total_us / self.count / 1000
+        for percent in PERCENTILES:
+            summary[f'p{percent}_ms'] = self.percentile(percent)
+        summary['max_ms'] = self.max_us / 1000
+        return summary
+
+
+class LatencyRecorder:
+    """Per-endpoint connect/TTFB/total histograms"""
+
+    def __init__(self):
+        self.endpoints: Dict[str, Dict[str, LatencyHistogram]] = {}
+        self._lock = threading.Lock()
+
+    def record(self, endpoint: str, total: float, ttfb: Optional[float] = None, connect: Optional[float] = None):
+        """Record the phase timings (seconds) of one request"""
+        with self._lock:
+            phases = self.endpoints.setdefault(endpoint, {phase: LatencyHistogram() for phase in PHASES})
+            phases['total'].record(total)
+            if ttfb is not None:
+                phases['ttfb'].record(ttfb)
+            if connect is not None:
+                phases['connect'].record(connect)
+
+    def summary(self) -> Dict[str, Any]:
+        """Percentile summary per endpoint and phase"""
+        with self._lock:
+            return {
+                endpoint: {phase: histogram.to_dict() for phase, histogram in phases.items()}
+                for endpoint, phases in sorted(self.endpoints.items())
+            }
+
+    def print_summary(self):
+        """Print a p50/p90/p99/max table of total latency with TTFB alongside"""
+        summary = self.summary()
+        if not summary:
+            return
+        print("\n⏱️ Latency (ms)")
+        print(f"{'Endpoint':40} {'n':>5} {'p50':>8} {'p90':>8} {'p99':>8} {'max':>8} {'ttfb p99':>9}")
+        for endpoint, phases in summary.items():
+            total = phases['total']
+            if not total['count']:
+                continue
+            ttfb = phases['ttfb'].get('p99_ms', 0.0)
+            print(f"{endpoint[:40]:40} {total['count']:5} {total['p50_ms']:8.1f} {total['p90_ms']:8.1f} "
+                  f"{total['p99_ms']:8.1f} {total['max_ms']:8.1f} {ttfb:9.1f}")
+
+    def export_json(self, path: str, extra: Optional[Dict[str, Any]] = None):
+        """Write the latency summary (plus any extra fields) as JSON"""
+        document = dict(extra or {})
+        document['latency'] = self.summary()
+        with open(path, 'w') as f:
+            json.dump(document, f, indent=2)
+
+
+class _TimedConnectMixin:
+    def connect(self):
+        start = time.perf_counter()
+        try:
+            super().connect()
+        finally:
+            _connect_timer.seconds = getattr(_connect_timer, 'seconds', 0.0) + time.perf_counter() - start
+
+
+class TimedHTTPConnection(_TimedConnectMixin, HTTPConnection):
+    pass
+
+
+class TimedHTTPSConnection(_TimedConnectMixin, HTTPSConnection):
+    pass
+
+
+class TimedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = TimedHTTPConnection
+
+
+class TimedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = TimedHTTPSConnection
+
+
+class TimedHTTPAdapter(HTTPAdapter):
+    """requests adapter whose connections report TCP/TLS connect time"""
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            'http': TimedHTTPConnectionPool,
+            'https': TimedHTTPSConnectionPool,
+        }
+
+
+def attach_latency_recorder(session, recorder: LatencyRecorder, **adapter_kwargs):
+    """Record every response of a requests.Session into `recorder`
+
+    TTFB is requests' `elapsed` (request start until headers are parsed) and
+    total adds the body download; keep-alive reuse records a connect of 0.
+    Requests sent with stream=True are left unread and unrecorded.
+    `adapter_kwargs` go to the HTTPAdapter (e.g. pool_maxsize).
+    """
+    adapter = TimedHTTPAdapter(**adapter_kwargs)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+
+    def record_response(response, *args, **kwargs):
+        if kwargs.get('stream'):
+            # Reading the body here would defeat streaming; callers time these themselves
+            _connect_timer.seconds = 0.0
+            return response
+        body_start = time.perf_counter()
+        response.content  # read the body so total covers the download
+        ttfb = response.elapsed.total_seconds()
+        connect = getattr(_connect_timer, 'seconds', 0.0)
+        _connect_timer.seconds = 0.0
+        endpoint = f"{response.request.method} {urlparse(response.request.url).path}"
+        recorder.record(endpoint, ttfb + time.perf_counter() - body_start, ttfb=ttfb, connect=connect)
+        return response
+
+    session.hooks['response'].append(record_response)
+
+
+def aiohttp_trace_config():
+    """aiohttp TraceConfig filling the dict passed as `trace_request_ctx`
+
+    The dict receives `start`, `connect` and `ttfb` (seconds, perf_counter clock).
+    """
+    import aiohttp
+
+    async def on_request_start(session, ctx, params):
+        timing = ctx.trace_request_ctx
+        if timing is not None:
+            timing['start'] = time.perf_counter()
+            timing.setdefault('connect', 0.0)
+
+    async def on_connection_create_start(session, ctx, params):
+        ctx.connect_start = time.perf_counter()
+
+    async def on_connection_create_end(session, ctx, params):
+        timing = ctx.trace_request_ctx
+        if timing is not None:
+            timing['connect'] = time.perf_counter() - ctx.connect_start
+
+    async def on_request_end(session, ctx, params):
+        timing = ctx.trace_request_ctx
+        if timing is not None:
+            timing['ttfb'] = time.perf_counter() - timing['start']
+
+    trace_config = aiohttp.TraceConfig()
+    trace_config.on_request_start.append(on_request_start)
+    trace_config.on_connection_create_start.append(on_connection_create_start)
+    trace_config.on_connection_create_end.append(on_connection_create_end)
+    trace_config.on_request_end.append(on_request_end)
+    return trace_config
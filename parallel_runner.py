@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+Parallel Test Runner for AI Diligence Pro Test Harnesses
+Runs independent test methods on a thread pool in declared dependency order
+"""
+
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set
+
+
+class Once:
+    """Thread-safe lazy value: the first call runs `factory`, later calls share its result
+
+    Concurrent first callers wait for the one fetch in progress; a factory that
+    raises is retried by the next caller.
+    """
+
+    def __init__(self, factory: Callable[[], Any]):
+        self._factory = factory
+        self._lock = threading.Lock()
+        self._done = False
+        self._value = None
+
+    def __call__(self) -> Any:
+        with self._lock:
+            if not self._done:
+                self._value = self._factory()
+                self._done = True
+            return self._value
+
+
+class ParallelTestRunner:
+    """Run test callables concurrently, each starting once everything it depends on has finished
+
+    Tests run in registration order as far as their dependencies allow, so the
+    whole run takes about as long as its longest dependency chain rather than
+    the sum of every test. A dependency only orders tests; a failed
+    prerequisite does not skip its dependents.
+    """
+
+    def __init__(self, max_workers: int = 8):
+        self.max_workers = max(1, max_workers)
+        self.tests: Dict[str, Callable[[], Any]] = {}
+        self.dependencies: Dict[str, Set[str]] = {}
+        self.durations: Dict[str, float] = {}
+        self.wall_time = 0.0
+
+    def add(self, test: Callable[[], Any], after: Iterable[Callable[[], Any]] = ()) -> "ParallelTestRunner":
+        """Register `test` to start only after every test in `after` has finished"""
+        self.tests[test.__name__] = test
+        self.dependencies[test.__name__] = {dependency.__name__ for dependency in after}
+        return self
+
+    def _timed(self, name: str) -> Any:
+        start = time.perf_counter()
+        try:
+            return self.tests[name]()
+        finally:
+            self.durations[name] = time.perf_counter() - start
+
+    def run(self, on_error: Optional[Callable[[str, Exception], None]] = None) -> Dict[str, Any]:
+        """Run every registered test and return their results by name
+
+        A test that raises is reported to `on_error` and recorded as False.
+        """
+        unknown = {dep for deps in self.dependencies.values() for dep in deps} - self.tests.keys()
+        if unknown:
+            raise ValueError(f"Unknown test dependencies: {', '.join(sorted(unknown))}")
+
+        results: Dict[str, Any] = {}
+        waiting: List[str] = list(self.tests)
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            running = {}
+
+            def submit_ready():
+                for name in list(waiting):
+                    if self.dependencies[name] <= results.keys():
+                        waiting.remove(name)
+                        running[pool.submit(self._timed, name)] = name
+
+            submit_ready()
+            while running:
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    name = running.pop(future)
+                    try:
+                        results[name] = future.result()
+                    except Exception as e:
+                        results[name] = False
+                        if on_error:
+                            on_error(name, e)
+                submit_ready()
+        self.wall_time = time.perf_counter() - start
+
+        if waiting:
+            raise ValueError(f"Dependency cycle between: {', '.join(waiting)}")
+        return results
+
+    def print_timing(self):
+        """Print wall time against the sequential sum and the slowest tests"""
+        total = sum(self.durations.values())
+        print(f"\n⚡ Wall time {self.wall_time:.2f}s for {total:.2f}s of tests "
+              f"({len(self.durations)} tests, {self.max_workers} workers)")
+        for name, seconds in sorted(self.durations.items(), key=lambda item: -item[1])[:3]:
+            print(f"    {name}: {seconds:.2f}s")
@@ -0,0 +1,830 @@
+#!/usr/bin/env python3
+"""
+Performance Benchmarks for AI Diligence Pro
+Drives the callable Firebase Functions in the emulator against the local fake upstream
+
+The connection reuse benchmark needs that upstream on HTTPS. Create a
+certificate (fake_upstream.generate_self_signed_cert), start the emulator with
+ALPHA_VANTAGE_BASE_URL=https://127.0.0.1:8765 (and the OpenAI and SEC URLs
+likewise) and NODE_EXTRA_CA_CERTS=<cert>, then pass --tls-cert/--tls-key.
+"""
+
+import argparse
+import base64
+import json
+import random
+import string
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Dict, Any, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+import requests
+
+from fake_upstream import FakeUpstream
+from latency_histogram import LatencyHistogram, LatencyRecorder, attach_latency_recorder
+
+# Sockets the functions' keep-alive clients may hold: Alpha Vantage, OpenAI and SEC (utils/upstreams.ts)
+UPSTREAM_POOL_SOCKETS = 16 + 8 + 4
+
+
+class CallableError(Exception):
+    """Error envelope returned by a Firebase callable function"""
+
+    def __init__(self, http_status: int, status: str, message: str):
+        super().__init__(f"{status}: {message}")
+        self.http_status = http_status
+        self.status = status
+
+
+class AIDiligencePerformanceTester:
+    def __init__(self, functions_url: str = "http://127.0.0.1:5001/ai-diligence/us-central1",
+                 auth_url: str = "http://127.0.0.1:9099", upstream_url: str = "http://127.0.0.1:8765",
+                 users: int = 10, firestore_url: str = "http://127.0.0.1:8080", ca_file: Optional[str] = None):
+        self.functions_url = functions_url.rstrip('/')
+        self.project_id = urlsplit(self.functions_url).path.strip('/').split('/')[0]
+        self.auth_url = auth_url.rstrip('/')
+        self.firestore_url = firestore_url.rstrip('/')
+        self.upstream_url = upstream_url.rstrip('/')
+        self.session = requests.Session()
+        if ca_file:
+            # Trusts a self-signed HTTPS fake upstream; REQUESTS_CA_BUNDLE would override it
+            self.session.verify = ca_file
+            self.session.trust_env = False
+        self.session.headers.update({
+            'Content-Type': 'application/json',
+            'User-Agent': 'AI-Diligence-Perf-Client/1.0'
+        })
+        self.latency = LatencyRecorder()
+        attach_latency_recorder(self.session, self.latency)
+        self.users = max(1, users)
+        self.tokens: List[str] = []
+        self._next_user = 0
+        self._run_id = ''.join(random.choices(string.ascii_uppercase, k=3))
+        self._symbol_counter = 0
+        self.tests_run = 0
+        self.tests_passed = 0
+        self.test_results = []
+        self.benchmarks: Dict[str, Any] = {}
+
+    def log_test(self, name: str, success: bool, details: str = "", response_data: Any = None):
+        """Log benchmark results"""
+        self.tests_run += 1
+        if success:
+            self.tests_passed += 1
+
+        self.test_results.append({
+            'name': name,
+            'success': success,
+            'details': details,
+            'timestamp': datetime.now().isoformat(),
+            'response_data': response_data
+        })
+
+        status = "✅ PASS" if success else "❌ FAIL"
+        print(f"{status} - {name}")
+        if details:
+            print(f"    Details: {details}")
+        print()
+
+    # ---- emulator and upstream plumbing --------------------------------------------------
+
+    def sign_in(self) -> str:
+        """Create an anonymous user in the Auth emulator and return its ID token"""
+        response = self.session.post(
+            f"{self.auth_url}/identitytoolkit.googleapis.com/v1/accounts:signUp?key=fake-api-key",
+            json={'returnSecureToken': True},
+            timeout=10
+        )
+        response.raise_for_status()
+        return response.json()['idToken']
+
+    def _token(self) -> str:
+        # Calls rotate across several users so the per-user rate limit does not skew timings
+        if len(self.tokens) < self.users:
+            self.tokens.append(self.sign_in())
+            return self.tokens[-1]
+        token = self.tokens[self._next_user % len(self.tokens)]
+        self._next_user += 1
+        return token
+
+    def call(self, name: str, data: Dict[str, Any], timeout: float = 120, token: Optional[str] = None) -> Any:
+        """Invoke a callable function and return its `result`"""
+        return self.call_sized(name, data, timeout, token)[0]
+
+    def call_sized(self, name: str, data: Dict[str, Any], timeout: float = 120,
+                   token: Optional[str] = None) -> Tuple[Any, int]:
+        """Invoke a callable function; its `result` and the response body size in bytes"""
+        response = self.session.post(
+            f"{self.functions_url}/{name}",
+            json={'data': data},
+            headers={'Authorization': f"Bearer {token or self._token()}"},
+            timeout=timeout
+        )
+        try:
+            body = response.json()
+        except json.JSONDecodeError:
+            raise CallableError(response.status_code, 'INVALID_RESPONSE', response.text[:200])
+        if 'error' in body:
+            error = body['error']
+            raise CallableError(response.status_code, error.get('status', 'UNKNOWN'), error.get('message', ''))
+        return body.get('result'), len(response.content)
+
+    def stream(self, name: str, params: Dict[str, Any], timeout: float = 120, token: Optional[str] = None,
+               body: Optional[Dict[str, Any]] = None):
+        """Open a server-sent events function and yield (seconds since request, event data)
+
+        Sends a GET with `params` (token included, as EventSource would), or a
+        POST with a Bearer header when a JSON `body` is given.
+        """
+        start = time.perf_counter()
+        token = token or self._token()
+        if body is None:
+            request = dict(method='GET', params=dict(params, token=token))
+        else:
+            request = dict(method='POST', params=params, json=body, headers={'Authorization': f"Bearer {token}"})
+        with self.session.request(url=f"{self.functions_url}/{name}", stream=True, timeout=timeout,
+                                  **request) as response:
+            if response.status_code != 200:
+                raise CallableError(response.status_code, 'HTTP_ERROR', response.text[:200])
+            for line in response.iter_lines(chunk_size=None, decode_unicode=True):
+                if line and line.startswith('data:'):
+                    yield time.perf_counter() - start, json.loads(line[5:])
+
+    def analyze_batch(self, symbols: List[str], concurrency: Optional[int] = None, timeout: float = 3600):
+        """Client for getMCPDataBatch: yields (seconds, section, data) per event as symbols complete"""
+        body: Dict[str, Any] = {'symbols': symbols}
+        if concurrency:
+            body['concurrency'] = concurrency
+        for elapsed, event in self.stream('getMCPDataBatch', {}, timeout=timeout, body=body):
+            yield elapsed, event['section'], event['data']
+
+    def upstream_config(self, **config):
+        """Reconfigure latency/errors/throttling on the fake upstream"""
+        self.session.post(f"{self.upstream_url}/__config", json=config, timeout=5).raise_for_status()
+
+    def upstream_reset(self):
+        self.session.post(f"{self.upstream_url}/__reset", timeout=5).raise_for_status()
+
+    def upstream_hits(self) -> Dict[str, int]:
+        return self.session.get(f"{self.upstream_url}/__stats", timeout=5).json()['hits']
+
+    def upstream_throttled(self) -> Dict[str, int]:
+        return self.session.get(f"{self.upstream_url}/__stats", timeout=5).json()['throttled']
+
+    def clear_firestore(self):
+        """Delete every document in the Firestore emulator"""
+        self.session.delete(
+            f"{self.firestore_url}/emulator/v1/projects/{self.project_id}/databases/(default)/documents",
+            timeout=10
+        ).raise_for_status()
+
+    def fresh_symbol(self) -> str:
+        """A ticker no instance has cached yet, unique per run"""
+        n = self._symbol_counter
+        self._symbol_counter += 1
+        suffix = ''
+        while True:
+            suffix = string.ascii_uppercase[n % 26] + suffix
+            n //= 26
+            if not n:
+                break
+        return f"{self._run_id}{suffix}"
+
+    def _timed_calls(self, name: str, payloads: List[Dict[str, Any]]) -> LatencyHistogram:
+        histogram = LatencyHistogram()
+        for payload in payloads:
+            start = time.perf_counter()
+            self.call(name, payload)
+            histogram.record(time.perf_counter() - start)
+        return histogram
+
+    # ---- benchmarks ----------------------------------------------------------------------
+
+    def benchmark_metrics_resource(self, samples: int = 5, latency_ms: float = 200.0) -> bool:
+        """Cold mcpExecuteResource('metrics') wall time against a slow upstream
+
+        The three statement fetches run concurrently, so a cold call should cost
+        about one upstream round-trip rather than three.
+        """
+        name = "Metrics Resource (cold)"
+        try:
+            self.upstream_config(latency_ms=latency_ms, jitter_ms=0, error_rate=0)
+            self.upstream_reset()
+            payloads = [{'symbol': self.fresh_symbol(), 'resource': 'metrics'} for _ in range(samples)]
+            histogram = self._timed_calls('mcpExecuteResource', payloads)
+            hits = self.upstream_hits()
+
+            serial_ms = 3 * latency_ms
+            p50 = histogram.percentile(50)
+            success = p50 < 2 * latency_ms
+            self.benchmarks['metrics_resource'] = {
+                'upstream_latency_ms': latency_ms,
+                'serial_estimate_ms': serial_ms,
+                'latency': histogram.to_dict(),
+                'upstream_hits': hits
+            }
+            details = (f"p50 {p50:.0f} ms, p99 {histogram.percentile(99):.0f} ms "
+                       f"(serial statements would need >= {serial_ms:.0f} ms), upstream hits {hits}")
+            self.log_test(name, success, details)
+            return success
+        except Exception as e:
+            self.log_test(name, False, f"Error: {str(e)}")
+            return False
+
+    def benchmark_single_flight(self, symbols: int = 8, latency_ms: float = 300.0) -> bool:
+        """Concurrent loads of one key inside one invocation must share one upstream fetch
+
+        SingleFlight coalesces within a process only, and getMCPData is a 1st-gen
+        callable that serves one request per instance, so parallel getMCPData
+        calls never share it in production. Instead one getMCPDataBatch call
+        analyzes `symbols` fresh symbols concurrently: each symbol's historical
+        and analytics sections load the same price history, and every symbol's
+        analytics loads the benchmark (SPY) history. Each upstream function may
+        be hit once per symbol, plus once for the benchmark history while it is
+        not cached. Across instances, repeated fetches are absorbed by the
+        Firestore L2 caches (market data, price history), not by SingleFlight.
+        """
+        name = "Single-Flight Upstream Fetches"
+        coalesced = ['GLOBAL_QUOTE', 'OVERVIEW', 'INCOME_STATEMENT', 'BALANCE_SHEET', 'CASH_FLOW',
+                     'TIME_SERIES_DAILY_ADJUSTED', 'NEWS_SENTIMENT']
+        try:
+            self.upstream_config(latency_ms=latency_ms, jitter_ms=0, error_rate=0)
+            self.upstream_reset()
+            batch = [self.fresh_symbol() for _ in range(symbols)]
+            # The endpoint caps its pool at 10 symbols in flight
+            events = self.analyze_batch(batch, concurrency=min(symbols, 10))
+            errors = [data.get('message', '') for _, section, data in events if section == 'error']
+            hits = self.upstream_hits()
+
+            allowed = {fn: symbols + (fn == 'TIME_SERIES_DAILY_ADJUSTED') for fn in coalesced}
+            duplicated = {fn: hits[fn] for fn in coalesced if hits.get(fn, 0) > allowed[fn]}
+            success = not errors and not duplicated
+            self.benchmarks['single_flight'] = {'symbols': symbols, 'upstream_hits': hits, 'errors': errors}
+            details = f"getMCPDataBatch over {symbols} symbols at once, upstream hits {hits}"
+            if duplicated:
+                details += f", duplicated fetches {duplicated} (at most {symbols} per function, +1 price history)"
+            if errors:
+                details += f", {len(errors)} symbols failed (first: {errors[0]})"
+            self.log_test(name, success, details)
+            return success
+        except Exception as e:
+            self.log_test(name, False, f"Error: {str(e)}")
+            return False
+
+    def cache_stats(self, flush_local: bool = False, cache: str = 'marketData') -> Dict[str, Any]:
+        """Scrape the counters of one cache (a key of mcpCacheStats, e.g. 'marketData') on the serving instance
+
+        `flush_local` empties the instance's L1 caches first (emulator only),
+        which stands in for a cold instance joining the pool.
+        """
+        return self.call('mcpCacheStats', {'flushLocal': flush_local})[cache]
+
+    def benchmark_cache_counters(self) -> bool:
+        """A repeated getMCPData call is served from the bounded market-data cache"""
+        name = "Market Data Cache Counters"
+        try:
+            self.upstream_config(latency_ms=50, jitter_ms=0, error_rate=0)
+            symbol = self.fresh_symbol()
+            before = self.cache_stats()
+            self.call('getMCPData', {'symbol': symbol})
+            cold = self.cache_stats()
+            self.upstream_reset()
+            self.call('getMCPData', {'symbol': symbol})
+            warm = self.cache_stats()
+            warm_upstream = self.upstream_hits()
+
+            warm_hits = warm['hits'] - cold['hits']
+            warm_misses = warm['misses'] - cold['misses']
+            lookups = warm['hits'] + warm['staleHits'] + warm['misses']
+            hit_ratio = (warm['hits'] + warm['staleHits']) / lookups if lookups else 0
+            bounded = warm['entries'] <= warm['maxEntries'] and warm['bytes'] <= warm['maxBytes']
+            # quote, overview, metrics, history and news are cached; SEC filings have their own index
+            success = warm_hits >= 5 and bounded and not any(
+                fn in warm_upstream for fn in ('GLOBAL_QUOTE', 'OVERVIEW', 'TIME_SERIES_DAILY_ADJUSTED'))
+            self.benchmarks['cache_counters'] = {
+                'before': before, 'cold': cold, 'warm': warm,
+                'warm_upstream_hits': warm_upstream, 'hit_ratio': hit_ratio
+            }
+            details = (f"warm call: {warm_hits} hits / {warm_misses} misses, instance hit ratio {hit_ratio:.0%}, "
+                       f"{warm['entries']} entries, {warm['bytes'] / 1024:.0f} KiB of "
+                       f"{warm['maxBytes'] / 1024 / 1024:.0f} MiB, evictions {warm['evictions']}")
+            self.log_test(name, success, details)
+            return success
+        except Exception as e:
+            self.log_test(name, False, f"Error: {str(e)}")
+            return False
+
+    def benchmark_cache_tiers(self, instances: int = 4, symbols: int = 5, repeats: int = 2) -> bool:
+        """L1 memory / L2 Firestore hit ratios across simulated cold instances
+
+        Each simulated instance starts with an empty L1 and requests the same
+        symbols `repeats` times; only the first instance should reach the upstream.
+        """
+        name = "Cache Tiers (multi-instance)"
+        market_data = ['GLOBAL_QUOTE', 'OVERVIEW', 'INCOME_STATEMENT', 'BALANCE_SHEET', 'CASH_FLOW',
+                       'TIME_SERIES_DAILY_ADJUSTED', 'NEWS_SENTIMENT']
+        try:
+            self.clear_firestore()
+            self.upstream_config(latency_ms=50, jitter_ms=0, error_rate=0)
+            tickers = [self.fresh_symbol() for _ in range(symbols)]
+            per_instance = []
+            for instance in range(instances):
+                self.upstream_reset()
+                before = self.cache_stats(flush_local=True)
+                for _ in range(repeats):
+                    for ticker in tickers:
+                        self.call('getMCPData', {'symbol': ticker})
+                after = self.cache_stats()
+                hits = self.upstream_hits()
+                delta = {key: after[key] - before[key] for key in ('hits', 'staleHits', 'misses', 'l2Hits', 'l2Misses')}
+                delta['upstream'] = sum(hits.get(fn, 0) for fn in market_data)
+                per_instance.append(delta)
+                print(f"    instance {instance}: L1 hits {delta['hits'] + delta['staleHits']}, "
+                      f"L2 hits {delta['l2Hits']}, L2 misses {delta['l2Misses']}, upstream calls {delta['upstream']}")
+
+            l1_hits = sum(d['hits'] + d['staleHits'] for d in per_instance)
+            lookups = l1_hits + sum(d['misses'] for d in per_instance)
+            l2_hits = sum(d['l2Hits'] for d in per_instance)
+            l2_lookups = l2_hits + sum(d['l2Misses'] for d in per_instance)
+            l1_ratio = l1_hits / lookups if lookups else 0
+            l2_ratio = l2_hits / l2_lookups if l2_lookups else 0
+            warm_upstream = sum(d['upstream'] for d in per_instance[1:])
+            success = warm_upstream == 0 and l2_hits > 0
+            self.benchmarks['cache_tiers'] = {
+                'instances': instances, 'symbols': symbols, 'repeats': repeats,
+                'l1_hit_ratio': l1_ratio, 'l2_hit_ratio': l2_ratio, 'per_instance': per_instance
+            }
+            details = (f"L1 hit ratio {l1_ratio:.0%}, L2 hit ratio {l2_ratio:.0%}, "
+                       f"upstream calls after the first instance: {warm_upstream}")
+            self.log_test(name, success, details)
+            return success
+        except Exception as e:
+            self.log_test(name, False, f"Error: {str(e)}")
+            return False
+
+    def benchmark_ai_cache(self, latency_ms: float = 300.0) -> bool:
+        """A repeated report with unchanged inputs makes no OpenAI calls
+
+        The second getMCPData for a symbol reuses the sentiment and
+        recommendation cached under the prompt hash; allowCached=false forces
+        both completions again.
+        """
+        name = "AI Result Cache"
+        try:
+            self.upstream_config(latency_ms=latency_ms, jitter_ms=0, error_rate=0)
+            symbol = self.fresh_symbol()
+            runs = {}
+            for label, payload in (('cold', {'symbol': symbol}),
+                                   ('warm', {'symbol': symbol}),
+                                   ('uncached', {'symbol': symbol, 'allowCached': False})):
+                self.upstream_reset()
+                start = time.perf_counter()
+                self.call('getMCPData', payload)
+                elapsed = time.perf_counter() - start
+                runs[label] = {'ms': elapsed * 1000, 'openai_calls': self.upstream_hits().get('chat.completions', 0)}
+            stats = self.cache_stats(cache='aiResults')
+            success = (runs['cold']['openai_calls'] == 2 and runs['warm']['openai_calls'] == 0
+                       and runs['uncached']['openai_calls'] == 2)
+            self.benchmarks['ai_cache'] = {'upstream_latency_ms': latency_ms, 'runs': runs, 'cache': stats}
+            details = ", ".join(f"{label} {run['ms']:.0f} ms / {run['openai_calls']} OpenAI calls"
+                                for label, run in runs.items())
+            details += f"; cache hits {stats['hits'] + stats['l2Hits']}, entries {stats['entries']}"
+            self.log_test(name, success, details)
+            return success
+        except Exception as e:
+            self.log_test(name, False, f"Error: {str(e)}")
+            return False
+
+    def benchmark_sec_filings(self, latency_ms: float = 200.0) -> bool:
+        """SEC filings through the ticker-to-CIK index and per-company filing index
+
+        The ticker file is downloaded at most once, a company's submissions
+        once; a warm call and a cold instance reading the Firestore copy make
+        no EDGAR requests, and a ticker EDGAR does not list costs none either.
+        """
+        name = "SEC Filing Index"
+        try:
+            self.clear_firestore()
+            self.upstream_config(latency_ms=latency_ms, jitter_ms=0, error_rate=0)
+            runs = {}
+            for label, symbol, flush in (('cold', 'AAPL', True), ('warm', 'AAPL', False),
+                                         ('new_instance', 'AAPL', True), ('unlisted', self.fresh_symbol(), False)):
+                self.cache_stats(flush_local=flush)
+                self.upstream_reset()
+                start = time.perf_counter()
+                filings = self.call('mcpExecuteResource', {'symbol': symbol, 'resource': 'sec_filings'})['filings']
+                elapsed = time.perf_counter() - start
+                hits = self.upstream_hits()
+                runs[label] = {'ms': elapsed * 1000, 'filings': len(filings),
+                               'tickers_fetches': hits.get('sec.company_tickers', 0),
+                               'submissions_fetches': hits.get('sec.submissions', 0)}
+            stats = self.cache_stats(cache='secFilings')
+            success = (runs['cold']['filings'] == 10 and runs['cold']['submissions_fetches'] == 1
+                       and sum(run['tickers_fetches'] for run in runs.values()) <= 1
+                       and all(runs[label]['submissions_fetches'] == 0 for label in ('warm', 'new_instance', 'unlisted'))
+                       and runs['unlisted']['filings'] == 0)
+            self.benchmarks['sec_filings'] = {'upstream_latency_ms': latency_ms, 'runs': runs, 'index': stats}
+            details = ", ".join(f"{label} {run['ms']:.0f} ms / {run['tickers_fetches'] + run['submissions_fetches']} "
+                                f"EDGAR calls" for label, run in runs.items())
+            self.log_test(name, success, details)
+            return success
+        except Exception as e:
+            self.log_test(name, False, f"Error: {str(e)}")
+            return False
+
+    def benchmark_tools(self, samples: int = 3, latency_ms: float = 200.0) -> bool:
+        """Cold per-tool mcpCallTool latency and the upstream calls each tool makes
+
+        Tools fetch only the inputs they use, concurrently, and share nodes
+        within a request: analyze_risk must not touch news or OpenAI, and no
+        tool may fetch the same resource twice.
+        """
+        name = "MCP Tool Latency"
+        tools = {
+            'analyze_risk': {'NEWS_SENTIMENT': 0, 'chat.completions': 0},
+            'recommend': {'chat.completions': 2},
+            'generate_report': {'chat.completions': 2},
+        }
+        try:
+            self.upstream_config(latency_ms=latency_ms, jitter_ms=0, error_rate=0)
+            # Risk analytics measure beta against SPY; load its history once so
+            # each sample fetches TIME_SERIES_DAILY_ADJUSTED only for its own symbol
+            self.call('mcpExecuteResource', {'symbol': 'SPY', 'resource': 'analytics'})
+            per_tool = {}
+            problems = []
+            for tool, expected in tools.items():
+                histogram = LatencyHistogram()
+                hits: Dict[str, int] = {}
+                for _ in range(samples):
+                    self.upstream_reset()
+                    start = time.perf_counter()
+                    self.call('mcpCallTool', {'tool': tool, 'symbol': self.fresh_symbol()})
+                    histogram.record(time.perf_counter() - start)
+                    hits = self.upstream_hits()
+                    for fn, count in hits.items():
+                        if count > expected.get(fn, 1):
+                            problems.append(f"{tool}: {fn} x{count}")
+                    problems += [f"{tool}: {fn} x{hits.get(fn, 0)}" for fn, count in expected.items()
+                                 if count and hits.get(fn, 0) != count]
+                per_tool[tool] = {'latency': histogram.to_dict(), 'upstream_hits': hits}
+                print(f"    {tool:16} p50 {histogram.percentile(50):7.0f} ms, upstream calls {sum(hits.values())}")
+            success = not problems
+            self.benchmarks['tools'] = {'upstream_latency_ms': latency_ms, 'samples': samples, 'per_tool': per_tool}
+            details = ", ".join(f"{tool} p50 {result['latency']['p50_ms']:.0f} ms" for tool, result in per_tool.items())
+            if problems:
+                details += f"; unexpected upstream calls: {', '.join(sorted(set(problems)))}"
+            self.log_test(name, success, details)
+            return success
+        except Exception as e:
+            self.log_test(name, False, f"Error: {str(e)}")
+            return False
+
+    def benchmark_pdf(self, samples: int = 10, latency_ms: float = 100.0) -> bool:
+        """generate_report latency and payload size: inline base64 vs binary download
+
+        The first call renders the PDF; every later call for the same report
+        payload is served from the content-addressed PDF cache. The binary path
+        returns only the hash and fetches the raw bytes from downloadReportPdf,
+        which must answer a revalidation with the hash as ETag with 304.
+        """
+        name = "PDF Report (base64 vs binary)"
+        try:
+            self.upstream_config(latency_ms=latency_ms, jitter_ms=0, error_rate=0)
+            payload = {'tool': 'generate_report', 'symbol': self.fresh_symbol()}
+            renders_before = self.cache_stats(cache='pdf')['renders']
+
+            start = time.perf_counter()
+            self.call('mcpCallTool', payload)
+            cold_ms = (time.perf_counter() - start) * 1000
+
+            inline = LatencyHistogram()
+            inline_bytes = pdf_bytes = 0
+            for _ in range(samples):
+                start = time.perf_counter()
+                result, inline_bytes = self.call_sized('mcpCallTool', payload)
+                inline.record(time.perf_counter() - start)
+                pdf_bytes = len(base64.b64decode(result['pdf']))
+
+            binary = LatencyHistogram()
+            download_bytes = 0
+            not_modified = True
+            for _ in range(samples):
+                token = self._token()
+                start = time.perf_counter()
+                result = self.call('mcpCallTool', dict(payload, format='binary'), token=token)
+                response = self.session.get(f"{self.functions_url}/downloadReportPdf",
+                                            params={'hash': result['pdfHash']},
+                                            headers={'Authorization': f"Bearer {token}"}, timeout=60)
+                response.raise_for_status()
+                binary.record(time.perf_counter() - start)
+                download_bytes = len(response.content)
+                revalidated = self.session.get(f"{self.functions_url}/downloadReportPdf",
+                                               params={'hash': result['pdfHash']},
+                                               headers={'Authorization': f"Bearer {token}",
+                                                        'If-None-Match': response.headers.get('ETag', '')},
+                                               timeout=60)
+                not_modified = not_modified and revalidated.status_code == 304
+
+            renders = self.cache_stats(cache='pdf')['renders'] - renders_before
+            success = renders == 1 and download_bytes == pdf_bytes and not_modified
+            self.benchmarks['pdf'] = {
+                'upstream_latency_ms': latency_ms,
+                'cold_ms': cold_ms,
+                'inline': {'latency': inline.to_dict(), 'response_bytes': inline_bytes},
+                'binary': {'latency': binary.to_dict(), 'response_bytes': download_bytes},
+                'pdf_bytes': pdf_bytes,
+                'renders': renders
+            }
+            details = (f"cold {cold_ms:.0f} ms; inline p50 {inline.percentile(50):.0f} ms / {inline_bytes} B, "
+                       f"binary (call + download) p50 {binary.percentile(50):.0f} ms / {download_bytes} B; "
+                       f"{renders} render(s) for {2 * samples + 1} calls")
+            if not not_modified:
+                details += "; ETag revalidation did not return 304"
+            self.log_test(name, success, details)
+            return success
+        except Exception as e:
+            self.log_test(name, False, f"Error: {str(e)}")
+            return False
+
+    def benchmark_pdf_scaling(self, sizes: Tuple[int, ...] = (50, 100, 200, 400, 800), samples: int = 3,
+                              max_slope_ratio: float = 2.0) -> bool:
+        """generateReport time for reports of growing size must grow linearly
+
+        Each report has `n` key findings, `n` news items and `n` daily price
+        bars, and a unique title so the PDF cache never serves it. Linear
+        rendering keeps the marginal cost per item flat: the slope over the
+        largest sizes may be at most `max_slope_ratio` times the slope over
+        the smallest (a quadratic layout would be several times steeper).
+        """
+        name = "PDF Rendering Scales Linearly"
+        try:
+            results = []
+            for n in sizes:
+                histogram = LatencyHistogram()
+                size_bytes = 0
+                for _ in range(samples):
+                    report = {
+                        'companyName': f"Scaling Test {self.fresh_symbol()}",
+                        'ticker': 'SCALE',
+                        'executiveSummary': "Synthetic report for layout benchmarking. " * 20,
+                        'keyFindings': [f"Finding {i}: " + "revenue growth remained resilient " * (1 + i % 5)
+                                        for i in range(n)],
+                        'news': [{'title': f"Headline {i} about the company and its market",
+                                  'source': 'Wire', 'publishedAt': '2024-01-01T00:00:00Z'} for i in range(n)],
+                        'priceHistory': [{'date': f"day-{i}", 'open': 100.0 + i, 'high': 101.0 + i,
+                                          'low': 99.0 + i, 'close': 100.5 + i, 'volume': 1_000_000 + i}
+                                         for i in range(n)],
+                    }
+                    start = time.perf_counter()
+                    result = self.call('generateReport', {'reportData': report, 'format': 'binary'})
+                    histogram.record(time.perf_counter() - start)
+                    size_bytes = result['bytes']
+                results.append({'items': n, 'latency': histogram.to_dict(), 'pdf_bytes': size_bytes})
+                print(f"    {n:5} items: p50 {histogram.percentile(50):7.1f} ms, {size_bytes} bytes")
+
+            def slope(a: Dict[str, Any], b: Dict[str, Any]) -> float:
+                return (b['latency']['p50_ms'] - a['latency']['p50_ms']) / (b['items'] - a['items'])
+
+            small_slope = max(slope(results[0], results[len(results) // 2]), 1e-6)
+            large_slope = slope(results[-2], results[-1])
+            ratio = large_slope / small_slope
+            success = ratio <= max_slope_ratio
+            self.benchmarks['pdf_scaling'] = {'samples': samples, 'sizes': results, 'slope_ratio': ratio}
+            details = (f"{small_slope:.3f} ms/item at small sizes vs {large_slope:.3f} ms/item at large "
+                       f"(ratio {ratio:.2f}, limit {max_slope_ratio}); "
+                       f"{results[-1]['pdf_bytes']} bytes at {results[-1]['items']} items")
+            self.log_test(name, success, details)
+            return success
+        except Exception as e:
+            self.log_test(name, False, f"Error: {str(e)}")
+            return False
+
+    def benchmark_streaming(self, samples: int = 3, latency_ms: float = 200.0) -> bool:
+        """Time to first section vs time to complete for getMCPDataStream
+
+        Market data sections arrive after about one upstream round-trip, while
+        the full report still waits on the AI steps chained behind the news.
+        """
+        name = "Streaming Report (first section vs complete)"
+        try:
+            self.upstream_config(latency_ms=latency_ms, jitter_ms=0, error_rate=0)
+            first_section = LatencyHistogram()
+            complete = LatencyHistogram()
+            order: List[str] = []
+            for _ in range(samples):
+                sections = []
+                for elapsed, event in self.stream('getMCPDataStream', {'symbol': self.fresh_symbol()}):
+                    if not sections:
+                        first_section.record(elapsed)
+                    sections.append(event['section'])
+                    if event['section'] == 'error':
+                        raise RuntimeError(event['data'].get('message'))
+                    if event['section'] == 'done':
+                        complete.record(elapsed)
+                order = sections
+            first_p50 = first_section.percentile(50)
+            complete_p50 = complete.percentile(50)
+            success = complete.count == samples and first_p50 < complete_p50 / 2
+            self.benchmarks['streaming'] = {
+                'upstream_latency_ms': latency_ms,
+                'first_section': first_section.to_dict(),
+                'complete': complete.to_dict(),
+                'section_order': order
+            }
+            details = (f"p50 first section {first_p50:.0f} ms, p50 complete {complete_p50:.0f} ms "
+                       f"({len(order)} events: {', '.join(order)})")
+            self.log_test(name, success, details)
+            return success
+        except Exception as e:
+            self.log_test(name, False, f"Error: {str(e)}")
+            return False
+
+    def benchmark_batch(self, symbols: int = 12, concurrency: int = 5, latency_ms: float = 100.0,
+                        av_calls_per_minute: int = 75) -> bool:
+        """Symbols/minute through getMCPDataBatch under the Alpha Vantage quota
+
+        The fake upstream enforces the same per-minute quota the functions are
+        configured with (ALPHA_VANTAGE_CALLS_PER_MINUTE, 75 by default), so any
+        throttled upstream call means the batch scheduler overran it.
+        """
+        name = "Batch Analysis (symbols/minute)"
+        try:
+            self.upstream_config(latency_ms=latency_ms, jitter_ms=0, error_rate=0,
+                                 av_calls_per_minute=av_calls_per_minute)
+            self.upstream_reset()
+            tickers = [self.fresh_symbol() for _ in range(symbols)]
+            per_symbol = LatencyHistogram()
+            completed, failed, done = 0, [], {}
+            for elapsed, section, data in self.analyze_batch(tickers, concurrency):
+                if section == 'result':
+                    completed += 1
+                    per_symbol.record(elapsed)
+                    print(f"    {completed:3}/{symbols} {data['symbol']} at {elapsed:.1f}s")
+                elif section == 'error':
+                    failed.append(data['symbol'])
+                elif section == 'done':
+                    done = data
+            hits = self.upstream_hits()
+            throttled = sum(self.upstream_throttled().values())
+            av_calls = sum(count for fn, count in hits.items() if fn != 'chat.completions')
+            rate = done.get('symbolsPerMinute', 0)
+            success = completed == symbols and not failed and throttled == 0
+            self.benchmarks['batch'] = {
+                'symbols': symbols, 'concurrency': concurrency, 'upstream_latency_ms': latency_ms,
+                'av_calls_per_minute': av_calls_per_minute, 'symbols_per_minute': rate,
+                'av_calls': av_calls, 'throttled': throttled, 'failed': failed,
+                'completion_time': per_symbol.to_dict()
+            }
+            details = (f"{completed}/{symbols} symbols in {done.get('elapsedMs', 0) / 1000:.1f}s "
+                       f"({rate:.1f} symbols/min), {av_calls} Alpha Vantage calls, {throttled} throttled")
+            self.log_test(name, success, details)
+            return success
+        except Exception as e:
+            self.log_test(name, False, f"Error: {str(e)}")
+            return False
+        finally:
+            self.upstream_config(av_calls_per_minute=0)
+
+    def benchmark_connection_reuse(self, symbols: int = 8, latency_ms: float = 20.0) -> bool:
+        """TLS connections the functions open to the upstream during a concurrent burst
+
+        Needs the emulator pointed at this harness's fake upstream over HTTPS
+        (see --tls-cert). `symbols` cold getMCPData calls run at once; with
+        keep-alive pools every upstream call reuses a warm connection, so the
+        upstream sees no more connections than the pools hold, and far fewer
+        than requests. A client that handshakes per request opens one each.
+        """
+        name = "Upstream Connection Reuse (TLS)"
+        if not self.upstream_url.startswith('https://'):
+            self.log_test(name, False, "needs an HTTPS fake upstream: run with --tls-cert/--tls-key and start "
+                                       "the emulator with https:// base URLs and NODE_EXTRA_CA_CERTS=<cert>")
+            return False
+        try:
+            self.upstream_config(latency_ms=latency_ms, jitter_ms=0, error_rate=0)
+            tickers = [self.fresh_symbol() for _ in range(symbols)]
+            tokens = [self._token() for _ in tickers]
+            self.upstream_reset()
+            start = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=symbols) as pool:
+                futures = [pool.submit(self.call, 'getMCPData', {'symbol': ticker}, 120, token)
+                           for ticker, token in zip(tickers, tokens)]
+                errors = [str(e) for e in (future.exception() for future in futures) if e]
+            elapsed = time.perf_counter() - start
+            stats = self.session.get(f"{self.upstream_url}/__stats", timeout=5).json()
+
+            # The harness's own __stats request may open one more
+            connections = stats['connections']
+            upstream_requests = sum(stats['hits'].values())
+            success = (not errors and connections <= UPSTREAM_POOL_SOCKETS + 1
+                       and connections < upstream_requests)
+            self.benchmarks['connection_reuse'] = {
+                'symbols': symbols, 'upstream_latency_ms': latency_ms, 'elapsed_s': elapsed,
+                'upstream_requests': upstream_requests, 'connections': connections,
+                'pool_sockets': UPSTREAM_POOL_SOCKETS, 'hits': stats['hits'], 'errors': errors
+            }
+            details = (f"{connections} TLS connections for {upstream_requests} upstream requests "
+                       f"({upstream_requests / max(connections, 1):.1f} per connection, pools hold "
+                       f"{UPSTREAM_POOL_SOCKETS}) over {symbols} concurrent cold symbols in {elapsed:.1f}s")
+            if errors:
+                details += f"; errors: {errors[:3]}"
+            self.log_test(name, success, details)
+            return success
+        except Exception as e:
+            self.log_test(name, False, f"Error: {str(e)}")
+            return False
+
+    def run_all_benchmarks(self) -> Dict[str, Any]:
+        """Run all performance benchmarks"""
+        print("🚀 Starting AI Diligence Pro Performance Benchmarks")
+        print("=" * 50)
+
+        start_time = time.time()
+
+        benchmarks = [
+            self.benchmark_metrics_resource,
+            self.benchmark_single_flight,
+            self.benchmark_cache_counters,
+            self.benchmark_cache_tiers,
+            self.benchmark_ai_cache,
+            self.benchmark_sec_filings,
+            self.benchmark_tools,
+            self.benchmark_pdf,
+            self.benchmark_pdf_scaling,
+            self.benchmark_streaming,
+            self.benchmark_batch,
+            self.benchmark_connection_reuse
+        ]
+
+        for benchmark in benchmarks:
+            try:
+                benchmark()
+            except Exception as e:
+                self.log_test(benchmark.__name__, False, f"Unexpected error: {str(e)}")
+
+        duration = time.time() - start_time
+
+        print("=" * 50)
+        print("📊 Benchmark Summary")
+        print(f"Benchmarks Run: {self.tests_run}")
+        print(f"Benchmarks Passed: {self.tests_passed}")
+        print(f"Duration: {duration:.2f} seconds")
+        self.latency.print_summary()
+
+        return {
+            'total_tests': self.tests_run,
+            'passed_tests': self.tests_passed,
+            'failed_tests': self.tests_run - self.tests_passed,
+            'duration': duration,
+            'benchmarks': self.benchmarks,
+            'latency': self.latency.summary(),
+            'results': self.test_results
+        }
+
+
+def main():
+    """Main benchmark execution"""
+    parser = argparse.ArgumentParser(description="AI Diligence Pro performance benchmarks")
+    parser.add_argument("--functions-url", default="http://127.0.0.1:5001/ai-diligence/us-central1",
+                        help="Functions emulator base URL including project and region")
+    parser.add_argument("--auth-url", default="http://127.0.0.1:9099", help="Auth emulator base URL")
+    parser.add_argument("--firestore-url", default="http://127.0.0.1:8080", help="Firestore emulator base URL")
+    parser.add_argument("--upstream-port", type=int, default=8765,
+                        help="Port for the in-process fake upstream the emulator is configured to call")
+    parser.add_argument("--external-upstream", help="Use an already running fake upstream at this URL")
+    parser.add_argument("--tls-cert", help="PEM certificate: serve the in-process upstream over HTTPS with it, "
+                                           "or trust it for an HTTPS --external-upstream")
+    parser.add_argument("--tls-key", help="PEM private key for --tls-cert (in-process upstream)")
+    parser.add_argument("--users", type=int, default=10, help="Anonymous users to rotate calls across")
+    parser.add_argument("--json", help="Write benchmark results to this JSON file")
+    args = parser.parse_args()
+
+    upstream = None
+    upstream_url = args.external_upstream
+    if not upstream_url:
+        upstream = FakeUpstream(port=args.upstream_port, certfile=args.tls_cert,
+                                keyfile=args.tls_key).start_in_thread()
+        upstream_url = upstream.base_url
+
+    print(f"Benchmarking AI Diligence Pro Functions at: {args.functions_url}")
+    print(f"Fake upstream: {upstream_url}")
+
+    tester = AIDiligencePerformanceTester(args.functions_url, args.auth_url, upstream_url, args.users,
+                                          args.firestore_url, ca_file=args.tls_cert)
+    try:
+        results = tester.run_all_benchmarks()
+    finally:
+        if upstream:
+            upstream.stop()
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    sys.exit(0 if results['failed_tests'] == 0 else 1)
+
+
+if __name__ == "__main__":
+    main()
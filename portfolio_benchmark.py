@@ -0,0 +1,279 @@
+#!/usr/bin/env python3
+"""
+Portfolio Risk Benchmark for AI Diligence Pro
+Synthetic price panels of growing size through the portfolio_risk tool:
+alignment, correlation and covariance-based volatility at 50 to 500 holdings
+
+Panels follow a factor model (market, sector and idiosyncratic returns) so
+the expected average correlation is known. Each holding skips a few random
+dates (carried forward on the portfolio calendar) and a few holdings listed
+recently (excluded), so alignment is exercised. About one holding in twenty
+splits inside the lookback: the fake upstream serves its raw closes with the
+jump and the adjusted closes the reference uses, so the functions only match
+when they build returns from adjusted closes. reference_portfolio computes
+the tool's outputs with NumPy from the same rules as
+functions/src/utils/portfolio.ts.
+
+Without --functions-url only the reference runs, timing it per panel size
+and checking it recovers the model's correlation. With --functions-url the
+panels are served by an in-process fake upstream (start the emulator pointed
+at it, with ALPHA_VANTAGE_CALLS_PER_MINUTE raised so 500 cold histories do
+not queue for minutes) and mcpPortfolioRisk runs on each. A call fetches at
+most 25 cold histories, so the panel is warmed with repeated calls first; the
+last, fully cached call is checked against the reference and timed.
+"""
+
+import argparse
+import json
+import math
+import random
+import string
+import sys
+import time
+from datetime import datetime
+from typing import Dict, Any, List, Optional, Tuple
+
+import numpy as np
+
+from fake_upstream import FakeUpstream, _trading_days
+from latency_histogram import LatencyHistogram
+
+TRADING_DAYS = 252
+MIN_COVERAGE = 0.9
+SECTORS = 10
+
+
+class SyntheticPanel:
+    """Daily closes for `holdings` symbols from a one-market, ten-sector factor model"""
+
+    def __init__(self, holdings: int, days: int = TRADING_DAYS + 60, seed: int = 0, prefix: str = "P",
+                 missing_rate: float = 0.01, late_listings: float = 0.02, split_rate: float = 0.05):
+        rng = np.random.default_rng(seed)
+        picker = random.Random(seed)
+        self.dates = list(reversed(_trading_days(days)))
+        self.market_vol, self.sector_vol, self.idio_vol = 0.010, 0.006, 0.015
+        market = rng.normal(0, self.market_vol, days)
+        sectors = rng.normal(0, self.sector_vol, (SECTORS, days))
+        self.betas = rng.uniform(0.6, 1.4, holdings)
+        self.sector_of = rng.integers(0, SECTORS, holdings)
+        self.series: Dict[str, Tuple[List[str], List[float]]] = {}
+        # Closes are split-adjusted; a few holdings split, so their raw closes jump
+        self.splits: Dict[str, Dict[str, float]] = {}
+        for h in range(holdings):
+            returns = self.betas[h] * market + sectors[self.sector_of[h]] + rng.normal(0, self.idio_vol, days)
+            # Four decimals, like the Alpha Vantage payloads the functions parse
+            closes = np.round(rng.uniform(20, 400) * np.exp(np.cumsum(returns)), 4)
+            keep = rng.random(days) >= missing_rate
+            keep[-1] = True
+            if picker.random() < late_listings:
+                keep[:days - TRADING_DAYS // 2] = False
+            symbol = symbol_name(prefix, h)
+            self.series[symbol] = ([d for d, k in zip(self.dates, keep) if k], closes[keep].tolist())
+            if picker.random() < split_rate:
+                dates = self.series[symbol][0]
+                self.splits[symbol] = {dates[picker.randrange(len(dates) // 2, len(dates))]: picker.choice((2.0, 3.0, 4.0))}
+
+    def expected_correlation(self) -> float:
+        """Average pairwise correlation implied by the model"""
+        betas, sectors = self.betas, self.sector_of
+        cov = np.outer(betas, betas) * self.market_vol ** 2
+        cov += (sectors[:, None] == sectors[None, :]) * self.sector_vol ** 2
+        sigma = np.sqrt(np.diag(cov) + self.idio_vol ** 2)
+        corr = cov / np.outer(sigma, sigma)
+        k = len(betas)
+        return float((corr.sum() - np.trace(corr)) / (k * (k - 1)))
+
+
+def symbol_name(prefix: str, index: int) -> str:
+    """Ticker-shaped name (letters only, as validateSymbol requires)"""
+    letters = ''
+    while True:
+        letters = string.ascii_uppercase[index % 26] + letters
+        index //= 26
+        if not index:
+            return prefix + letters
+
+
+def reference_portfolio(series: Dict[str, Tuple[List[str], List[float]]], weights: Optional[Dict[str, float]] = None,
+                        lookback: int = TRADING_DAYS) -> Dict[str, Any]:
+    """portfolioRisk from the definitions, with NumPy"""
+    window = math.ceil((lookback + 1) * 1.25)
+    counts: Dict[str, int] = {}
+    for dates, _ in series.values():
+        for date in dates[-window:]:
+            counts[date] = counts.get(date, 0) + 1
+    calendar = sorted(d for d, c in counts.items() if c * 2 >= len(series))[-(lookback + 1):]
+
+    included, excluded = [], []
+    for symbol, (dates, _) in series.items():
+        covered = len(set(dates) & set(calendar))
+        (included if covered >= max(3, len(calendar) * MIN_COVERAGE) else excluded).append(symbol)
+    common_dates = calendar
+    closes = np.empty((len(included), len(calendar)))
+    for row, symbol in enumerate(included):
+        by_date = dict(zip(*series[symbol]))
+        present = [d for d in calendar if d in by_date]
+        last = by_date[present[0]]
+        for column, date in enumerate(calendar):
+            last = by_date.get(date, last)
+            closes[row, column] = last
+    returns = np.diff(np.log(closes), axis=1)
+    cov = np.cov(returns)
+    w = np.array([weights.get(s, 0.0) if weights else 1.0 for s in included])
+    w = w / w.sum()
+    sigma = np.sqrt(np.diag(cov))
+    variance = w @ cov @ w
+    corr = cov / np.outer(sigma, sigma)
+    k = len(included)
+    upper = np.triu_indices(k, 1)
+    best = np.argmax(corr[upper])
+    return {
+        'holdings': k,
+        'excluded': sorted(excluded),
+        'observations': returns.shape[1],
+        'startDate': common_dates[0],
+        'endDate': common_dates[-1],
+        'volatility': float(math.sqrt(variance * TRADING_DAYS) * 100),
+        'diversificationRatio': float(w @ sigma / math.sqrt(variance)),
+        'averageCorrelation': float(corr[upper].mean()),
+        'hhi': float(w @ w),
+        'topPair': {included[upper[0][best]], included[upper[1][best]]},
+        'topCorrelation': float(corr[upper][best]),
+    }
+
+
+def compare(expected: Dict[str, Any], served: Dict[str, Any]) -> List[str]:
+    problems = []
+    for field in ('holdings', 'observations', 'startDate', 'endDate'):
+        if expected[field] != served[field]:
+            problems.append(f"{field}: {expected[field]} vs {served[field]}")
+    excluded = sorted(e['symbol'] for e in served['excluded'])
+    if expected['excluded'] != excluded:
+        problems.append(f"excluded: {expected['excluded']} vs {excluded}")
+    pairs = {
+        'volatility': served['volatility'],
+        'diversificationRatio': served['diversificationRatio'],
+        'averageCorrelation': served['averageCorrelation'],
+        'hhi': served['concentration']['hhi'],
+        'topCorrelation': served['topPairs'][0]['correlation'],
+    }
+    for field, value in pairs.items():
+        if abs(expected[field] - value) > 1e-9 * max(1.0, abs(expected[field])):
+            problems.append(f"{field}: {expected[field]:.10g} vs {value:.10g}")
+    top = served['topPairs'][0]
+    if expected['topPair'] != {top['a'], top['b']}:
+        problems.append(f"top pair: {sorted(expected['topPair'])} vs {[top['a'], top['b']]}")
+    return problems
+
+
+class PortfolioBenchmark:
+    def __init__(self, sizes: Tuple[int, ...] = (50, 100, 250, 500), lookback: int = TRADING_DAYS, seed: int = 0):
+        self.sizes = sizes
+        self.lookback = lookback
+        self.seed = seed
+
+    def panel(self, size: int, prefix: str) -> SyntheticPanel:
+        return SyntheticPanel(size, days=self.lookback + 60, seed=self.seed + size, prefix=prefix)
+
+    def run_reference(self, samples: int = 3) -> List[Dict[str, Any]]:
+        print(f"🧮 Reference portfolio risk, {self.lookback} returns per holding")
+        print(f"{'Holdings':>8} {'p50 ms':>9} {'avg corr':>9} {'model':>7} {'vol %':>7} {'excluded':>9}")
+        results = []
+        for size in self.sizes:
+            panel = self.panel(size, "P")
+            histogram = LatencyHistogram()
+            for _ in range(samples):
+                start = time.perf_counter()
+                reference = reference_portfolio(panel.series, lookback=self.lookback)
+                histogram.record(time.perf_counter() - start)
+            expected = panel.expected_correlation()
+            print(f"{size:8} {histogram.percentile(50):9.1f} {reference['averageCorrelation']:9.3f} {expected:7.3f} "
+                  f"{reference['volatility']:7.1f} {len(reference['excluded']):9}")
+            results.append({
+                'holdings': size, 'latency': histogram.to_dict(), 'average_correlation': reference['averageCorrelation'],
+                'model_correlation': expected, 'volatility': reference['volatility'],
+                'excluded': len(reference['excluded']),
+            })
+        return results
+
+    def run_functions(self, upstream: FakeUpstream, functions_url: str, auth_url: str, upstream_url: str,
+                      max_compute_ms: float) -> Tuple[List[Dict[str, Any]], bool]:
+        from performance_test import AIDiligencePerformanceTester
+
+        tester = AIDiligencePerformanceTester(functions_url, auth_url, upstream_url)
+        tester.upstream_config(latency_ms=0, jitter_ms=0, error_rate=0)
+        # Fresh names per run, so every history is fetched from the panel just loaded
+        run_prefix = 'Q' + ''.join(random.choices(string.ascii_uppercase, k=2))
+        print(f"🛰️  portfolio_risk in the functions (symbols {run_prefix}...)")
+        print(f"{'Holdings':>8} {'fetch ms':>9} {'compute ms':>11} {'total ms':>9} {'match':>6}")
+        results, success = [], True
+        for size in self.sizes:
+            panel = self.panel(size, run_prefix + string.ascii_uppercase[self.sizes.index(size)])
+            for symbol, (dates, closes) in panel.series.items():
+                upstream.load_series(symbol, dates, closes, panel.splits.get(symbol))
+            payload = {'symbols': list(panel.series), 'lookback': self.lookback, 'includeMatrix': False}
+            warming_calls = 0
+            while True:
+                start = time.perf_counter()
+                served = tester.call('mcpPortfolioRisk', payload, timeout=600)
+                total_ms = (time.perf_counter() - start) * 1000
+                if not served['coldFetches']:
+                    break
+                warming_calls += 1
+            reference = reference_portfolio(panel.series, lookback=self.lookback)
+            problems = compare(reference, served['portfolio'])
+            # Equal weights: late listings the alignment drops are the only uncovered weight
+            coverage = reference['holdings'] / size * 100
+            if abs(served['coverage'] - coverage) > 1e-9 or served['complete'] != (reference['holdings'] == size):
+                problems.append(f"coverage: {coverage:.4f}% vs {served['coverage']:.4f}% "
+                                f"(complete {served['complete']})")
+            timings = served['timings']
+            print(f"{size:8} {timings['fetchMs']:9.0f} {timings['computeMs']:11.0f} {total_ms:9.0f} "
+                  f"{'yes' if not problems else 'NO':>6}")
+            for problem in problems:
+                print(f"    {problem}")
+            success = success and not problems and timings['computeMs'] <= max_compute_ms
+            results.append({'holdings': size, 'warming_calls': warming_calls, 'timings': timings,
+                            'total_ms': total_ms, 'problems': problems})
+        return results, success
+
+
+def main():
+    """Run the portfolio risk benchmark"""
+    parser = argparse.ArgumentParser(description="AI Diligence Pro portfolio risk benchmark")
+    parser.add_argument("--sizes", default="50,100,250,500", help="Comma-separated panel sizes (holdings)")
+    parser.add_argument("--lookback", type=int, default=TRADING_DAYS, help="Daily returns per holding")
+    parser.add_argument("--samples", type=int, default=3, help="Reference timing samples per size")
+    parser.add_argument("--functions-url", help="Also run portfolio_risk in the functions emulator")
+    parser.add_argument("--auth-url", default="http://127.0.0.1:9099", help="Auth emulator base URL")
+    parser.add_argument("--upstream-port", type=int, default=8765,
+                        help="Port for the in-process fake upstream the emulator is configured to call")
+    parser.add_argument("--max-compute-ms", type=float, default=1000.0,
+                        help="Fail when the functions' computeMs exceeds this at any size")
+    parser.add_argument("--json", help="Write the results to this JSON file")
+    args = parser.parse_args()
+
+    benchmark = PortfolioBenchmark(tuple(int(s) for s in args.sizes.split(',')), args.lookback)
+    results: Dict[str, Any] = {'timestamp': datetime.now().isoformat(), 'lookback': args.lookback,
+                               'reference': benchmark.run_reference(args.samples)}
+    # The reference must recover the model's correlation structure
+    success = all(abs(r['average_correlation'] - r['model_correlation']) < 0.05 for r in results['reference'])
+
+    if args.functions_url:
+        upstream = FakeUpstream(port=args.upstream_port).start_in_thread()
+        try:
+            results['functions'], functions_ok = benchmark.run_functions(
+                upstream, args.functions_url, args.auth_url, upstream.base_url, args.max_compute_ms)
+        finally:
+            upstream.stop()
+        success = success and functions_ok
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+    print("✅ Portfolio risk benchmark passed" if success else "❌ Portfolio risk benchmark failed")
+    sys.exit(0 if success else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,284 @@
+#!/usr/bin/env python3
+"""
+Realtime Quote Stream Load Test for AI Diligence Pro
+Opens thousands of mcpRealTimeStream subscribers and measures fan-out latency,
+upstream calls per subscriber and server memory per subscriber
+
+The fake upstream moves GLOBAL_QUOTE prices every --tick-seconds so the
+pollers have deltas to push. For numbers worth comparing, let the pollers
+run fast and give them quota in functions/.env.local:
+    REALTIME_POLL_MS=1000
+    ALPHA_VANTAGE_CALLS_PER_MINUTE=6000
+
+Memory per subscriber comes from mcpCacheStats().realtime, sampled while
+streams open, so it assumes every connection lands on the instance that
+answers it (the emulator, or a deployment with max instances 1). Each user
+may open 30 streams per 15 minutes, so subscribers are spread over
+--subscribers-per-user anonymous users.
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import resource
+import sys
+import time
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, Any, List, Optional
+
+import aiohttp
+
+from fake_upstream import FakeUpstream
+from latency_histogram import LatencyHistogram
+from performance_test import AIDiligencePerformanceTester
+
+SYMBOLS = ("AAPL", "MSFT", "GOOGL", "AMZN", "NVDA", "TSLA", "JPM")
+
+
+def raise_open_file_limit(wanted: int):
+    """Every subscriber holds a socket; lift the soft descriptor limit as far as allowed"""
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft < wanted:
+        target = wanted if hard == resource.RLIM_INFINITY else min(wanted, hard)
+        resource.setrlimit(resource.RLIMIT_NOFILE, (target, hard))
+
+
+class RealtimeLoadTester:
+    def __init__(self, tester: AIDiligencePerformanceTester, subscribers: int = 2000, symbols: int = 5,
+                 symbols_per_subscriber: int = 1, connect_rate: float = 200.0, duration: float = 60.0,
+                 tick_seconds: float = 1.0, subscribers_per_user: int = 25):
+        self.tester = tester
+        self.subscribers = subscribers
+        self.symbols = list(SYMBOLS[:max(1, min(symbols, len(SYMBOLS)))])
+        self.symbols_per_subscriber = max(1, min(symbols_per_subscriber, len(self.symbols)))
+        self.connect_rate = connect_rate
+        self.duration = duration
+        self.tick_seconds = tick_seconds
+        self.subscribers_per_user = subscribers_per_user
+
+        self.connect = LatencyHistogram()
+        self.first_snapshot = LatencyHistogram()
+        self.fanout = LatencyHistogram()
+        self.freshness = LatencyHistogram()
+        self.connected = 0
+        self.failures: Dict[str, int] = defaultdict(int)
+        self.events: Dict[str, int] = defaultdict(int)
+        self.deltas_per_subscriber: List[int] = [0] * subscribers
+        # (symbol, seq) -> receive times across subscribers, for the spread of one fan-out
+        self.deliveries: Dict[tuple, List[float]] = defaultdict(list)
+        self.server_samples: List[Dict[str, Any]] = []
+
+    def subscription(self, index: int) -> List[str]:
+        """Symbols for subscriber `index`, rotating so each symbol has about the same audience"""
+        return [self.symbols[(index + i) % len(self.symbols)] for i in range(self.symbols_per_subscriber)]
+
+    async def subscriber(self, session: aiohttp.ClientSession, index: int, token: str, stop: asyncio.Event):
+        params = {'symbols': ','.join(self.subscription(index)), 'token': token}
+        start = time.perf_counter()
+        try:
+            async with session.get(f"{self.tester.functions_url}/mcpRealTimeStream", params=params) as response:
+                if response.status != 200:
+                    self.failures[f"HTTP {response.status}"] += 1
+                    return
+                reader = asyncio.ensure_future(self.read_events(response, index, start))
+                stopper = asyncio.ensure_future(stop.wait())
+                await asyncio.wait({reader, stopper}, return_when=asyncio.FIRST_COMPLETED)
+                if reader.done():
+                    reader.result()
+                    if not stop.is_set():
+                        self.failures['closed by server'] += 1
+                reader.cancel()
+                stopper.cancel()
+        except (aiohttp.ClientError, asyncio.TimeoutError, OSError) as e:
+            self.failures[type(e).__name__] += 1
+
+    async def read_events(self, response: aiohttp.ClientResponse, index: int, start: float):
+        snapshot_seen = False
+        async for raw in response.content:
+            line = raw.decode().strip()
+            if not line.startswith('data:'):
+                continue
+            received = time.time()
+            event = json.loads(line[5:])
+            section, data = event['section'], event['data']
+            self.events[section] += 1
+            if section == 'subscribed':
+                self.connected += 1
+                self.connect.record(time.perf_counter() - start)
+            elif section == 'snapshot' and not snapshot_seen:
+                snapshot_seen = True
+                self.first_snapshot.record(time.perf_counter() - start)
+            elif section == 'delta':
+                self.deltas_per_subscriber[index] += 1
+                self.fanout.record(max(0.0, received - data['at'] / 1000))
+                tick_start = math.floor(data['at'] / 1000 / self.tick_seconds) * self.tick_seconds
+                self.freshness.record(max(0.0, received - tick_start))
+                self.deliveries[(data['symbol'], data['seq'])].append(received)
+            elif section == 'error':
+                self.failures[data.get('message', 'error')] += 1
+
+    async def sample_server(self, stop: asyncio.Event, every: float = 2.0):
+        """Record the instance's hub counters and memory until `stop` is set, and once after"""
+        while True:
+            stats = await asyncio.to_thread(self.tester.call, 'mcpCacheStats', {})
+            self.server_samples.append(stats['realtime'])
+            if stop.is_set():
+                return
+            try:
+                await asyncio.wait_for(stop.wait(), every)
+            except asyncio.TimeoutError:
+                pass
+
+    async def drive(self, tokens: List[str]) -> float:
+        stop = asyncio.Event()
+        ramped = asyncio.Event()
+        sampler = asyncio.ensure_future(self.sample_server(ramped))
+        connector = aiohttp.TCPConnector(limit=0, force_close=True)
+        timeout = aiohttp.ClientTimeout(total=None, sock_connect=30)
+        start = time.monotonic()
+        async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+            tasks = []
+            for index in range(self.subscribers):
+                token = tokens[index // self.subscribers_per_user]
+                tasks.append(asyncio.ensure_future(self.subscriber(session, index, token, stop)))
+                if self.connect_rate > 0:
+                    await asyncio.sleep(1 / self.connect_rate)
+            ramp = time.monotonic() - start
+            # Let the last streams subscribe before the final sample
+            await asyncio.sleep(min(5.0, self.duration))
+            ramped.set()
+            await sampler
+            print(f"    {self.subscribers} subscribers opened in {ramp:.1f}s, {self.connected} confirmed")
+            await asyncio.sleep(max(0.0, self.duration - 5.0))
+            stop.set()
+            await asyncio.gather(*tasks, return_exceptions=True)
+        return time.monotonic() - start
+
+    def memory_per_subscriber(self) -> Optional[Dict[str, float]]:
+        """Growth of server RSS and heap between the fewest- and most-subscribed samples"""
+        if len(self.server_samples) < 2:
+            return None
+        low = min(self.server_samples, key=lambda s: s['subscribers'])
+        high = max(self.server_samples, key=lambda s: s['subscribers'])
+        added = high['subscribers'] - low['subscribers']
+        if added <= 0:
+            return None
+        return {
+            'subscribers': high['subscribers'],
+            'rss_bytes': (high['rss'] - low['rss']) / added,
+            'heap_bytes': (high['heapUsed'] - low['heapUsed']) / added,
+        }
+
+    def run(self) -> Dict[str, Any]:
+        print(f"📡 {self.subscribers} subscribers over {len(self.symbols)} symbols "
+              f"({self.symbols_per_subscriber} per stream), {self.duration:.0f}s, quotes tick every "
+              f"{self.tick_seconds:g}s")
+        raise_open_file_limit(self.subscribers + 256)
+        users = math.ceil(self.subscribers / self.subscribers_per_user)
+        tokens = [self.tester.sign_in() for _ in range(users)]
+        self.tester.upstream_config(quote_tick_seconds=self.tick_seconds, latency_ms=20, jitter_ms=0, error_rate=0)
+        self.tester.upstream_reset()
+        try:
+            elapsed = asyncio.run(self.drive(tokens))
+        finally:
+            self.tester.upstream_config(quote_tick_seconds=0)
+        upstream_calls = self.tester.upstream_hits().get('GLOBAL_QUOTE', 0)
+
+        spreads = LatencyHistogram()
+        for times in self.deliveries.values():
+            if len(times) > 1:
+                spreads.record(max(times) - min(times))
+        silent = sum(1 for count in self.deltas_per_subscriber if not count)
+        memory = self.memory_per_subscriber()
+        interval_ms = self.server_samples[-1]['intervalMs'] if self.server_samples else None
+
+        print(f"{'Metric':24} {'p50 ms':>9} {'p90 ms':>9} {'p99 ms':>9} {'count':>8}")
+        for label, histogram in (('connect', self.connect), ('first snapshot', self.first_snapshot),
+                                 ('fan-out (poll->client)', self.fanout), ('freshness (tick->client)', self.freshness),
+                                 ('spread per delta', spreads)):
+            print(f"{label:24} {histogram.percentile(50):9.1f} {histogram.percentile(90):9.1f} "
+                  f"{histogram.percentile(99):9.1f} {histogram.count:8}")
+        print(f"🔁 {upstream_calls} GLOBAL_QUOTE calls for {self.subscribers} subscribers in {elapsed:.0f}s "
+              f"(poll interval {interval_ms} ms); {silent} subscribers saw no delta")
+        if memory:
+            print(f"💾 Server memory per subscriber: {memory['rss_bytes'] / 1024:.1f} KiB RSS, "
+                  f"{memory['heap_bytes'] / 1024:.1f} KiB heap (at {memory['subscribers']} subscribers)")
+        if self.failures:
+            print(f"⚠️  Failures: {dict(self.failures)}")
+
+        return {
+            'timestamp': datetime.now().isoformat(),
+            'subscribers': self.subscribers,
+            'connected': self.connected,
+            'symbols': self.symbols,
+            'symbols_per_subscriber': self.symbols_per_subscriber,
+            'duration': elapsed,
+            'tick_seconds': self.tick_seconds,
+            'poll_interval_ms': interval_ms,
+            'connect': self.connect.to_dict(),
+            'first_snapshot': self.first_snapshot.to_dict(),
+            'fanout': self.fanout.to_dict(),
+            'freshness': self.freshness.to_dict(),
+            'spread': spreads.to_dict(),
+            'events': dict(self.events),
+            'silent_subscribers': silent,
+            'upstream_quote_calls': upstream_calls,
+            'memory_per_subscriber': memory,
+            'failures': dict(self.failures),
+        }
+
+
+def main():
+    """Run the subscriber load test"""
+    parser = argparse.ArgumentParser(description="AI Diligence Pro realtime quote stream load test")
+    parser.add_argument("--functions-url", default="http://127.0.0.1:5001/ai-diligence/us-central1",
+                        help="Functions base URL including project and region")
+    parser.add_argument("--auth-url", default="http://127.0.0.1:9099", help="Auth emulator base URL")
+    parser.add_argument("--upstream-port", type=int, default=8765,
+                        help="Port for the in-process fake upstream the emulator is configured to call")
+    parser.add_argument("--external-upstream", help="Use an already running fake upstream at this URL")
+    parser.add_argument("--subscribers", type=int, default=2000, help="Streams to open")
+    parser.add_argument("--symbols", type=int, default=5, help=f"Distinct symbols (at most {len(SYMBOLS)})")
+    parser.add_argument("--symbols-per-subscriber", type=int, default=1, help="Symbols requested by each stream")
+    parser.add_argument("--connect-rate", type=float, default=200.0, help="New streams per second (0 = all at once)")
+    parser.add_argument("--duration", type=float, default=60.0, help="Seconds to stay subscribed after the ramp")
+    parser.add_argument("--tick-seconds", type=float, default=1.0, help="How often the fake upstream moves prices")
+    parser.add_argument("--subscribers-per-user", type=int, default=25,
+                        help="Streams per anonymous user (each stream costs one rate-limit unit)")
+    parser.add_argument("--max-fanout-ms", type=float, default=500.0, help="Fail above this p99 fan-out latency")
+    parser.add_argument("--json", help="Write the results to this JSON file")
+    args = parser.parse_args()
+
+    upstream = None
+    upstream_url = args.external_upstream
+    if not upstream_url:
+        upstream = FakeUpstream(port=args.upstream_port).start_in_thread()
+        upstream_url = upstream.base_url
+
+    tester = AIDiligencePerformanceTester(args.functions_url, args.auth_url, upstream_url)
+    try:
+        results = RealtimeLoadTester(tester, args.subscribers, args.symbols, args.symbols_per_subscriber,
+                                     args.connect_rate, args.duration, args.tick_seconds,
+                                     args.subscribers_per_user).run()
+    finally:
+        if upstream:
+            upstream.stop()
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    # Every stream must connect and see deltas, fan-out must stay fast, and the
+    # upstream must be polled per symbol, not per subscriber
+    polls_per_symbol = results['duration'] * 1000 / (results['poll_interval_ms'] or 1) + 2
+    success = (results['connected'] == args.subscribers and not results['silent_subscribers']
+               and results['fanout'].get('p99_ms', float('inf')) <= args.max_fanout_ms
+               and results['upstream_quote_calls'] <= len(results['symbols']) * polls_per_symbol)
+    print("✅ Realtime fan-out held up" if success else "❌ Realtime fan-out fell short")
+    sys.exit(0 if success else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,339 @@
+#!/usr/bin/env python3
+"""
+Batched Sentiment Benchmark for AI Diligence Pro
+One chat completion per company versus several companies per structured
+completion, against the OpenAI stand-in in fake_upstream.py
+
+By default the harness drives an in-process fake upstream directly with the
+same prompts, bounded pool and 429 handling as
+AIAnalysisService.analyzeSentimentBatch and the OpenAI client in
+functions/src/utils/upstreams.ts. The fake charges a fixed per-request
+latency (--latency-ms) plus generation time per completion token
+(--tokens-per-second), and --requests-per-minute turns on its 429 quota.
+Per batch size it reports completions sent, requests saved against one per
+company, 429s, tokens and tokens/sec, and per-symbol latency (submission
+until that company's result arrives).
+
+With --functions-url the same batch sizes run through
+mcpSentimentBatch in the emulator instead, reading tokens from
+the fake upstream the emulator calls (OPENAI_BASE_URL and OPENAI_API_KEY in
+functions/.env.local, as in CI) and 429 handling from
+mcpCacheStats().openAIRateLimits. A last call against an upstream that
+rejects everything checks the client gives up after OPENAI_MAX_RETRIES.
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import sys
+import time
+from datetime import datetime
+from typing import Dict, Any, List, Optional, Tuple
+
+import aiohttp
+
+from fake_upstream import FakeUpstream
+from latency_histogram import LatencyHistogram
+
+SYSTEM_PROMPT = 'You are a financial analyst expert in sentiment analysis.'
+ARTICLES = 5
+TOKENS_PER_COMPANY = 120
+MAX_RETRIES = 4
+RETRY_BASE_S = 1.0
+RETRY_MAX_S = 30.0
+
+HEADLINE_WORDS = ("beats", "misses", "raises", "cuts", "guidance", "revenue", "margin", "outlook", "buyback",
+                  "probe", "launch", "demand", "supply", "upgrade", "downgrade", "record", "quarter", "forecast")
+
+
+def synthetic_articles(symbol: str, count: int = ARTICLES) -> List[str]:
+    """Headline-plus-summary strings shaped like the ones the functions build from news"""
+    rng = random.Random(symbol)
+    articles = []
+    for _ in range(count):
+        title = f"{symbol} {' '.join(rng.choice(HEADLINE_WORDS) for _ in range(6))}"
+        description = ' '.join(rng.choice(HEADLINE_WORDS) for _ in range(30))
+        articles.append(f"{title}. {description}")
+    return articles
+
+
+def single_body(company: str, articles: List[str]) -> Dict[str, Any]:
+    """The request AIAnalysisService.analyzeSentiment sends"""
+    joined = '\n\n'.join(articles[:ARTICLES])
+    prompt = f"""Analyze the sentiment of the following news articles about {company}.
+      Provide a sentiment score from -1 (very negative) to 1 (very positive), a label (positive/negative/neutral),
+      and confidence level (0-1). Also identify key themes.
+
+      Articles:
+      {joined}
+
+      Respond in JSON format: {{ "score": number, "label": string, "confidence": number, "themes": string[] }}"""
+    return {'model': 'gpt-4', 'messages': [{'role': 'system', 'content': SYSTEM_PROMPT},
+                                           {'role': 'user', 'content': prompt}],
+            'temperature': 0.3, 'max_tokens': 500}
+
+
+def batch_body(companies: List[Tuple[str, List[str]]]) -> Dict[str, Any]:
+    """The request AIAnalysisService.analyzeSentimentBatch sends for one batch"""
+    entries = [{'id': symbol, 'company': symbol, 'articles': articles[:ARTICLES]} for symbol, articles in companies]
+    prompt = f"""Analyze the sentiment of the news articles about each company below.
+      For each company provide a sentiment score from -1 (very negative) to 1 (very positive),
+      a label (positive/negative/neutral), confidence level (0-1) and key themes.
+
+      Respond in JSON format, with one result per company id:
+      {{ "results": [{{ "id": string, "score": number, "label": string, "confidence": number, "themes": string[] }}] }}
+
+      Companies (JSON):
+      {json.dumps(entries, separators=(',', ':'))}"""
+    return {'model': 'gpt-4', 'messages': [{'role': 'system', 'content': SYSTEM_PROMPT},
+                                           {'role': 'user', 'content': prompt}],
+            'temperature': 0.3, 'max_tokens': TOKENS_PER_COMPANY * len(companies)}
+
+
+class RateLimitedClient:
+    """Chat completions with at most `concurrency` in flight, retrying 429s like the functions' OpenAI client"""
+
+    def __init__(self, session: aiohttp.ClientSession, url: str, concurrency: int):
+        self.session = session
+        self.url = url
+        self.pool = asyncio.Semaphore(concurrency)
+        self.counters = {'requests': 0, 'throttled': 0, 'retried': 0, 'exhausted': 0,
+                         'prompt_tokens': 0, 'completion_tokens': 0}
+        self.request_latency = LatencyHistogram()
+
+    async def complete(self, body: Dict[str, Any]) -> Optional[str]:
+        async with self.pool:
+            for attempt in range(1, MAX_RETRIES + 2):
+                self.counters['requests'] += 1
+                start = time.perf_counter()
+                async with self.session.post(self.url, json=body,
+                                             headers={'Authorization': 'Bearer fake'}) as response:
+                    payload = await response.json()
+                    if response.status != 429:
+                        self.request_latency.record(time.perf_counter() - start)
+                        if response.status != 200:
+                            return None
+                        usage = payload.get('usage', {})
+                        self.counters['prompt_tokens'] += usage.get('prompt_tokens', 0)
+                        self.counters['completion_tokens'] += usage.get('completion_tokens', 0)
+                        return payload['choices'][0]['message']['content']
+                    retry_after = response.headers.get('Retry-After')
+                self.counters['throttled'] += 1
+                if attempt > MAX_RETRIES:
+                    self.counters['exhausted'] += 1
+                    return None
+                if retry_after is not None:
+                    delay = float(retry_after) + random.random() * RETRY_BASE_S
+                else:
+                    delay = random.random() * RETRY_BASE_S * 2 ** (attempt - 1)
+                await asyncio.sleep(min(delay, RETRY_MAX_S))
+                self.counters['retried'] += 1
+        return None
+
+
+class SentimentBatchBenchmark:
+    def __init__(self, symbols: int = 100, batch_sizes: Tuple[int, ...] = (1, 4, 8, 16), concurrency: int = 4):
+        self.symbols = [f"S{i:03d}" for i in range(symbols)]
+        self.batch_sizes = batch_sizes
+        self.concurrency = concurrency
+        self.articles = {symbol: synthetic_articles(symbol) for symbol in self.symbols}
+
+    async def run_direct(self, url: str, batch_size: int) -> Dict[str, Any]:
+        """Every symbol once at `batch_size` companies per completion"""
+        per_symbol = LatencyHistogram()
+        answered = 0
+        async with aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=self.concurrency)) as session:
+            client = RateLimitedClient(session, url, self.concurrency)
+            start = time.perf_counter()
+
+            async def run_batch(symbols: List[str]):
+                nonlocal answered
+                if batch_size == 1:
+                    content = await client.complete(single_body(symbols[0], self.articles[symbols[0]]))
+                    ok = {symbols[0]} if content and 'score' in json.loads(content) else set()
+                else:
+                    content = await client.complete(batch_body([(s, self.articles[s]) for s in symbols]))
+                    results = json.loads(content).get('results', []) if content else []
+                    ok = {r.get('id') for r in results} & set(symbols)
+                elapsed = time.perf_counter() - start
+                for _ in symbols:
+                    per_symbol.record(elapsed)
+                answered += len(ok)
+
+            batches = [self.symbols[i:i + batch_size] for i in range(0, len(self.symbols), batch_size)]
+            await asyncio.gather(*(run_batch(batch) for batch in batches))
+            wall = time.perf_counter() - start
+        return self.summarize(batch_size, len(batches), wall, per_symbol, answered, client.counters,
+                              client.request_latency.to_dict())
+
+    def summarize(self, batch_size: int, completions: int, wall: float, per_symbol: LatencyHistogram,
+                  answered: int, counters: Dict[str, int], request_latency: Dict[str, Any]) -> Dict[str, Any]:
+        tokens = counters['prompt_tokens'] + counters['completion_tokens']
+        return {
+            'batch_size': batch_size,
+            'symbols': len(self.symbols),
+            'answered': answered,
+            'completions': completions,
+            'requests': counters['requests'],
+            'requests_saved': len(self.symbols) - completions,
+            'throttled': counters['throttled'],
+            'retried': counters['retried'],
+            'exhausted': counters['exhausted'],
+            'prompt_tokens': counters['prompt_tokens'],
+            'completion_tokens': counters['completion_tokens'],
+            'wall_s': wall,
+            'tokens_per_second': tokens / wall if wall else 0.0,
+            'symbols_per_second': len(self.symbols) / wall if wall else 0.0,
+            'latency_per_symbol': per_symbol.to_dict(),
+            'request_latency': request_latency,
+        }
+
+    def run_functions(self, functions_url: str, auth_url: str, upstream_url: str) -> List[Dict[str, Any]]:
+        from performance_test import AIDiligencePerformanceTester
+
+        tester = AIDiligencePerformanceTester(functions_url, auth_url, upstream_url)
+        results = []
+        for batch_size in self.batch_sizes:
+            before = tester.session.get(f"{tester.upstream_url}/__stats", timeout=5).json()
+            limits_before = tester.call('mcpCacheStats', {})['openAIRateLimits']
+            start = time.perf_counter()
+            served = tester.call('mcpSentimentBatch', {'symbols': self.symbols, 'batchSize': batch_size,
+                                                       'concurrency': self.concurrency, 'allowCached': False},
+                                 timeout=600)
+            wall = time.perf_counter() - start
+            after = tester.session.get(f"{tester.upstream_url}/__stats", timeout=5).json()
+            limits = tester.call('mcpCacheStats', {})['openAIRateLimits']
+
+            def delta(group: str, key: str) -> int:
+                return after[group].get(key, 0) - before[group].get(key, 0)
+
+            # 429s as the functions' OpenAI client saw and handled them
+            counters = {'requests': delta('hits', 'chat.completions'),
+                        **{key: limits[key] - limits_before[key] for key in ('throttled', 'retried', 'exhausted')},
+                        'prompt_tokens': delta('tokens', 'prompt'), 'completion_tokens': delta('tokens', 'completion')}
+            # One callable returns every symbol at once, so each waited the full call
+            per_symbol = LatencyHistogram()
+            analysis_s = served['timings']['analysisMs'] / 1000
+            for _ in self.symbols:
+                per_symbol.record(analysis_s)
+            summary = self.summarize(batch_size, served['batches'], analysis_s, per_symbol,
+                                     len(served['sentiment']), counters, {})
+            summary['call_wall_s'] = wall
+            summary['unanswered'] = len(served['unanswered'])
+            summary['news_ms'] = served['timings']['newsMs']
+            results.append(summary)
+        return results
+
+    def check_retry_cap(self, functions_url: str, auth_url: str, upstream_url: str) -> Dict[str, Any]:
+        """One completion against an upstream that answers every call with 429 (no Retry-After)
+
+        The functions' OpenAI client must give up after OPENAI_MAX_RETRIES
+        retries: the upstream sees exactly one more call than the client
+        retried, and the call counts once as exhausted.
+        """
+        from performance_test import AIDiligencePerformanceTester
+
+        tester = AIDiligencePerformanceTester(functions_url, auth_url, upstream_url)
+        tester.upstream_config(openai_reject_all=True, latency_ms=0, openai_tokens_per_second=0)
+        try:
+            hits_before = tester.upstream_hits().get('chat.completions', 0)
+            limits_before = tester.call('mcpCacheStats', {})['openAIRateLimits']
+            start = time.perf_counter()
+            served = tester.call('mcpSentimentBatch', {'symbols': [tester.fresh_symbol()], 'batchSize': 1,
+                                                       'allowCached': False}, timeout=300)
+            wall = time.perf_counter() - start
+            hits = tester.upstream_hits().get('chat.completions', 0) - hits_before
+            limits = tester.call('mcpCacheStats', {})['openAIRateLimits']
+        finally:
+            tester.upstream_config(openai_reject_all=False)
+        retried = limits['retried'] - limits_before['retried']
+        exhausted = limits['exhausted'] - limits_before['exhausted']
+        return {'upstream_calls': hits, 'retried': retried, 'exhausted': exhausted, 'wall_s': wall,
+                'answered': len(served['sentiment']), 'passed': exhausted == 1 and hits == retried + 1}
+
+
+def print_results(title: str, results: List[Dict[str, Any]]):
+    print(f"\n{title}")
+    print(f"{'Batch':>5} {'Requests':>9} {'Saved':>6} {'429s':>5} {'Tokens':>8} {'Tok/s':>7} "
+          f"{'Wall s':>7} {'p50/sym ms':>11} {'p99/sym ms':>11} {'Answered':>9}")
+    for r in results:
+        latency = r['latency_per_symbol']
+        print(f"{r['batch_size']:5} {r['requests']:9} {r['requests_saved']:6} {r['throttled']:5} "
+              f"{r['prompt_tokens'] + r['completion_tokens']:8} {r['tokens_per_second']:7.0f} {r['wall_s']:7.2f} "
+              f"{latency.get('p50_ms', 0):11.0f} {latency.get('p99_ms', 0):11.0f} "
+              f"{r['answered']:>4}/{r['symbols']:<4}")
+    baseline = next((r for r in results if r['batch_size'] == 1), None)
+    if baseline:
+        for r in results:
+            if r is baseline or not baseline['wall_s']:
+                continue
+            tokens = r['prompt_tokens'] + r['completion_tokens']
+            base_tokens = baseline['prompt_tokens'] + baseline['completion_tokens']
+            print(f"  batch {r['batch_size']}: {baseline['requests'] / max(r['requests'], 1):.1f}x fewer requests, "
+                  f"{(1 - tokens / max(base_tokens, 1)) * 100:.0f}% fewer tokens, "
+                  f"{baseline['wall_s'] / max(r['wall_s'], 1e-9):.2f}x wall-clock speedup")
+
+
+def main():
+    """Run the batched sentiment benchmark"""
+    parser = argparse.ArgumentParser(description="AI Diligence Pro batched sentiment benchmark")
+    parser.add_argument("--symbols", type=int, default=100, help="Companies analyzed per batch size")
+    parser.add_argument("--batch-sizes", default="1,4,8,16", help="Comma-separated companies per completion")
+    parser.add_argument("--concurrency", type=int, default=4, help="Completions in flight")
+    parser.add_argument("--latency-ms", type=float, default=400.0, help="Fake per-request overhead (direct mode)")
+    parser.add_argument("--tokens-per-second", type=float, default=60.0,
+                        help="Fake completion generation speed (direct mode; 0 = instant)")
+    parser.add_argument("--requests-per-minute", type=int, default=0,
+                        help="Fake OpenAI quota; calls over it get 429 with Retry-After (0 = unlimited)")
+    parser.add_argument("--functions-url", help="Run through mcpSentimentBatch in the emulator instead")
+    parser.add_argument("--auth-url", default="http://127.0.0.1:9099", help="Auth emulator base URL")
+    parser.add_argument("--upstream-url", default="http://127.0.0.1:8765",
+                        help="Fake upstream the emulator calls (--functions-url mode)")
+    parser.add_argument("--json", help="Write the results to this JSON file")
+    args = parser.parse_args()
+
+    benchmark = SentimentBatchBenchmark(args.symbols, tuple(int(s) for s in args.batch_sizes.split(',')),
+                                        args.concurrency)
+    fake_config = {'latency_ms': args.latency_ms, 'jitter_ms': 0, 'error_rate': 0,
+                   'openai_tokens_per_second': args.tokens_per_second,
+                   'openai_calls_per_minute': args.requests_per_minute}
+    if args.functions_url:
+        from performance_test import AIDiligencePerformanceTester
+        AIDiligencePerformanceTester(args.functions_url, args.auth_url, args.upstream_url).upstream_config(**fake_config)
+        results = benchmark.run_functions(args.functions_url, args.auth_url, args.upstream_url)
+        retry_cap = benchmark.check_retry_cap(args.functions_url, args.auth_url, args.upstream_url)
+        title = f"🛰️  sentiment_batch in the functions, {args.symbols} symbols"
+    else:
+        retry_cap = None
+        upstream = FakeUpstream(port=0, seed=1).start_in_thread()
+        upstream.config.update(fake_config)
+        results = []
+        try:
+            for batch_size in benchmark.batch_sizes:
+                # Each batch size starts with a fresh quota window
+                upstream.reset()
+                results.append(asyncio.run(benchmark.run_direct(f"{upstream.base_url}/v1/chat/completions",
+                                                                batch_size)))
+        finally:
+            upstream.stop()
+        title = (f"🧠 Batched sentiment against the OpenAI stand-in, {args.symbols} symbols, "
+                 f"concurrency {args.concurrency}")
+    print_results(title, results)
+    if retry_cap:
+        print(f"\n🔁 Always-429 upstream: {retry_cap['upstream_calls']} calls, {retry_cap['retried']} retries, "
+              f"{retry_cap['exhausted']} exhausted in {retry_cap['wall_s']:.1f}s "
+              f"({'capped' if retry_cap['passed'] else 'NOT capped'})")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'timestamp': datetime.now().isoformat(), 'config': fake_config, 'results': results,
+                       'retry_cap': retry_cap}, f, indent=2)
+    success = all(r['answered'] == r['symbols'] for r in results)
+    print("✅ Every symbol answered" if success else "❌ Some symbols went unanswered")
+    success = success and (retry_cap is None or retry_cap['passed'])
+    sys.exit(0 if success else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -2,11 +2,23 @@
 """
 Simple Frontend Test for AI Diligence Pro
 Tests the application accessibility and basic functionality
+With --perf, also profiles the page through Chrome DevTools Protocol and
+appends one JSON record per run (--perf-json) for tracking across releases.
+With --users N, runs N browser sessions at once in a process pool and reports
+per-step latency percentiles across them
 """
 
+import argparse
+import contextlib
+import json
+import os
 import requests
 import time
 import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+from typing import Dict, Any, Optional
+
 from selenium import webdriver
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
@@ -14,10 +26,54 @@ from selenium.webdriver.support import expected_conditions as EC
 from selenium.webdriver.chrome.options import Options
 from selenium.common.exceptions import TimeoutException, NoSuchElementException
 
+from latency_histogram import LatencyHistogram
+
+# Installed before any page script runs, so LCP and long tasks are observed from navigation start
+PERF_OBSERVER_SCRIPT = """
+window.__perf = {lcp: null, longTasks: []};
+try {
+  new PerformanceObserver((list) => {
+    for (const entry of list.getEntries()) window.__perf.lcp = entry.renderTime || entry.loadTime || entry.startTime;
+  }).observe({type: 'largest-contentful-paint', buffered: true});
+  new PerformanceObserver((list) => {
+    for (const entry of list.getEntries()) window.__perf.longTasks.push([entry.startTime, entry.duration]);
+  }).observe({type: 'longtask', buffered: true});
+} catch (e) {}
+"""
+
+# Resolves window.__reportRendered (performance.now()) once the report or an error shows up
+REPORT_WATCH_SCRIPT = """
+const xpath = arguments[0];
+window.__reportRendered = null;
+const found = () => document.evaluate(xpath, document, null, XPathResult.FIRST_ORDERED_NODE_TYPE, null).singleNodeValue;
+const observer = new MutationObserver(() => {
+  const node = found();
+  if (node) {
+    window.__reportRendered = {at: performance.now(), text: node.textContent.slice(0, 80)};
+    observer.disconnect();
+  }
+});
+observer.observe(document.body, {childList: true, subtree: true, characterData: true});
+"""
+
+REPORT_BUTTON_XPATH = ("//button[contains(., 'Generate Comprehensive Report') or normalize-space(.)='Generate Report']")
+REPORT_READY_XPATH = ("//*[contains(text(), 'Due Diligence Report') or contains(text(), 'Failed to generate report')]"
+                      " | //iframe[@title='Report']")
+
+NAVIGATION_FIELDS = ("domainLookupStart", "domainLookupEnd", "connectStart", "connectEnd", "requestStart",
+                     "responseStart", "responseEnd", "domInteractive", "domContentLoadedEventEnd",
+                     "loadEventEnd", "transferSize")
+
+# Step timings in the order a user goes through them
+SESSION_STEPS = ("application_load_ms", "enter_dashboard_ms", "select_symbol_ms", "esg_data_ms", "report_render_ms")
+
+
 class SimpleFrontendTester:
-    def __init__(self, base_url="http://localhost:3001"):
+    def __init__(self, base_url="http://localhost:3001", performance=False):
         self.base_url = base_url
+        self.performance = performance
         self.driver = None
+        self.step_timings: Dict[str, Optional[float]] = {}
         self.setup_driver()
         
     def setup_driver(self):
@@ -28,10 +84,15 @@ class SimpleFrontendTester:
         chrome_options.add_argument("--disable-dev-shm-usage")
         chrome_options.add_argument("--disable-gpu")
         chrome_options.add_argument("--window-size=1920,1080")
+        if self.performance:
+            chrome_options.set_capability("goog:loggingPrefs", {"performance": "ALL", "browser": "ALL"})
         
         try:
             self.driver = webdriver.Chrome(options=chrome_options)
             print("✅ Chrome driver initialized successfully")
+            if self.performance:
+                self.driver.execute_cdp_cmd("Page.addScriptToEvaluateOnNewDocument", {"source": PERF_OBSERVER_SCRIPT})
+                self.driver.execute_cdp_cmd("Performance.enable", {})
         except Exception as e:
             print(f"❌ Failed to initialize Chrome driver: {e}")
             sys.exit(1)
@@ -40,12 +101,14 @@ class SimpleFrontendTester:
         """Test if the application loads successfully"""
         try:
             print(f"🔄 Loading application from {self.base_url}")
+            start = time.perf_counter()
             self.driver.get(self.base_url)
             
             # Wait for the page to load
             WebDriverWait(self.driver, 10).until(
                 EC.presence_of_element_located((By.TAG_NAME, "body"))
             )
+            self.step_timings['application_load_ms'] = (time.perf_counter() - start) * 1000
             
             # Check if the title contains AI Diligence Pro
             title = self.driver.title
@@ -79,17 +142,16 @@ class SimpleFrontendTester:
             print("✅ Found 'Enter Demo Platform' button")
             
             # Click the demo button
+            start = time.perf_counter()
             demo_button.click()
             print("🔄 Clicked 'Enter Demo Platform' button")
             
-            # Wait for dashboard to load
-            time.sleep(3)
-            
             # Check if we're in the dashboard
             try:
-                dashboard_title = WebDriverWait(self.driver, 10).until(
+                dashboard_title = WebDriverWait(self.driver, 15).until(
                     EC.presence_of_element_located((By.XPATH, "//*[contains(text(), 'MCP Dashboard')]"))
                 )
+                self.step_timings['enter_dashboard_ms'] = (time.perf_counter() - start) * 1000
                 print("✅ Successfully entered dashboard")
                 return True
             except TimeoutException:
@@ -114,9 +176,11 @@ class SimpleFrontendTester:
                 # Try to select MSFT
                 from selenium.webdriver.support.ui import Select
                 select = Select(stock_selector)
+                start = time.perf_counter()
                 select.select_by_value("MSFT")
                 print("🔄 Changed stock symbol to MSFT")
-                time.sleep(2)
+                self.wait_for_network_idle()
+                self.step_timings['select_symbol_ms'] = (time.perf_counter() - start) * 1000
             except NoSuchElementException:
                 print("⚠️ Stock selector not found")
             
@@ -124,19 +188,24 @@ class SimpleFrontendTester:
             try:
                 esg_button = self.driver.find_element(By.XPATH, "//*[contains(text(), 'Get ESG Data')]")
                 print("✅ Found 'Get ESG Data' button")
+                start = time.perf_counter()
                 esg_button.click()
                 print("🔄 Clicked 'Get ESG Data' button")
-                time.sleep(3)
+                self.wait_for_network_idle()
+                self.step_timings['esg_data_ms'] = (time.perf_counter() - start) * 1000
             except NoSuchElementException:
                 print("⚠️ ESG button not found")
             
             # Test Due Diligence Report button
             try:
-                report_button = self.driver.find_element(By.XPATH, "//*[contains(text(), 'Generate Comprehensive Report')]")
-                print("✅ Found 'Generate Comprehensive Report' button")
-                report_button.click()
-                print("🔄 Clicked 'Generate Comprehensive Report' button")
-                time.sleep(5)
+                report_button = self.driver.find_element(By.XPATH, REPORT_BUTTON_XPATH)
+                print(f"✅ Found '{report_button.text}' button")
+                report_ms = self.measure_report_generation(report_button)
+                self.step_timings['report_render_ms'] = report_ms
+                if report_ms is None:
+                    print("⚠️ Report did not render within the timeout")
+                else:
+                    print(f"⏱️ Report rendered {report_ms:.0f} ms after the click")
             except NoSuchElementException:
                 print("⚠️ Report generation button not found")
             
@@ -153,6 +222,116 @@ class SimpleFrontendTester:
             print(f"❌ Error during dashboard feature test: {e}")
             return False
     
+    def wait_for_network_idle(self, quiet_ms: int = 500, timeout: float = 15):
+        """Wait until no new resource has loaded for `quiet_ms` (replaces fixed sleeps)"""
+        state = {'count': -1, 'since': time.monotonic()}
+
+        def settled(driver):
+            count = driver.execute_script("return performance.getEntriesByType('resource').length")
+            now = time.monotonic()
+            if count != state['count']:
+                state['count'], state['since'] = count, now
+            return now - state['since'] >= quiet_ms / 1000
+
+        try:
+            WebDriverWait(self.driver, timeout, poll_frequency=0.05).until(settled)
+        except TimeoutException:
+            print("⚠️ Network did not go idle within the timeout")
+
+    def measure_report_generation(self, report_button, timeout: float = 120) -> Optional[float]:
+        """Click the report button; milliseconds (browser clock) until the report or an error renders"""
+        company_inputs = self.driver.find_elements(By.XPATH, "//input[contains(@placeholder, 'Company Name')]")
+        if company_inputs:
+            company_inputs[0].clear()
+            company_inputs[0].send_keys("Microsoft")
+        self.driver.execute_script(REPORT_WATCH_SCRIPT, REPORT_READY_XPATH)
+        clicked_at = self.driver.execute_script("const t = performance.now(); arguments[0].click(); return t;",
+                                                report_button)
+        print("🔄 Clicked report generation button")
+        try:
+            rendered = WebDriverWait(self.driver, timeout, poll_frequency=0.05).until(
+                lambda driver: driver.execute_script("return window.__reportRendered")
+            )
+        except TimeoutException:
+            return None
+        if 'Failed' in rendered['text']:
+            print(f"⚠️ Report generation failed: {rendered['text']}")
+            return None
+        return rendered['at'] - clicked_at
+
+    def collect_performance_metrics(self) -> Dict[str, Any]:
+        """Navigation Timing, paint, LCP, long tasks, CDP runtime metrics and network totals"""
+        timing = self.driver.execute_script("""
+            const nav = performance.getEntriesByType('navigation')[0];
+            const fcp = performance.getEntriesByName('first-contentful-paint')[0];
+            return {
+              navigation: nav ? nav.toJSON() : null,
+              fcp: fcp ? fcp.startTime : null,
+              perf: window.__perf || null
+            };
+        """)
+        navigation = timing['navigation'] or {}
+        perf = timing['perf'] or {}
+        long_tasks = [duration for _, duration in perf.get('longTasks', [])]
+        metrics = {
+            'navigation_ms': {field: navigation.get(field) for field in NAVIGATION_FIELDS},
+            'ttfb_ms': navigation.get('responseStart'),
+            'dom_content_loaded_ms': navigation.get('domContentLoadedEventEnd'),
+            'load_ms': navigation.get('loadEventEnd'),
+            'fcp_ms': timing['fcp'],
+            'lcp_ms': perf.get('lcp'),
+            'long_tasks': {
+                'count': len(long_tasks),
+                'total_ms': sum(long_tasks),
+                'max_ms': max(long_tasks, default=0),
+                # Total blocking time: the part of each long task beyond 50 ms
+                'blocking_ms': sum(max(0.0, d - 50) for d in long_tasks),
+            },
+        }
+
+        cdp = self.driver.execute_cdp_cmd("Performance.getMetrics", {})
+        wanted = ("JSHeapUsedSize", "ScriptDuration", "LayoutDuration", "RecalcStyleDuration", "TaskDuration", "Nodes")
+        metrics['cdp'] = {m['name']: m['value'] for m in cdp.get('metrics', []) if m['name'] in wanted}
+
+        # Network totals from the DevTools performance log (drained on read)
+        requests_sent, encoded_bytes, failed = 0, 0, 0
+        for entry in self.driver.get_log('performance'):
+            message = json.loads(entry['message'])['message']
+            method = message.get('method')
+            if method == 'Network.requestWillBeSent':
+                requests_sent += 1
+            elif method == 'Network.loadingFinished':
+                encoded_bytes += message['params'].get('encodedDataLength', 0)
+            elif method == 'Network.loadingFailed':
+                failed += 1
+        metrics['network'] = {'requests': requests_sent, 'encoded_bytes': encoded_bytes, 'failed': failed}
+        return metrics
+
+    def run_performance_profile(self) -> Dict[str, Any]:
+        """Run the user journey once with timings and return one JSON-serialisable record"""
+        print("🚀 Profiling AI Diligence Pro Frontend")
+        print("=" * 50)
+        record: Dict[str, Any] = {'timestamp': datetime.now().isoformat(), 'base_url': self.base_url}
+        steps = {
+            'application_load': self.test_application_load(),
+            'authentication': self.test_authentication_screen(),
+            'dashboard_features': self.test_dashboard_features(),
+        }
+        record.update(self.collect_performance_metrics())
+        record['steps'] = dict(self.step_timings)
+        record['checks'] = steps
+        record['success'] = all(steps.values()) and self.step_timings.get('report_render_ms') is not None
+
+        print("=" * 50)
+        print("📊 Frontend Performance")
+        for label, value in (('TTFB', record['ttfb_ms']), ('FCP', record['fcp_ms']), ('LCP', record['lcp_ms']),
+                             ('DOMContentLoaded', record['dom_content_loaded_ms']), ('Load', record['load_ms']),
+                             ('Report render', self.step_timings.get('report_render_ms'))):
+            print(f"{label:18} {value:10.1f} ms" if value is not None else f"{label:18} {'n/a':>10}")
+        tasks = record['long_tasks']
+        print(f"{'Long tasks':18} {tasks['count']:10} ({tasks['total_ms']:.0f} ms, TBT {tasks['blocking_ms']:.0f} ms)")
+        return record
+
     def check_for_errors(self):
         """Check for any error messages on the page"""
         try:
@@ -210,16 +389,120 @@ class SimpleFrontendTester:
             self.driver.quit()
             print("🧹 Driver cleanup completed")
 
+
+def run_user_session(base_url: str, session: int, start_delay: float = 0.0) -> Dict[str, Any]:
+    """One simulated dashboard user in its own browser; runs in a worker process"""
+    time.sleep(start_delay)
+    result: Dict[str, Any] = {'session': session, 'success': False, 'steps': {}, 'error': None}
+    tester = None
+    # Interleaved progress lines from every browser are unreadable; only the summary is printed
+    with open(os.devnull, 'w') as quiet, contextlib.redirect_stdout(quiet):
+        try:
+            tester = SimpleFrontendTester(base_url)
+            result['success'] = (tester.test_application_load()
+                                 and tester.test_authentication_screen()
+                                 and tester.test_dashboard_features())
+            result['steps'] = dict(tester.step_timings)
+        except SystemExit:  # setup_driver exits when Chrome cannot start
+            result['error'] = "Chrome driver failed to start"
+        except Exception as e:
+            result['error'] = str(e) or type(e).__name__
+        finally:
+            if tester:
+                tester.cleanup()
+    return result
+
+
+def run_concurrent_sessions(base_url: str, users: int, processes: Optional[int] = None,
+                            ramp_seconds: float = 0.0) -> Dict[str, Any]:
+    """Run `users` browser sessions at once and aggregate per-step latency percentiles
+
+    Session starts are spread evenly over `ramp_seconds` (0 starts them all together).
+    """
+    processes = processes or users
+    print(f"🚀 Running {users} concurrent browser sessions ({processes} processes)")
+    print("=" * 50)
+    results = []
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=processes) as pool:
+        futures = [pool.submit(run_user_session, base_url, session, ramp_seconds * session / users)
+                   for session in range(users)]
+        for future in as_completed(futures):
+            result = future.result()
+            results.append(result)
+            status = "✅" if result['success'] else "❌"
+            print(f"{status} Session {result['session']} finished" +
+                  (f": {result['error']}" if result['error'] else ""))
+    wall_time = time.perf_counter() - start
+
+    histograms = {step: LatencyHistogram() for step in SESSION_STEPS}
+    for result in results:
+        for step, ms in result['steps'].items():
+            if ms is not None:
+                histograms.setdefault(step, LatencyHistogram()).record(ms / 1000)
+    passed = sum(1 for result in results if result['success'])
+
+    print("=" * 50)
+    print(f"📊 {passed}/{users} sessions passed in {wall_time:.1f}s")
+    print(f"{'Step':22} {'n':>5} {'p50':>9} {'p90':>9} {'p99':>9} {'max':>9}")
+    for step, histogram in histograms.items():
+        if histogram.count:
+            print(f"{step:22} {histogram.count:5} {histogram.percentile(50):9.1f} {histogram.percentile(90):9.1f} "
+                  f"{histogram.percentile(99):9.1f} {histogram.max_us / 1000:9.1f}")
+        else:
+            print(f"{step:22} {0:5} {'n/a':>9}")
+
+    return {
+        'timestamp': datetime.now().isoformat(),
+        'base_url': base_url,
+        'users': users,
+        'processes': processes,
+        'ramp_seconds': ramp_seconds,
+        'wall_time_s': wall_time,
+        'sessions_passed': passed,
+        'errors': [result['error'] for result in results if result['error']],
+        'steps': {step: histogram.to_dict() for step, histogram in histograms.items()},
+        'success': passed == users,
+    }
+
+
 def main():
     """Main test execution"""
-    base_url = sys.argv[1] if len(sys.argv) > 1 else "http://localhost:3001"
+    parser = argparse.ArgumentParser(description="AI Diligence Pro frontend tests")
+    parser.add_argument("base_url", nargs="?", default="http://localhost:3001")
+    parser.add_argument("--perf", action="store_true", help="Profile the user journey instead of the pass/fail tests")
+    parser.add_argument("--perf-json", help="Append the run's performance record to this JSON Lines file")
+    parser.add_argument("--release", help="Release label stored with the performance record")
+    parser.add_argument("--users", type=int, default=1,
+                        help="Run this many browser sessions at once and report per-step percentiles")
+    parser.add_argument("--processes", type=int, help="Worker processes for --users (default: one per user)")
+    parser.add_argument("--ramp-seconds", type=float, default=0.0,
+                        help="Spread the --users session starts over this many seconds")
+    args = parser.parse_args()
+    base_url = args.base_url
     
     print(f"Testing AI Diligence Pro Frontend at: {base_url}")
     
-    tester = SimpleFrontendTester(base_url)
+    if args.users > 1:
+        summary = run_concurrent_sessions(base_url, args.users, args.processes, args.ramp_seconds)
+        summary['release'] = args.release
+        if args.perf_json:
+            with open(args.perf_json, 'a') as f:
+                f.write(json.dumps(summary) + "\n")
+        sys.exit(0 if summary['success'] else 1)
+    
+    tester = SimpleFrontendTester(base_url, performance=args.perf)
     
     try:
-        success = tester.run_all_tests()
+        if args.perf:
+            record = tester.run_performance_profile()
+            record['release'] = args.release
+            if args.perf_json:
+                with open(args.perf_json, 'a') as f:
+                    f.write(json.dumps(record) + "\n")
+            success = record['success']
+        else:
+            success = tester.run_all_tests()
         exit_code = 0 if success else 1
     except Exception as e:
         print(f"❌ Test execution failed: {e}")
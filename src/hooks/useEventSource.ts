@@ -1,13 +1,20 @@
 import { useState, useEffect } from 'react';
 
-export const useEventSource = (url: string) => {
-  const [data, setData] = useState(null);
+type Reducer<T> = (state: T | null, message: any) => T;
+
+// Without a reducer the hook holds the latest message
+const latest = (_state: any, message: any) => message;
+
+export const useEventSource = <T = any>(url: string | null, reduce: Reducer<T> = latest) => {
+  const [data, setData] = useState<T | null>(null);
 
   useEffect(() => {
+    if (!url) return;
     const eventSource = new EventSource(url);
 
     eventSource.onmessage = (event) => {
-      setData(JSON.parse(event.data));
+      const message = JSON.parse(event.data);
+      setData((state) => reduce(state, message));
     };
 
     return () => {
@@ -16,4 +23,16 @@ export const useEventSource = (url: string) => {
   }, [url]);
 
   return data;
-};
\ No newline at end of file
+};
+
+export type QuoteMap = Record<string, Record<string, unknown>>;
+
+// Reducer for mcpRealTimeStream: snapshots replace a symbol's quote and
+// deltas (changed fields only) are merged into it.
+export const mergeQuoteEvents: Reducer<QuoteMap> = (state, message) => {
+  const quotes = state || {};
+  const { section, data } = message || {};
+  if (section === 'snapshot') return { ...quotes, [data.symbol]: data.quote };
+  if (section === 'delta') return { ...quotes, [data.symbol]: { ...quotes[data.symbol], ...data.quote } };
+  return quotes;
+};